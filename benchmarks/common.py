@@ -0,0 +1,253 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Synthetic environments to benchmark tracing on
+
+All fixtures are generated locally and deterministically, so the benchmarks
+neither need network access nor depend on what is installed on the machine.
+Generating the larger ones takes a while, so they are kept (by default under
+the temporary directory, or under $REPROMAN_BENCHMARKS_DIR) and reused by
+subsequent runs.
+"""
+
+import json
+import logging
+import os
+import os.path as op
+import subprocess
+import sys
+import tempfile
+
+from reproman.distributions.base import EnvironmentSpec
+from reproman.distributions.conda import CondaDistribution
+from reproman.distributions.conda import CondaEnvironment
+from reproman.distributions.conda import CondaPackage
+from reproman.distributions.debian import DebianDistribution
+from reproman.distributions.debian import DEBPackage
+from reproman.distributions.debian import DebTracer
+from reproman.distributions.vcs import GitDistribution
+from reproman.distributions.vcs import GitRepo
+
+# Number of files to trace
+SIZES = [1000, 10000, 100000]
+FILES_PER_PACKAGE = 100
+NREPOS = 10
+
+# Tracers complain about environments they fail to query fully (e.g., there
+# is no conda executable in the synthetic conda installation).
+logging.getLogger('reproman').setLevel(logging.ERROR)
+
+
+def _write(path, content=""):
+    dirname = op.dirname(path)
+    if not op.isdir(dirname):
+        os.makedirs(dirname)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _package_files(prefix, nfiles):
+    """Yield (package index, files) splitting `nfiles` files into packages
+    """
+    for ipkg, start in enumerate(range(0, nfiles, FILES_PER_PACKAGE)):
+        yield ipkg, ["%s/pkg%d/file%d" % (prefix, ipkg, i)
+                     for i in range(start,
+                                    min(start + FILES_PER_PACKAGE, nfiles))]
+
+
+def make_dpkg(path, final, nfiles):
+    """dpkg database (under admindir/) of packages owning `nfiles` files
+
+    The files themselves do not exist.
+    """
+    status = []
+    for ipkg, files in _package_files(op.join(final, "usr"), nfiles):
+        name = "pkg%d" % ipkg
+        status.append("Package: %s\nStatus: install ok installed\n"
+                      "Architecture: amd64\nVersion: 1.0-%d\n" % (name, ipkg))
+        _write(op.join(path, "admindir", "info", name + ".list"),
+               "\n".join(files) + "\n")
+    _write(op.join(path, "admindir", "status"), "\n".join(status))
+
+
+def make_conda(path, final, nfiles):
+    """conda installation with packages providing `nfiles` files
+
+    Only conda-meta/ is generated.
+    """
+    os.makedirs(op.join(path, "envs"))
+    for ipkg, files in _package_files(final, nfiles):
+        name = "pkg%d" % ipkg
+        _write(op.join(path, "conda-meta", "%s-1.0-0.json" % name),
+               json.dumps({
+                   "name": name,
+                   "version": "1.0",
+                   "build": "0",
+                   "schannel": "defaults",
+                   "channel": "https://repo.anaconda.com/pkgs/main/linux-64",
+                   "md5": "0" * 32,
+                   "size": 1024,
+                   "url": "https://repo.anaconda.com/pkgs/main/linux-64/"
+                          "%s-1.0-0.tar.bz2" % name,
+                   "files": [op.relpath(f, final) for f in files],
+               }))
+
+
+def make_venv(path, final, nfiles):
+    """virtualenv with pip packages providing `nfiles` files
+
+    Only the metadata pip records for installed packages is generated.
+    """
+    # ensurepip installs pip from the wheel shipped with Python.
+    subprocess.check_call([sys.executable, "-m", "venv", path])
+    # Scripts refer to the virtualenv by its path.
+    bindir = op.join(path, "bin")
+    for script in os.listdir(bindir):
+        script = op.join(bindir, script)
+        if op.islink(script):
+            continue
+        with open(script, "rb") as f:
+            content = f.read()
+        with open(script, "wb") as f:
+            f.write(content.replace(path.encode(), final.encode()))
+    for ipkg, files in _package_files("", nfiles):
+        name = "pkg%d" % ipkg
+        distinfo = op.join(_get_site_packages(path), "%s-1.0.dist-info" % name)
+        _write(op.join(distinfo, "METADATA"),
+               "Metadata-Version: 2.1\nName: %s\nVersion: 1.0\n" % name)
+        _write(op.join(distinfo, "INSTALLER"), "pip\n")
+        _write(op.join(distinfo, "RECORD"),
+               "".join("%s.py,,\n" % f.lstrip("/") for f in files))
+
+
+def make_git(path, final, nfiles):
+    """NREPOS git repositories with `nfiles` committed files in total
+    """
+    env = dict(os.environ,
+               GIT_AUTHOR_NAME="ReproMan",
+               GIT_AUTHOR_EMAIL="bench@example.com",
+               GIT_AUTHOR_DATE="2020-01-01T00:00:00 +0000",
+               GIT_COMMITTER_NAME="ReproMan",
+               GIT_COMMITTER_EMAIL="bench@example.com",
+               GIT_COMMITTER_DATE="2020-01-01T00:00:00 +0000")
+    for irepo in range(NREPOS):
+        repo = op.join(path, "repo%d" % irepo)
+        for _, files in _package_files(repo, nfiles // NREPOS):
+            for f in files:
+                _write(f, op.relpath(f, path))
+        subprocess.check_call(["git", "init", "-q", repo], env=env)
+        subprocess.check_call(["git", "add", "."], cwd=repo, env=env)
+        subprocess.check_call(["git", "commit", "-q", "-m", "Add files"],
+                              cwd=repo, env=env)
+
+
+FIXTURES = {
+    "dpkg": make_dpkg,
+    "conda": make_conda,
+    "venv": make_venv,
+    "git": make_git,
+}
+
+
+def _get_site_packages(venv):
+    [libdir] = [d for d in os.listdir(op.join(venv, "lib"))
+                if d.startswith("python")]
+    return op.join(venv, "lib", libdir, "site-packages")
+
+
+def get_fixture(kind, nfiles):
+    """Return path to the fixture `kind` for `nfiles`, generating it if needed
+    """
+    topdir = os.environ.get(
+        "REPROMAN_BENCHMARKS_DIR",
+        op.join(tempfile.gettempdir(), "reproman-benchmarks"))
+    path = op.join(topdir, "%s-%d" % (kind, nfiles))
+    if not op.exists(path):
+        if not op.isdir(topdir):
+            os.makedirs(topdir)
+        # Generate aside, so an interrupted run leaves no partial fixture.
+        # Fixtures embed the paths of their final location.
+        tmp = tempfile.mkdtemp(prefix=op.basename(path) + ".", dir=topdir)
+        FIXTURES[kind](tmp, path, nfiles)
+        os.rename(tmp, path)
+    return path
+
+
+def get_files(kind, nfiles):
+    """Return the files of the fixture `kind` for `nfiles` to trace
+    """
+    path = get_fixture(kind, nfiles)
+    if kind == "dpkg":
+        prefixes = [op.join(path, "usr")]
+    elif kind == "venv":
+        prefixes = [_get_site_packages(path)]
+    elif kind == "git":
+        prefixes = [op.join(path, "repo%d" % irepo)
+                    for irepo in range(NREPOS)]
+        nfiles //= NREPOS
+    else:
+        prefixes = [path]
+    suffix = ".py" if kind == "venv" else ""
+    return [f + suffix
+            for prefix in prefixes
+            for _, files in _package_files(prefix, nfiles)
+            for f in files]
+
+
+def get_deb_tracer_class(nfiles):
+    """Return DebTracer subclass operating on the synthetic dpkg database
+
+    It does not query apt for the details of the packages, so it does not
+    depend on the system either.
+    """
+    admindir = op.join(get_fixture("dpkg", nfiles), "admindir")
+
+    class SyntheticDebTracer(DebTracer):
+        DPKG_ADMINDIR = admindir
+        DPKG_DB_MIN_FILES = 0
+
+        def detect(self):
+            return "12.0"
+
+        def get_details_for_packages(self, packages):
+            return packages
+
+    return SyntheticDebTracer
+
+
+def make_spec(nfiles, version="1.0"):
+    """Return EnvironmentSpec with `nfiles` files across distributions
+    """
+    nper = nfiles // 3
+    return EnvironmentSpec(
+        distributions=[
+            DebianDistribution(
+                name="debian",
+                version="12.0",
+                packages=[
+                    DEBPackage(name="pkg%d" % ipkg, version=version,
+                               architecture="amd64", files=files)
+                    for ipkg, files in _package_files("/usr", nper)]),
+            CondaDistribution(
+                name="conda",
+                path="/opt/conda",
+                environments=[CondaEnvironment(
+                    name="root",
+                    path="/opt/conda",
+                    packages=[
+                        CondaPackage(name="pkg%d" % ipkg, version=version,
+                                     build="0", files=files)
+                        for ipkg, files in _package_files("lib", nper)])]),
+            GitDistribution(
+                name="git",
+                packages=[
+                    GitRepo(path="/src/repo%d" % ipkg,
+                            hexsha="%040d" % ipkg,
+                            files=files)
+                    for ipkg, files in _package_files("", nper)]),
+        ],
+        files=["/other/file%d" % i for i in range(nfiles - 3 * nper)])
@@ -0,0 +1,43 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks of handling specs"""
+
+import io
+import os
+import tempfile
+
+from reproman.formats.reproman import RepromanProvenance
+from reproman.interface.diff import Diff
+
+from .common import SIZES
+from .common import make_spec
+
+
+class TimeSpec(object):
+    params = SIZES
+    param_names = ["nfiles"]
+    timeout = 600
+
+    def setup(self, nfiles):
+        self.spec = make_spec(nfiles)
+        self.other_spec = make_spec(nfiles, version="2.0")
+        fd, self.spec_file = tempfile.mkstemp(suffix=".yml")
+        with os.fdopen(fd, "w") as f:
+            RepromanProvenance.write(f, self.spec)
+
+    def teardown(self, nfiles):
+        os.unlink(self.spec_file)
+
+    def time_write(self, nfiles):
+        RepromanProvenance.write(io.StringIO(), self.spec)
+
+    def time_load(self, nfiles):
+        RepromanProvenance(self.spec_file).get_environment()
+
+    def time_diff(self, nfiles):
+        Diff.diff(self.spec, self.other_spec)
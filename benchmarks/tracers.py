@@ -0,0 +1,84 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks of assigning files to packages, within a local session"""
+
+from reproman.distributions.conda import CondaTracer
+from reproman.distributions.vcs import VCSTracer
+from reproman.distributions.venv import VenvTracer
+from reproman.interface.retrace import identify_distributions
+from reproman.resource.shell import ShellSession
+
+from .common import SIZES
+from .common import get_deb_tracer_class
+from .common import get_files
+
+
+class _TracerBenchmark(object):
+    params = SIZES
+    param_names = ["nfiles"]
+    timeout = 1800
+    kind = None
+
+    def setup(self, nfiles):
+        self.files = get_files(self.kind, nfiles)
+        self.session = ShellSession()
+
+    def _identify(self, tracer):
+        return list(tracer.identify_distributions(set(self.files)))
+
+
+class TimeDebTracer(_TracerBenchmark):
+    kind = "dpkg"
+
+    def setup(self, nfiles):
+        super(TimeDebTracer, self).setup(nfiles)
+        self.tracer_class = get_deb_tracer_class(nfiles)
+
+    def time_identify_distributions(self, nfiles):
+        self._identify(self.tracer_class(session=self.session))
+
+
+class TimeCondaTracer(_TracerBenchmark):
+    kind = "conda"
+
+    def time_identify_distributions(self, nfiles):
+        self._identify(CondaTracer(session=self.session))
+
+
+class TimeVenvTracer(_TracerBenchmark):
+    kind = "venv"
+
+    def time_identify_distributions(self, nfiles):
+        self._identify(VenvTracer(session=self.session))
+
+
+class TimeVCSTracer(_TracerBenchmark):
+    kind = "git"
+
+    def time_identify_distributions(self, nfiles):
+        self._identify(VCSTracer(session=self.session))
+
+
+class TimeIdentifyDistributions(object):
+    """All tracers over files of all the synthetic environments"""
+
+    params = SIZES
+    param_names = ["nfiles"]
+    timeout = 3600
+
+    def setup(self, nfiles):
+        # Every environment contributes a quarter of the files.
+        self.files = [f for kind in ("dpkg", "conda", "venv", "git")
+                      for f in get_files(kind, nfiles // 4)]
+        self.tracer_classes = [get_deb_tracer_class(nfiles // 4),
+                               CondaTracer, VenvTracer, VCSTracer]
+        self.session = ShellSession()
+
+    def time_identify_distributions(self, nfiles):
+        identify_distributions(self.files, session=self.session,
+                               tracer_classes=self.tracer_classes)
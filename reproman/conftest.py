@@ -10,6 +10,10 @@
 
 # Some commonly used fixtures
 
+from functools import partial
+from unittest.mock import patch
+
+from reproman.distributions.index_cache import IndexCache
 from reproman.formats.tests.fixtures import demo1_spec, reprozip_spec2
 from reproman.tests.fixtures import resource_manager_fixture
 
@@ -41,3 +45,14 @@ def pytest_collection_modifyitems(config, items):
 # any resources and don't plan on modifying the on-disk inventory. If you do
 # need to modify the resources, use `resource_manager_fixture` directly.
 resman = resource_manager_fixture(resources={}, scope="session")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def index_cache_dir(tmp_path_factory):
+    """Keep the package indexes cached by `retrace` out of the user cache
+    directory.
+    """
+    path = str(tmp_path_factory.mktemp("index-cache"))
+    with patch("reproman.interface.retrace.IndexCache",
+               partial(IndexCache, path=path)):
+        yield path
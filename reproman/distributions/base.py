@@ -299,6 +299,9 @@ _register_with_representer(EnvironmentSpec)
 # Note: The following was derived from ReproZip's PkgManager class
 # (Revised BSD License)
 
+_NOT_DETECTED = object()
+
+
 class DistributionTracer(object, metaclass=abc.ABCMeta):
     """Base class for package trackers.
 
@@ -311,11 +314,17 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
     # Default to being able to handle directories
     HANDLES_DIRS = True
 
-    def __init__(self, session=None):
+    def __init__(self, session=None, index_cache=None):
         # will be (re)used to run external commands, and let's hardcode LC_ALL
         # codepage just in case since we might want to comprehend error
         # messages
         self._session = session or get_local_session()
+        self._detected = _NOT_DETECTED
+        # IndexCache to persist indexes of environments in, if any
+        self._index_cache = index_cache
+        # file -> packagefields to assign files to without querying the
+        # session, see get_reusable_packagefields
+        self.reused_packagefields = {}
         # to ease _init within derived classes which should not be parametrized
         # more anyways
         self._init()
@@ -323,6 +332,91 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
     def _init(self):
         pass
 
+    def _lookup_index(self, kind, location, paths):
+        """Return IndexCacheEntry for the index of an environment, if any
+
+        See `IndexCache.lookup` for the parameters.  `paths` might also be a
+        callable returning them, to avoid figuring them out unless an index
+        cache is used.
+        """
+        if self._index_cache is None:
+            return None
+        if callable(paths):
+            paths = paths()
+        return self._index_cache.lookup(self._session, kind, location, paths)
+
+    def _get_cached_index(self, kind, location, paths, build):
+        """Return index of an environment, reusing a persisted one if current
+
+        Parameters
+        ----------
+        kind, location, paths
+            See `IndexCache.lookup`.
+        build : callable
+            Returns the index, serializable to JSON, when it cannot be reused.
+            An empty index is not persisted, since it likely results from a
+            failure to query the environment.
+        """
+        entry = self._lookup_index(kind, location, paths)
+        index = entry.load() if entry else None
+        if index is not None:
+            lgr.debug("Reusing %s index of %s", kind, location)
+            return index
+        index = build()
+        if entry and index:
+            entry.save(index)
+        return index
+
+    def get_reusable_packagefields(self, distributions):
+        """Return package assignments of previously traced files still valid
+
+        Tracers which identify packages via `identify_packages_from_files`
+        can verify that packages of previously identified `distributions`
+        (e.g., of an earlier retrace) are still installed at the same
+        version.  Files of those packages need not be queried again, if
+        the result is assigned to `reused_packagefields`.
+
+        Parameters
+        ----------
+        distributions : list of Distribution
+            Distributions of any kind, the tracer picks its own ones.
+
+        Returns
+        -------
+        dict
+            Maps files to fields as returned by `_get_packagefields_for_files`.
+            Empty, unless the tracer can verify its packages.
+        """
+        return {}
+
+    def detect(self):
+        """Probe the environment of the session for this tracer's applicability
+
+        Tracers which can only handle specific environments (e.g., a Debian
+        system or a running Docker daemon) should override this method, so
+        their probes run only once per retrace and concurrently with probes
+        of other tracers.
+
+        Returns
+        -------
+        object
+            Details about the detected environment (e.g., the release of the
+            distribution) evaluating to True, or None if the tracer does not
+            apply.
+        """
+        return True
+
+    @property
+    def detected(self):
+        """Memoized result of `detect`, which can also be assigned to"""
+        if self._detected is _NOT_DETECTED:
+            self._detected = self.detect()
+        return self._detected
+
+    @detected.setter
+    def detected(self, value):
+        self._detected = value
+
     @abc.abstractmethod
     def identify_distributions(self, files):
         return
@@ -370,7 +464,18 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
 
         # TODO: probably that _get_packagefields should create packagespecs
         # internally and just return them.  But we should make them hashable
-        file_to_package_dict = self._get_packagefields_for_files(files)
+        reused = self.reused_packagefields
+        to_query = [f for f in files if f not in reused]
+        file_to_package_dict = \
+            self._get_packagefields_for_files(to_query) if to_query else {}
+        if len(to_query) < len(files):
+            lgr.debug("%s: reusing package assignments of %d files",
+                      self.__class__.__name__, len(files) - len(to_query))
+            file_to_package_dict.update(
+                (f, reused[f]) for f in files if f in reused)
+        packaged_files = [f for f in files
+                          if file_to_package_dict.get(f) is not None]
+        dirs = self._session.isdir_many(packaged_files)
         for f in files:
             # Stores the file
             if f not in file_to_package_dict:
@@ -393,7 +498,7 @@ class DistributionTracer(object, metaclass=abc.ABCMeta):
                         if pkg:
                             found_packages[pkgfields_hashable] = pkg
                             # we store only non-directories within 'files'
-                            if not self._session.isdir(f):
+                            if not dirs.get(f):
                                 pkg.files.append(f_pkg)
                             nb_pkg_files += 1
                         else:
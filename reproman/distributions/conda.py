@@ -277,12 +277,24 @@ class CondaDistribution(Distribution):
         return yaml.safe_dump(d, default_flow_style=False)
 
 
+_CONDA_META_MARKER = "@@@ "
+# Print each conda-meta/*.json of the environment given as the only
+# argument, preceded by a marker line with its name
+_CONDA_META_DUMP_SCRIPT = """\
+for f in "$1"/conda-meta/*.json; do
+    [ -f "$f" ] || continue
+    echo; echo "%s$f"; cat "$f"
+done
+""" % _CONDA_META_MARKER
+
+
 class CondaTracer(DistributionTracer):
     """conda distributions tracer
     """
 
     def _init(self):
-        self._get_conda_env_path = PathRoot(self._is_conda_env_path)
+        self._get_conda_env_path = PathRoot(self._is_conda_env_path,
+                                            self._are_conda_env_paths)
         self._get_conda_dist_path = PathRoot(self._is_conda_dist_path)
 
     def _get_packagefields_for_files(self, files):
@@ -292,28 +304,35 @@ class CondaTracer(DistributionTracer):
         raise NotImplementedError("TODO")
 
     def _get_conda_meta_files(self, conda_path):
+        """Yield (filename, content) of all JSON files in conda-meta/
+
+        All of them are fetched with a single command.
+        """
         try:
             out, _ = self._session.execute_command(
-                'ls %s/conda-meta/*.json'
-                % conda_path
-            )
-            return iter(out.splitlines())
+                ['sh', '-c', _CONDA_META_DUMP_SCRIPT, 'sh', conda_path])
         except Exception as exc:  # Empty conda environment (unusual situation)
             lgr.warning("Could not retrieve conda-meta files in path %s: %s",
                         conda_path, exc_str(exc))
-            return iter(())
+            return
+        # JSON strings cannot span lines, so the marker lines are unambiguous.
+        meta_file, lines = None, []
+        for line in out.splitlines():
+            if line.startswith(_CONDA_META_MARKER):
+                if meta_file:
+                    yield meta_file, "\n".join(lines)
+                meta_file, lines = line[len(_CONDA_META_MARKER):], []
+            else:
+                lines.append(line)
+        if meta_file:
+            yield meta_file, "\n".join(lines)
 
     def _get_conda_package_details(self, conda_path):
         packages = {}
         file_to_package_map = {}
-        for meta_file in self._get_conda_meta_files(conda_path):
+        for meta_file, content in self._get_conda_meta_files(conda_path):
             try:
-                out, err = self._session.execute_command(
-                    'cat %s' % meta_file
-                )
-                details = json.loads(out)
-#                print meta_file
-#                print(json.dumps(details, indent=4))
+                details = json.loads(content)
                 if "name" in details:
                     lgr.debug("Found conda package %s", details["name"])
                     # Packages are recorded in the conda environment as
@@ -321,15 +340,19 @@ class CondaTracer(DistributionTracer):
                     conda_package_name = \
                         ("%s=%s=%s" % (details["name"], details["version"],
                                        details["build"]))
+                    # The file lists are by far the largest part, and they
+                    # are not needed once mapped.
+                    files = details.pop("files", [])
+                    details.pop("paths_data", None)
                     packages[conda_package_name] = details
                     # Now map the package files to the package
-                    for f in details["files"]:
+                    for f in files:
                         full_path = os.path.normpath(
                             os.path.join(conda_path, f))
                         file_to_package_map[full_path] = conda_package_name
             except Exception as exc:
-                lgr.warning("Could not retrieve conda info in path %s: %s",
-                            conda_path,
+                lgr.warning("Could not retrieve conda info from %s: %s",
+                            meta_file,
                             exc_str(exc))
 
         return packages, file_to_package_map
@@ -364,6 +387,32 @@ class CondaTracer(DistributionTracer):
             entry["installer"] = "pip"
         return packages, file_to_package_map
 
+    def _get_conda_env_index(self, root_path, conda_path):
+        """Return details and file map of the conda and pip packages of an env
+
+        The index is reused from the index cache, if any, while neither
+        conda-meta/ nor site-packages/ of the environment change.
+        """
+        def build():
+            env_export = self._get_conda_env_export(root_path, conda_path)
+            packages, file_to_pkg = \
+                self._get_conda_package_details(conda_path)
+            pip_packages, file_to_pip_pkg = \
+                self._get_conda_pip_package_details(env_export, conda_path)
+            # Join our conda and pip packages
+            packages.update(pip_packages)
+            file_to_pkg.update(file_to_pip_pkg)
+            return {"packages": packages, "files": file_to_pkg}
+
+        index = self._get_cached_index(
+            "conda", conda_path,
+            lambda: ([conda_path + "/conda-meta",
+                      conda_path + "/conda-meta/history"]
+                     + piputils.get_site_packages_dirs(self._session,
+                                                       conda_path)),
+            build)
+        return index["packages"], index["files"]
+
     def _get_conda_env_export(self, root_prefix, conda_path):
         export = {}
         try:
@@ -402,6 +451,11 @@ class CondaTracer(DistributionTracer):
     def _is_conda_env_path(self, path):
         return self._session.exists('%s/conda-meta' % path)
 
+    def _are_conda_env_paths(self, paths):
+        exists = self._session.exists_many(
+            '%s/conda-meta' % path for path in paths)
+        return {path: exists['%s/conda-meta' % path] for path in paths}
+
     def _is_conda_dist_path(self, path):
         return (self._session.exists(path + "/envs")
                 and self._is_conda_env_path(path))
@@ -416,6 +470,7 @@ class CondaTracer(DistributionTracer):
         total_file_count = len(unknown_files)
 
         # First, loop through all the files and identify conda paths
+        self._get_conda_env_path.prime(paths)
         for path in paths:
             conda_path = self._get_conda_env_path(path)
             if conda_path:
@@ -438,15 +493,8 @@ class CondaTracer(DistributionTracer):
                             % conda_path)
                 continue
             # Retrieve the environment details
-            env_export = self._get_conda_env_export(
-               root_path, conda_path)
             (conda_package_details, file_to_pkg) = \
-                self._get_conda_package_details(conda_path)
-            (conda_pip_package_details, file_to_pip_pkg) = \
-                self._get_conda_pip_package_details(env_export, conda_path)
-            # Join our conda and pip packages
-            conda_package_details.update(conda_pip_package_details)
-            file_to_pkg.update(file_to_pip_pkg)
+                self._get_conda_env_index(root_path, conda_path)
 
             # Initialize a map from packages to files that defaults to []
             pkg_to_found_files = defaultdict(list)
@@ -535,7 +583,10 @@ class CondaTracer(DistributionTracer):
         # Loop through conda_roots and create the distributions
         for idx, root_path in enumerate(conda_roots):
             # Retrieve distribution details
-            conda_info = self._get_conda_info(root_path)
+            conda_info = self._get_cached_index(
+                "conda-info", root_path,
+                [root_path + "/conda-meta", root_path + "/conda-meta/history"],
+                lambda: self._get_conda_info(root_path))
 
             # Give the distribution a name
             if (len(conda_roots)) > 1:
@@ -28,7 +28,8 @@ import logging
 from reproman.support.distributions.debian import \
     parse_apt_cache_show_pkgs_output, parse_apt_cache_policy_pkgs_output, \
     parse_apt_cache_policy_source_info, get_apt_release_file_names, \
-    get_spec_from_release_file, parse_dpkgquery_line
+    get_spec_from_release_file, parse_dpkgquery_line, parse_dpkg_db_dump, \
+    DPKG_DB_DUMP_SCRIPT, DpkgDatabase
 
 # Pick a conservative max command-line
 from reproman.utils import get_cmd_batch_len, execute_command_batch, \
@@ -38,6 +39,8 @@ from reproman.distributions.base import DistributionTracer
 
 lgr = logging.getLogger('reproman.distributions.debian')
 
+from ..dochelpers import borrowdoc
+from ..dochelpers import exc_str
 from ..dochelpers import single_or_plural
 from .base import SpecObject
 from .base import Package
@@ -282,6 +285,10 @@ class DebianDistribution(Distribution):
 _register_with_representer(DebianDistribution)
 
 
+def _owner_sort_key(owner):
+    return owner["name"], owner.get("architecture", "")
+
+
 class DebTracer(DistributionTracer):
     """.deb-based (and using apt and dpkg) systems package tracer
     """
@@ -289,6 +296,12 @@ class DebTracer(DistributionTracer):
     # The Debian tracer is not designed to handle directories
     HANDLES_DIRS = False
 
+    # Location of the dpkg database
+    DPKG_ADMINDIR = "/var/lib/dpkg"
+    # Starting from this number of files, read the whole dpkg database once
+    # instead of querying dpkg-query for the files in batches
+    DPKG_DB_MIN_FILES = 1000
+
     # TODO: (Low Priority) handle cases from dpkg-divert
     def _init(self):
         # TODO: we might want a generic helper for collections of things
@@ -297,11 +310,10 @@ class DebTracer(DistributionTracer):
         self._apt_source_names = set()
         self._all_apt_sources = {}
         self._source_line_to_name_map = {}
+        self._dpkg_db = None  # DpkgDatabase, if loaded
 
-    def identify_distributions(self, files):
-        if not files:
-            return
-        
+    @borrowdoc(DistributionTracer)
+    def detect(self):
         try:
             debian_version = self._session.read('/etc/debian_version').strip()
             self._session.exists('/etc/os-release')
@@ -314,6 +326,15 @@ class DebTracer(DistributionTracer):
             _, _ = self._session.execute_command('ls -ld /etc/apt')
         except CommandError as exc:
             lgr.debug("Did not detect Debian (or derivative): %s", exc)
+            return None
+        return debian_version
+
+    def identify_distributions(self, files):
+        if not files:
+            return
+
+        debian_version = self.detected
+        if not debian_version:
             return
 
         packages, remaining_files = self.identify_packages_from_files(files)
@@ -339,7 +360,102 @@ class DebTracer(DistributionTracer):
         #   of origins etc
         yield dist, remaining_files
 
+    def _lookup_dpkg_db_index(self):
+        admindir = self.DPKG_ADMINDIR
+        return self._lookup_index(
+            "dpkg", admindir,
+            [admindir + "/status", admindir + "/diversions",
+             admindir + "/info"])
+
+    def _load_dpkg_db(self, require_cache=False):
+        """Read the dpkg database of the session at once
+
+        Parameters
+        ----------
+        require_cache : bool, optional
+            Do not read the database unless it can be reused from or persisted
+            in the index cache.
+
+        Returns
+        -------
+        DpkgDatabase or None
+            None if the database could not be read.
+        """
+        if self._dpkg_db is not None:
+            return self._dpkg_db
+        entry = self._lookup_dpkg_db_index()
+        index = entry.load() if entry else None
+        if index is not None:
+            lgr.debug("Reusing dpkg database index")
+            self._dpkg_db = DpkgDatabase.from_json(index)
+        elif require_cache and not entry:
+            return None
+        else:
+            try:
+                out, _ = self._session.execute_command(
+                    ['sh', '-c', DPKG_DB_DUMP_SCRIPT, 'sh',
+                     self.DPKG_ADMINDIR])
+                self._dpkg_db = parse_dpkg_db_dump(utils.to_unicode(out))
+            except (CommandError, ValueError) as exc:
+                lgr.debug("Could not read the dpkg database, "
+                          "will use dpkg-query: %s", exc_str(exc))
+                return None
+            if entry:
+                entry.save(self._dpkg_db.to_json())
+        lgr.debug("Read dpkg database with %d installed packages "
+                  "and %d paths",
+                  len(self._dpkg_db.packages),
+                  len(self._dpkg_db.owners))
+        return self._dpkg_db
+
     def _get_packagefields_for_files(self, files):
+        # Even a persisted database is not worth loading for a few files,
+        # unless it has already been loaded.
+        if len(files) >= self.DPKG_DB_MIN_FILES:
+            db = self._load_dpkg_db()
+        else:
+            db = self._dpkg_db
+        if db is not None:
+            return self._get_packagefields_from_db(files, db)
+        return self._query_packagefields_for_files(files)
+
+    def _get_packagefields_from_db(self, files, db):
+        file_to_package_dict = {}
+        # Leave diverted files to dpkg-query, which knows how to report them
+        diverted = []
+        shared = []
+        for f in files:
+            if f in db.diversions:
+                diverted.append(f)
+                continue
+            owners = db.owners.get(f)
+            if not owners:
+                continue
+            if len(owners) > 1:
+                shared.append(f)
+                # Pick the owner independently of the order of the .list
+                # files in the dump
+                owners = sorted(owners, key=_owner_sort_key)
+            file_to_package_dict[f] = dict(owners[0])
+        # Mimic dpkg-query: paths shared by multiple packages are expected
+        # only for directories
+        for f, isdir in self._session.isdir_many(shared).items():
+            if isdir:
+                del file_to_package_dict[f]
+            else:
+                # E.g. files shared by Multi-Arch: same packages
+                lgr.debug("%s is shared by multiple packages (%s)", f,
+                          ", ".join(o["name"] for o in
+                                    sorted(db.owners[f],
+                                           key=_owner_sort_key)))
+        if diverted:
+            file_to_package_dict.update(
+                self._query_packagefields_for_files(diverted))
+        lgr.debug("Identified %d out of %d files using the dpkg database",
+                  len(file_to_package_dict), len(files))
+        return file_to_package_dict
+
+    def _query_packagefields_for_files(self, files):
         # Call dpkg query in batches
         exec_gen = execute_command_batch(
             self._session, ['dpkg-query', '-S'], files,
@@ -371,6 +487,81 @@ class DebTracer(DistributionTracer):
                 file_to_package_dict[found_name] = pkg
         return file_to_package_dict
 
+    @borrowdoc(DistributionTracer)
+    def get_reusable_packagefields(self, distributions):
+        packages = [p for d in distributions
+                    if isinstance(d, DebianDistribution)
+                    for p in d.packages if p.files]
+        if not packages:
+            return {}
+        installed = self._get_installed_packages({p.name for p in packages})
+        file_to_package_dict = {}
+        nreused = 0
+        for p in packages:
+            pkgfields, version = installed.get((p.name, p.architecture),
+                                               (None, None))
+            if version is None or version != p.version:
+                lgr.debug("Package %s:%s changed from version %s to %s",
+                          p.name, p.architecture, p.version, version)
+                continue
+            nreused += 1
+            for f in p.files:
+                file_to_package_dict[f] = pkgfields
+        lgr.debug("%d out of %d packages are still installed",
+                  nreused, len(packages))
+        return file_to_package_dict
+
+    def _get_installed_packages(self, names):
+        """Find installed instances of packages
+
+        Parameters
+        ----------
+        names : collection of str
+            Package names (without architecture)
+
+        Returns
+        -------
+        dict
+            (name, architecture) -> (packagefields, version), where the
+            packagefields are as reported by dpkg-query, i.e. with the
+            architecture only for "Multi-Arch: same" packages.
+        """
+        db = self._load_dpkg_db(require_cache=True)
+        if db is not None:
+            # Every record is available under "name:arch" as well.  Owners
+            # are qualified with the architecture if their file list is.
+            records = [(r["package"], r.get("architecture"),
+                        "same" if "%s.list" % key in db.list_mtimes
+                        else r.get("multi-arch"),
+                        r.get("version"), "ii")
+                       for key, r in db.packages.items()
+                       if r["package"] in names and (
+                           ":" in key or "architecture" not in r)]
+        else:
+            records = []
+            exec_gen = execute_command_batch(
+                self._session,
+                ['dpkg-query', '-W', '-f=${Package}\\t${Architecture}\\t'
+                 '${Multi-Arch}\\t${Version}\\t${db:Status-Abbrev}\\n'],
+                sorted(names),
+                cmd_err_filter('no packages found matching'))
+            for (out, _, exc) in exec_gen:
+                if exc:
+                    out = exc.stdout  # Some package is gone, so continue
+                for line in out.splitlines():
+                    fields = line.split('\t')
+                    if len(fields) == 5:
+                        records.append(fields)
+        installed = {}
+        for name, arch, multi_arch, version, status in records:
+            if not status.startswith("ii"):
+                continue
+            pkgfields = {"name": name}
+            if multi_arch == "same":
+                pkgfields["architecture"] = arch
+            installed[(name, arch)] = (pkgfields, version)
+        return installed
+
     def _get_apt_source_name(self, src):
         # Create a unique name for the origin
         name_fmt = "apt_%s_%s_%s_%%d" % (src.origin or "", src.archive or "",
@@ -451,17 +642,21 @@ class DebTracer(DistributionTracer):
         queries = [(p["name"] if not p["architecture"]
                     else "%(name)s:%(architecture)s" % p)
                    for p in pkg_dicts]
-        # Call "dpkg -s" in batches
-        exec_gen = execute_command_batch(self._session, ['dpkg', '-s'],
-                                         queries)
-        # Parse and accumulate "dpkg -s" results
-        # dpkg -s uses the same output as apt-cache show pkg
-        results = (parse_apt_cache_show_pkgs_output(out)
-                   for (out, _, _) in exec_gen)
-        # Combine sequence of lists
-        results = itertools.chain.from_iterable(results)
-        # Turn dpkg -s results into a lookup table by package name
-        results = self.create_lookup_from_apt_cache_show(results)
+        if self._dpkg_db is not None:
+            # The status file holds the same records "dpkg -s" shows.
+            results = self._dpkg_db.packages
+        else:
+            # Call "dpkg -s" in batches
+            exec_gen = execute_command_batch(self._session, ['dpkg', '-s'],
+                                             queries)
+            # Parse and accumulate "dpkg -s" results
+            # dpkg -s uses the same output as apt-cache show pkg
+            results = (parse_apt_cache_show_pkgs_output(out)
+                       for (out, _, _) in exec_gen)
+            # Combine sequence of lists
+            results = itertools.chain.from_iterable(results)
+            # Turn dpkg -s results into a lookup table by package name
+            results = self.create_lookup_from_apt_cache_show(results)
         # Loop through each package and find the respective dpkg results
         for p in pkg_dicts:
             r = results.get(p["name"] if not p["architecture"]
@@ -510,6 +705,15 @@ class DebTracer(DistributionTracer):
                     p[f] = r[f]
 
     def _get_pkgs_install_date(self, pkg_dicts):
+        if self._dpkg_db is not None:
+            for p in pkg_dicts:
+                mtime = self._dpkg_db.get_list_mtime(p["name"],
+                                                     p["architecture"])
+                if mtime is not None:
+                    p["install_date"] = str(
+                        pytz.utc.localize(
+                            datetime.utcfromtimestamp(int(mtime))))
+            return
         # Convert package names to dpkg list filenames
         queries = [self._pkg_name_to_dpkg_list_file(p["name"])
                    for p in pkg_dicts]
@@ -527,7 +731,7 @@ class DebTracer(DistributionTracer):
                 (fname, ftime) = outlines.split(": ")
                 results[fname] = str(
                     pytz.utc.localize(
-                        datetime.utcfromtimestamp(float(ftime))))
+                        datetime.utcfromtimestamp(int(float(ftime)))))
 
         # Now lookup the packages in the results
         for p in pkg_dicts:
@@ -535,9 +739,8 @@ class DebTracer(DistributionTracer):
             if fname in results:
                 p["install_date"] = results[fname]
 
-    @staticmethod
-    def _pkg_name_to_dpkg_list_file(name):
-        query = "/var/lib/dpkg/info/" + name + ".list"
+    def _pkg_name_to_dpkg_list_file(self, name):
+        query = self.DPKG_ADMINDIR + "/info/" + name + ".list"
         return query
 
     def _get_pkgs_versions_and_sources(self, pkg_dicts):
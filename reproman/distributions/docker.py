@@ -110,13 +110,17 @@ class DockerTracer(DistributionTracer):
 
     HANDLES_DIRS = False
 
+    @borrowdoc(DistributionTracer)
+    def detect(self):
+        # Punt if Docker daemon to found
+        return self._session.execute_command('ps -e')[0].find('dockerd') != -1
+
     @borrowdoc(DistributionTracer)
     def identify_distributions(self, files):
         if not files:
             return
 
-        # Punt if Docker daemon to found
-        if self._session.execute_command('ps -e')[0].find('dockerd') == -1:
+        if not self.detected:
             return
 
         images = []
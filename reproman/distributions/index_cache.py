@@ -0,0 +1,139 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Persistent cache of the package indexes built by tracers.
+
+To assign files to packages, tracers first build an index of an environment
+(e.g., which package every path of a conda environment belongs to) out of its
+package database.  Reading that database takes a number of commands, which
+for the same environment would return the same results until a package is
+installed or removed.  `IndexCache` keeps the indexes on disk along with a
+fingerprint (sizes and modification times of a few files changing along with
+the package database), so the next trace of an unchanged environment can
+reuse them.
+"""
+
+import hashlib
+import json
+import os
+import os.path as op
+import tempfile
+
+import attr
+
+from reproman import cfg
+from reproman.dochelpers import exc_str
+from reproman.support.exceptions import CommandError
+from reproman.utils import attrib
+
+import logging
+lgr = logging.getLogger('reproman.distributions.index_cache')
+
+
+def _hexdigest(obj):
+    return hashlib.sha256(
+        json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+@attr.s
+class IndexCacheEntry(object):
+    """Persisted index of a single environment.
+    """
+    filename = attrib(default=attr.NOTHING)
+    fingerprint = attrib(default=attr.NOTHING)
+
+    def load(self):
+        """Return the persisted index, or None if missing or outdated.
+        """
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as exc:
+            if op.lexists(self.filename):
+                lgr.debug("Ignoring unreadable index %s: %s",
+                          self.filename, exc_str(exc))
+            return None
+        if data.get("fingerprint") != self.fingerprint:
+            lgr.debug("Index %s is outdated", self.filename)
+            return None
+        return data.get("index")
+
+    def save(self, index):
+        """Persist `index`, which must be serializable to JSON.
+        """
+        dirname = op.dirname(self.filename)
+        try:
+            if not op.isdir(dirname):
+                os.makedirs(dirname)
+            # Write to a temporary file first, so concurrent traces never
+            # see a partially written index.
+            fd, tmpname = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"fingerprint": self.fingerprint,
+                               "index": index}, f)
+                os.replace(tmpname, self.filename)
+            except BaseException:
+                os.unlink(tmpname)
+                raise
+        except (OSError, TypeError, ValueError) as exc:
+            lgr.warning("Failed to save index %s: %s",
+                        self.filename, exc_str(exc))
+
+
+class IndexCache(object):
+    """On-disk cache of package indexes, keyed by a fingerprint.
+
+    Parameters
+    ----------
+    path : str, optional
+        Directory to keep the indexes in.  Defaults to "indexes" under the
+        user cache directory.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = op.join(cfg.dirs.user_cache_dir, "indexes")
+        self.path = path
+
+    def lookup(self, session, kind, location, paths):
+        """Return the entry for the index of an environment.
+
+        Parameters
+        ----------
+        session : Session
+        kind : str
+            Kind of the index, e.g. "conda".
+        location : str
+            Location of the environment within the session.
+        paths : list of str
+            Paths within the session whose size or modification time changes
+            whenever the index would.
+
+        Returns
+        -------
+        IndexCacheEntry or None
+            None if the index cannot be persisted, e.g., because the session
+            has no identity.
+        """
+        identity = session.identity
+        if identity is None:
+            return None
+        try:
+            stats = session.stat_many(paths)
+        except (CommandError, NotImplementedError) as exc:
+            lgr.debug("Could not fingerprint %s index of %s: %s",
+                      kind, location, exc_str(exc))
+            return None
+        state = [
+            [path, None if stats.get(path) is None
+             else [stats[path].size, stats[path].mtime]]
+            for path in sorted(paths)]
+        return IndexCacheEntry(
+            filename=op.join(self.path, kind,
+                             _hexdigest([identity, location]) + ".json"),
+            fingerprint=_hexdigest([identity, kind, location, state]))
@@ -12,6 +12,7 @@ import json
 import os
 import re
 
+from reproman.support.exceptions import CommandError
 from reproman.utils import execute_command_batch
 
 
@@ -152,3 +153,25 @@ def get_package_details(session, which_pip, packages=None,
     for pkg in details:
         details[pkg]["editable"] = pkg in editable_packages
     return details, file_to_pkg
+
+
+def get_site_packages_dirs(session, prefix):
+    """Return site-packages directories of the Pythons installed in `prefix`.
+
+    Parameters
+    ----------
+    session : Session instance
+    prefix : str
+        Installation prefix, e.g. a virtualenv or a conda environment.
+
+    Returns
+    -------
+    A list of paths, empty if `prefix` has no lib/ directory.
+    """
+    libdir = prefix + "/lib"
+    try:
+        names = session.listdir(libdir)
+    except CommandError:
+        return []
+    return sorted("{}/{}/site-packages".format(libdir, name)
+                  for name in names if name.startswith("python"))
@@ -11,9 +11,12 @@ import attr
 
 import datetime
 import logging
+import os.path as op
 import re
 
 from reproman.distributions.base import DistributionTracer
+from reproman.dochelpers import borrowdoc
+from reproman.dochelpers import exc_str
 
 lgr = logging.getLogger('reproman.distributions.redhat')
 
@@ -24,6 +27,7 @@ from .base import TypedList
 from .base import _register_with_representer
 from ..support.exceptions import CommandError
 from ..utils import attrib
+from ..utils import execute_command_batch
 
 
 @attr.s(cmp=True)
@@ -71,6 +75,75 @@ class RPMPackage(Package):
 _register_with_representer(RPMPackage)
 
 
+_RPM_PKGID_FORMAT = '%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}'
+
+# RPMPackage fields as labeled in "rpm -qi" output, and the query tags
+# "rpm -qi" uses to render them
+_RPM_PACKAGE_TAGS = [
+    ('pkgid', _RPM_PKGID_FORMAT),
+    ('name', '%{NAME}'),
+    ('version', '%{VERSION}'),
+    ('release', '%{RELEASE}'),
+    ('architecture', '%{ARCH}'),
+    ('install_date', '%{INSTALLTIME:date}'),
+    ('group', '%{GROUP}'),
+    ('size', '%{SIZE}'),
+    ('license', '%{LICENSE}'),
+    ('signature', '%|DSAHEADER?{%{DSAHEADER:pgpsig}}:'
+                  '{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{(none)}|}|'),
+    ('source_rpm', '%{SOURCERPM}'),
+    ('build_date', '%{BUILDTIME:date}'),
+    ('build_host', '%{BUILDHOST}'),
+    ('packager', '%{PACKAGER}'),
+    ('vendor', '%{VENDOR}'),
+    ('url', '%{URL}'),
+]
+_RPM_PACKAGE_FORMAT = '\\t'.join(tag for _, tag in _RPM_PACKAGE_TAGS) + '\\n'
+
+
+# List the owners of each file, as "pkg<TAB>PKGID" lines following a
+# "file<TAB>PATH" line.  Messages about files not owned by any package are
+# ignored.
+_RPM_QUERY_FILES_SCRIPT = r"""
+for f
+do
+    printf 'file\t%s\n' "$f"
+    rpm -qf --queryformat 'pkg\t""" + _RPM_PKGID_FORMAT + r"""\n' -- "$f" \
+        2>/dev/null || :
+done
+"""
+
+# Print each directory and its canonical path, e.g. "/bin<TAB>/usr/bin", as
+# "rpm -qf" would resolve it.  The canonical path is empty if the directory
+# does not exist.
+_RESOLVE_DIRS_SCRIPT = r"""
+for d
+do
+    printf '%s\t%s\n' "$d" "$(cd -P -- "$d" 2>/dev/null && pwd)"
+done
+"""
+
+
+def parse_rpm_packages_output(output):
+    """Parse output of "rpm -qa --queryformat _RPM_PACKAGE_FORMAT"
+
+    Returns
+    -------
+    dict
+        Package id -> dict of package fields
+    """
+    fields = [field for field, _ in _RPM_PACKAGE_TAGS]
+    packages = {}
+    for line in output.splitlines():
+        values = line.split('\t')
+        if len(values) != len(fields):
+            lgr.debug("Skipping unexpected rpm output line: %r", line)
+            continue
+        pkg = dict(zip(fields, values))
+        packages[pkg['pkgid']] = pkg
+    return packages
+
+
 @attr.s
 class RedhatDistribution(Distribution):
     """
@@ -178,10 +251,30 @@ class RPMTracer(DistributionTracer):
     # The Redhat tracer is not designed to handle directories
     HANDLES_DIRS = False
 
+    # Minimal number of files to identify by dumping the files of all
+    # installed packages at once, rather than querying rpm for each file.
+    RPM_DB_MIN_FILES = 1000
+
     def _init(self):
         # TODO: we might want a generic helper for collections of things
         # where we could match based on the set of attrs which matter
         self._package_install_dates = {}
+        self._rpm_db = None  # (owners, packages), see _get_rpm_db
+        self._rpm_packages = None  # see _get_rpm_packages
+
+    @borrowdoc(DistributionTracer)
+    def detect(self):
+        try:
+            redhat_version = self._session.read('/etc/redhat-release').strip()
+            _, _ = self._session.execute_command('ls -ld /etc/yum')
+        except CommandError as exc:
+            # Newer rpm systems use `dnf`
+            try:
+                _, _ = self._session.execute_command('ls -ld /etc/dnf')
+            except CommandError as exc:
+                lgr.debug("Did not detect Redhat (or derivative): %s", exc)
+                return None
+        return redhat_version
 
     def identify_distributions(self, files):
         """
@@ -202,16 +295,9 @@ class RPMTracer(DistributionTracer):
         if not files:
             return
 
-        try:
-            redhat_version = self._session.read('/etc/redhat-release').strip()
-            _, _ = self._session.execute_command('ls -ld /etc/yum')
-        except CommandError as exc:
-            # Newer rpm systems use `dnf`
-            try:
-                _, _ = self._session.execute_command('ls -ld /etc/dnf')
-            except CommandError as exc:
-                lgr.debug("Did not detect Redhat (or derivative): %s", exc)
-                return
+        redhat_version = self.detected
+        if not redhat_version:
+            return
 
         packages, remaining_files = self.identify_packages_from_files(files)
         # TODO: add option to report distribution even if no packages/files
@@ -242,49 +328,173 @@ class RPMTracer(DistributionTracer):
         dictionary : key = package id, value = dict of package details
         """
 
+        if len(files) >= self.RPM_DB_MIN_FILES or self._rpm_db is not None:
+            owners, packages = self._get_rpm_db()
+            file_owners = {f: owners[f] for f in files if f in owners}
+            # The database lists canonical paths, e.g. /usr/bin/bash for
+            # /bin/bash if /bin links to /usr/bin.
+            misses = [f for f in files if f not in file_owners]
+            for f, path in self._resolve_dirs(misses).items():
+                if path in owners:
+                    file_owners[f] = owners[path]
+        else:
+            file_owners = self._query_file_owners(files)
+            packages = self._query_packages(
+                {pkgid for ids in file_owners.values() for pkgid in ids})
         file_to_package_dict = {}
-
-        # Get a list of the attrs in the RPMPackage class to filter
-        # out non-relavant values retrieved from the system.
-        package_fields = [p.name for p in attr.fields(RPMPackage)]
-
         for file in files:
-            try:
-                # Get the package identifier that the file is a member.
-                pkgid, err = self._session.execute_command(['rpm', '-qf',
-                    file])
-            except CommandError:
-                continue
-            if err:
+            pkgids = file_owners.get(file)
+            if not pkgids:
                 continue
-
-            pkgids = pkgid.splitlines()
             if len(pkgids) > 1:
                 msg = "Multiple packages found for file {}: {}. Selecting {}"
                 lgr.info(msg.format(file, ', '.join(pkgids), pkgids[0]))
-            pkgid = pkgids[0].strip()
-
-            # Get the package information from the system.
-            package_info, _ = self._session.execute_command(['rpm', '-qi',
-                pkgid])
-            if package_info:
-                # Store the relevant fields of the package in the dict.
-                # The labels of the fields returned by the system are mapped
-                # to the attr fields in the RPMPacakge class.
-                pkg = {'pkgid': pkgid}
-                for line in package_info.splitlines():
-                    matches = re.match(r'(.*?):(.*)\s{2,}(.*):(.*)', line)
-                    if not matches:
-                        matches = re.match(r'(.*?):(.*)', line)
-                    if matches:
-                        for i in range(1, len(matches.groups()), 2):
-                            key = matches.group(i).strip().lower().replace(' ',
-                                '_')
-                            if key in package_fields:
-                                pkg[key] = matches.group(i+1).strip()
+            pkgid = pkgids[0]
+            pkg = packages.get(pkgid)
+            if pkg:
                 lgr.debug("Identified file %r to belong to package %s",
                           pkgid, pkg)
-                file_to_package_dict[file] = pkg
+                file_to_package_dict[file] = dict(pkg)
+        return file_to_package_dict
+
+    def _resolve_dirs(self, files):
+        """Return canonical paths of `files` whose directory is a symlink.
+
+        Returns
+        -------
+        dict
+            File -> path with the directory resolved, for files whose
+            directory resolves to another path.
+        """
+        dirs = sorted({op.dirname(f) for f in files})
+        resolved = {}
+        if not dirs:
+            return resolved
+        for out, _, _ in execute_command_batch(
+                self._session, ['sh', '-c', _RESOLVE_DIRS_SCRIPT, 'sh'],
+                dirs):
+            for line in out.splitlines():
+                d, _, path = line.partition('\t')
+                if path and path != d:
+                    resolved[d] = path
+        return {f: op.join(resolved[op.dirname(f)], op.basename(f))
+                for f in files if op.dirname(f) in resolved}
+
+    def _query_file_owners(self, files):
+        """Query rpm for the packages owning each of `files`
+
+        Returns
+        -------
+        dict
+            Path -> list of package ids, for files owned by a package
+        """
+        owners = {}
+        if not files:
+            return owners
+        for out, _, _ in execute_command_batch(
+                self._session, ['sh', '-c', _RPM_QUERY_FILES_SCRIPT, 'sh'],
+                files):
+            path = None
+            for line in out.splitlines():
+                kind, _, value = line.partition('\t')
+                if kind == 'file':
+                    path = value
+                elif kind == 'pkg' and path is not None:
+                    owners.setdefault(path, []).append(value)
+        return owners
+
+    def _query_packages(self, pkgids):
+        """Query rpm for the details of the packages `pkgids`
+
+        Returns
+        -------
+        dict
+            Package id -> dict of package fields, see `_get_rpm_db`
+        """
+        packages = {}
+        if not pkgids:
+            return packages
+        try:
+            for out, _, _ in execute_command_batch(
+                    self._session,
+                    ['rpm', '-q', '--queryformat', _RPM_PACKAGE_FORMAT],
+                    sorted(pkgids)):
+                packages.update(parse_rpm_packages_output(out))
+        except CommandError as exc:
+            lgr.warning("Could not query the rpm database: %s", exc_str(exc))
+        return packages
+
+    def _get_rpm_db(self):
+        """Query the rpm database for all installed files and packages
+
+        Instead of running "rpm -qf" and "rpm -qi" for every file, dump which
+        files each package owns and the details of all packages, once.
+
+        Returns
+        -------
+        owners : dict
+            Path -> list of package ids (name-version-release.arch)
+        packages : dict
+            Package id -> dict of package fields, matching the fields of
+            "rpm -qi" output
+        """
+        if self._rpm_db is not None:
+            return self._rpm_db
+        owners = {}
+        try:
+            out, _ = self._session.execute_command(
+                ['rpm', '-qa', '--queryformat',
+                 '[%{FILENAMES}\\t' + _RPM_PKGID_FORMAT + '\\n]'])
+            for line in out.splitlines():
+                path, _, pkgid = line.rpartition('\t')
+                if path:
+                    owners.setdefault(path, []).append(pkgid)
+        except CommandError as exc:
+            lgr.warning("Could not query the rpm database: %s", exc_str(exc))
+        self._rpm_db = owners, self._get_rpm_packages()
+        return self._rpm_db
+
+    def _get_rpm_packages(self):
+        """Query the rpm database for the details of all installed packages
+
+        Returns
+        -------
+        dict
+            Package id -> dict of package fields, see `_get_rpm_db`
+        """
+        if self._rpm_packages is None:
+            try:
+                out, _ = self._session.execute_command(
+                    ['rpm', '-qa', '--queryformat', _RPM_PACKAGE_FORMAT])
+                self._rpm_packages = parse_rpm_packages_output(out)
+            except CommandError as exc:
+                lgr.warning("Could not query the rpm database: %s",
+                            exc_str(exc))
+                self._rpm_packages = {}
+        return self._rpm_packages
+
+    @borrowdoc(DistributionTracer)
+    def get_reusable_packagefields(self, distributions):
+        packages = [p for d in distributions
+                    if isinstance(d, RedhatDistribution)
+                    for p in d.packages if p.files]
+        if not packages:
+            return {}
+        installed = self._get_rpm_packages()
+        file_to_package_dict = {}
+        nreused = 0
+        for p in packages:
+            # The package id covers the name, version, release and
+            # architecture.
+            pkgfields = installed.get(p.pkgid)
+            if not pkgfields:
+                lgr.debug("Package %s is no longer installed", p.pkgid)
+                continue
+            nreused += 1
+            for f in p.files:
+                file_to_package_dict[f] = pkgfields
+        lgr.debug("%d out of %d packages are still installed",
+                  nreused, len(packages))
         return file_to_package_dict
 
     def _create_package(self, name, **kwargs):
@@ -8,11 +8,10 @@
 """Support for Singularity distribution(s)."""
 
 import attr
+from functools import partial
 import json
 import logging
 import os
-import tempfile
-import uuid
 
 
 lgr = logging.getLogger('reproman.distributions.singularity')
@@ -23,13 +22,15 @@ from .base import DistributionTracer
 from .base import TypedList
 from .base import _register_with_representer
 from ..dochelpers import borrowdoc, exc_str
-from ..utils import attrib, md5sum, chpwd
+from ..utils import attrib
 
 
 @attr.s(slots=True, frozen=True)
 class SingularityImage(Package):
     """Singularity image information"""
-    md5 = attrib(default=attr.NOTHING)
+    # Digests, as many as the tracer was asked to compute
+    md5 = attrib()
+    sha256 = attrib()
     # Optional
     bootstrap = attrib()
     maintainer = attrib()
@@ -94,6 +95,29 @@ class SingularityTracer(DistributionTracer):
     """
 
     HANDLES_DIRS = False
+    # Digests of images that can be recorded
+    DIGESTS = ("md5", "sha256")
+
+    def __init__(self, session=None, index_cache=None, digests=("md5",),
+                 blocksize=1 << 20):
+        """
+        Parameters
+        ----------
+        digests : sequence of str, optional
+            Algorithms to compute the digests of images with, out of
+            `DIGESTS`.
+        blocksize : int, optional
+            Images might take GBs, and are read in blocks of this size within
+            the session to compute their digests.
+        """
+        unknown = set(digests) - set(self.DIGESTS)
+        if unknown:
+            raise ValueError("Unsupported digests: {}"
+                             .format(", ".join(sorted(unknown))))
+        self.digests = sorted(digests)
+        self.blocksize = blocksize
+        super(SingularityTracer, self).__init__(
+            session=session, index_cache=index_cache)
 
     @borrowdoc(DistributionTracer)
     def identify_distributions(self, files):
@@ -111,25 +135,20 @@ class SingularityTracer(DistributionTracer):
                     # Correct file path for path normalization in retrace.py
                     if not file_path.startswith('shub://'):
                         file_path = file_path.replace('shub:/', 'shub://')
-                    temp_path = "{}.simg".format(uuid.uuid4())
-                    with chpwd(tempfile.gettempdir()):
-                        msg = "Downloading Singularity image {} for tracing"
-                        lgr.info(msg.format(file_path))
-                        self._session.execute_command(['singularity', 'pull',
-                            '--name', temp_path, file_path])
-                        image = json.loads(self._session.execute_command(
-                            ['singularity', 'inspect', temp_path])[0])
-                        url = file_path
-                        md5 = md5sum(temp_path)
-                        os.remove(temp_path)
+                    url = file_path
+                    image, digests = self._get_shub_image_info(file_path)
                 else:
                     path = os.path.abspath(file_path)
-                    image = json.loads(self._session.execute_command(
-                        ['singularity', 'inspect', file_path])[0])
-                    md5 = md5sum(file_path)
+                    # Digests computed with other algorithms are of no use.
+                    info = self._get_cached_index(
+                        "-".join(["singularity-image"] + self.digests),
+                        path, [path],
+                        partial(self._get_image_info, path))
+                    image, digests = info["inspect"], info["digests"]
 
                 images.append(SingularityImage(
-                    md5=md5,
+                    md5=digests.get("md5"),
+                    sha256=digests.get("sha256"),
                     bootstrap=image.get(
                         'org.label-schema.usage.singularity.deffile.bootstrap'),
                     maintainer=image.get('MAINTAINER'),
@@ -162,6 +181,33 @@ class SingularityTracer(DistributionTracer):
 
         yield dist, remaining_files
 
+    def _get_image_info(self, path):
+        """Return labels and digest of the image at `path` within the session
+        """
+        image = json.loads(self._session.execute_command(
+            ['singularity', 'inspect', path])[0])
+        digests = self._session.digest(path, self.digests,
+                                       blocksize=self.blocksize)
+        return {"inspect": image, "digests": digests}
+
+    def _get_shub_image_info(self, url):
+        """Pull the image from `url` within the session to get its info
+
+        Returns
+        -------
+        tuple (labels, digests)
+        """
+        tmpdir = self._session.mktmpdir()
+        try:
+            lgr.info("Downloading Singularity image %s for tracing", url)
+            self._session.execute_command(
+                ['singularity', 'pull', '--name', 'image.simg', url],
+                cwd=tmpdir)
+            info = self._get_image_info(os.path.join(tmpdir, 'image.simg'))
+        finally:
+            self._session.execute_command(['rm', '-rf', tmpdir])
+        return info["inspect"], info["digests"]
+
     @borrowdoc(DistributionTracer)
     def _get_packagefields_for_files(self, files):
         return
@@ -293,6 +293,44 @@ def test_get_conda_env_export_exceptions():
         tracer._get_conda_env_export("", "/conda")
         assert "unknown" in log_warning.val
 
+def test_get_conda_package_details(tmpdir):
+    import json
+    conda_path = str(tmpdir)
+    meta_dir = os.path.join(conda_path, "conda-meta")
+    os.mkdir(meta_dir)
+    for name, files in [("python", ["bin/python3", "lib/libpython.so"]),
+                        ("zlib", ["lib/libz.so"])]:
+        with open(os.path.join(meta_dir, name + "-1.0-0.json"), "w") as f:
+            json.dump({"name": name, "version": "1.0", "build": "0",
+                       "files": files, "schannel": "defaults"},
+                      f, indent=2)
+    with open(os.path.join(meta_dir, "history"), "w") as f:
+        f.write("not json")
+    with open(os.path.join(meta_dir, "broken-1.0-0.json"), "w") as f:
+        f.write("{")
+
+    tracer = CondaTracer()
+    with mock.patch.object(tracer._session, "execute_command",
+                           wraps=tracer._session.execute_command) as ex:
+        packages, file_to_pkg = \
+            tracer._get_conda_package_details(conda_path)
+        # All the metadata was fetched at once.
+        assert ex.call_count == 1
+    assert sorted(packages) == ["python=1.0=0", "zlib=1.0=0"]
+    assert packages["zlib=1.0=0"]["schannel"] == "defaults"
+    # File lists are not kept around once mapped.
+    assert "files" not in packages["zlib=1.0=0"]
+    assert file_to_pkg == {
+        os.path.join(conda_path, "bin/python3"): "python=1.0=0",
+        os.path.join(conda_path, "lib/libpython.so"): "python=1.0=0",
+        os.path.join(conda_path, "lib/libz.so"): "zlib=1.0=0"}
+
+    # An environment without packages
+    os.mkdir(os.path.join(conda_path, "empty"))
+    assert tracer._get_conda_package_details(
+        os.path.join(conda_path, "empty")) == ({}, {})
+
+
 conda_yaml = os.path.join(os.path.dirname(__file__), 'files', 'conda.yaml')
 
 def test_conda_packages():
@@ -6,6 +6,7 @@
 #   copyright and license terms.
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+from datetime import datetime
 import json
 import os
 from os.path import islink
@@ -14,10 +15,12 @@ from os.path import join, isfile
 import logging
 
 import attr
+import pytz
 
 from reproman.distributions.debian import DebTracer
 from reproman.distributions.debian import DEBPackage
 from reproman.distributions.debian import DebianDistribution
+from reproman.distributions.index_cache import IndexCache
 
 import pytest
 
@@ -189,6 +192,156 @@ fail2ban: /usr/bin/fail2ban-server
     }
 
 
+def _create_dpkg_admindir(admindir):
+    files = {"dash.list": "/bin\n/bin/dash\n",
+             "libc6:amd64.list": "/bin\n/lib/libc.so\n",
+             "other.list": "/bin/sh\n/usr/share/doc/shared\n"}
+    os.mkdir(join(admindir, "info"))
+    for fname, content in files.items():
+        with open(join(admindir, "info", fname), "w") as f:
+            f.write(content)
+    with open(join(admindir, "info", "libc6:amd64.list"), "a") as f:
+        f.write("/usr/share/doc/shared\n")
+    with open(join(admindir, "status"), "w") as f:
+        f.write("""\
+Package: dash
+Status: install ok installed
+Architecture: amd64
+Version: 0.5
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.36
+""")
+    with open(join(admindir, "diversions"), "w") as f:
+        f.write("/bin/sh\n/bin/sh.distrib\ndash\n")
+
+
+def test_get_packagefields_from_dpkg_db(tmpdir):
+    admindir = str(tmpdir)
+    _create_dpkg_admindir(admindir)
+
+    manager = DebTracer()
+    manager.DPKG_ADMINDIR = admindir
+    manager.DPKG_DB_MIN_FILES = 0
+
+    def query_mock(files):
+        assert files == ["/bin/sh"]
+        return {"/bin/sh": {"name": "dash"}}
+
+    with mock.patch.object(manager, "_query_packagefields_for_files",
+                           query_mock), \
+            swallow_logs(new_level=logging.DEBUG) as log:
+        out = manager._get_packagefields_for_files(
+            ["/bin", "/bin/dash", "/lib/libc.so", "/bin/sh",
+             "/usr/share/doc/shared", "/bogus"])
+        assert "shared by multiple packages" in log.out
+    # Like dpkg-query, one of the packages sharing a file is picked.
+    assert out.pop("/usr/share/doc/shared") == {"name": "libc6",
+                                                 "architecture": "amd64"}
+    assert out == {
+        "/bin/dash": {"name": "dash"},
+        "/lib/libc.so": {"name": "libc6", "architecture": "amd64"},
+        "/bin/sh": {"name": "dash"},
+    }
+
+    # Details come from the same database.
+    pkgs = [{"name": "libc6", "architecture": "amd64"}]
+    manager._get_pkgs_arch_and_version(pkgs)
+    manager._get_pkgs_install_date(pkgs)
+    assert pkgs[0]["version"] == "2.36"
+    # No fractions of a second, as with the stat-based lookup
+    mtime = os.stat(join(admindir, "info", "libc6:amd64.list")).st_mtime
+    assert pkgs[0]["install_date"] == str(
+        pytz.utc.localize(datetime.utcfromtimestamp(int(mtime))))
+
+
+def test_dpkg_db_index_cache(tmpdir):
+    admindir = str(tmpdir.mkdir("dpkg"))
+    _create_dpkg_admindir(admindir)
+    cache = IndexCache(str(tmpdir.join("cache")))
+
+    def get_tracer():
+        tracer = DebTracer(index_cache=cache)
+        tracer.DPKG_ADMINDIR = admindir
+        tracer.DPKG_DB_MIN_FILES = 2
+        return tracer
+
+    files = ["/bin/dash", "/lib/libc.so"]
+    tracer = get_tracer()
+    expected = tracer._get_packagefields_for_files(files)
+    assert expected["/bin/dash"] == {"name": "dash"}
+    assert tracer._dpkg_db is not None
+
+    # Below the threshold, even a persisted database is not loaded ...
+    tracer = get_tracer()
+    with mock.patch.object(tracer, "_query_packagefields_for_files",
+                           return_value={}) as query:
+        tracer._get_packagefields_for_files(files[:1])
+        assert query.called
+    assert tracer._dpkg_db is None
+    # ... unless it already is.
+    tracer._load_dpkg_db()
+    with mock.patch.object(tracer, "_query_packagefields_for_files") as query:
+        assert tracer._get_packagefields_for_files(files[:1]) == \
+            {"/bin/dash": {"name": "dash"}}
+        assert not query.called
+
+    tracer = get_tracer()
+    with mock.patch.object(tracer._session, "execute_command") as execute:
+        assert tracer._get_packagefields_for_files(files) == expected
+        assert not execute.called
+
+    # Changes to the database are noticed.
+    with open(join(admindir, "status"), "a") as f:
+        f.write("\nPackage: new-package\nStatus: install ok installed\n")
+    tracer = get_tracer()
+    tracer._get_packagefields_for_files(files)
+    assert "new-package" in tracer._dpkg_db.packages
+
+
+def test_get_reusable_packagefields(tmpdir):
+    dist = DebianDistribution(name="debian", packages=[
+        DEBPackage(name="dash", architecture="amd64", version="0.5",
+                   files=["/bin/dash"]),
+        DEBPackage(name="libc6", architecture="amd64", version="2.35",
+                   files=["/lib/libc.so"]),
+        DEBPackage(name="gone", architecture="amd64", version="1.0",
+                   files=["/gone"]),
+        DEBPackage(name="zlib1g", architecture="i386", version="1.3",
+                   files=["/lib/i386/libz.so"]),
+    ])
+    expected = {
+        "/bin/dash": {"name": "dash"},
+        "/lib/i386/libz.so": {"name": "zlib1g", "architecture": "i386"},
+    }
+
+    tracer = DebTracer()
+    out = ("dash\tamd64\tforeign\t0.5\tii \n"
+           "libc6\tamd64\tsame\t2.36\tii \n"
+           "zlib1g\tamd64\tsame\t1.3\tii \n"
+           "zlib1g\ti386\tsame\t1.3\tii \n")
+    with mock.patch.object(tracer._session, "execute_command",
+                           return_value=(out, "")) as execute:
+        assert tracer.get_reusable_packagefields([dist]) == expected
+        assert execute.call_args[0][0][:2] == ["dpkg-query", "-W"]
+
+    # A persisted dpkg database answers without any command.
+    admindir = str(tmpdir.mkdir("dpkg"))
+    _create_dpkg_admindir(admindir)
+    cache = IndexCache(str(tmpdir.join("cache")))
+    tracer = DebTracer(index_cache=cache)
+    tracer.DPKG_ADMINDIR = admindir
+    tracer._load_dpkg_db()
+    tracer = DebTracer(index_cache=cache)
+    tracer.DPKG_ADMINDIR = admindir
+    with mock.patch.object(tracer._session, "execute_command") as execute:
+        assert tracer.get_reusable_packagefields([dist]) == {
+            "/bin/dash": {"name": "dash"}}
+        assert not execute.called
+
+
 def test_parse_dpkgquery_line():
     parse = DebTracer()._parse_dpkgquery_line
 
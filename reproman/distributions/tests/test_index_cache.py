@@ -0,0 +1,81 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import os
+import os.path as op
+from unittest import mock
+
+from reproman.distributions.base import DistributionTracer
+from reproman.distributions.index_cache import IndexCache
+from reproman.resource.shell import ShellSession
+from reproman.tests.utils import create_tree
+
+
+def test_index_cache(tmpdir):
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"env": {"status": "a"}})
+    status = op.join(tmpdir, "env", "status")
+    cache = IndexCache(op.join(tmpdir, "cache"))
+    session = ShellSession()
+
+    entry = cache.lookup(session, "kind", "/env", [status])
+    assert entry.load() is None
+    entry.save({"index": [1]})
+    assert cache.lookup(session, "kind", "/env", [status]).load() == \
+        {"index": [1]}
+    # Indexes of other environments and kinds are separate.
+    assert cache.lookup(session, "kind", "/other", [status]).load() is None
+    assert cache.lookup(session, "other", "/env", [status]).load() is None
+
+    with open(status, "a") as f:
+        f.write("b")
+    entry = cache.lookup(session, "kind", "/env", [status])
+    assert entry.load() is None
+    # The outdated index is replaced.
+    entry.save({"index": [2]})
+    assert entry.load() == {"index": [2]}
+
+    # A rewrite of the same size within the same second is noticed too.
+    mtime = os.stat(status).st_mtime
+    os.utime(status, (mtime, int(mtime) + 0.25))
+    entry = cache.lookup(session, "kind", "/env", [status])
+    entry.save({"index": [3]})
+    os.utime(status, (mtime, int(mtime) + 0.5))
+    assert cache.lookup(session, "kind", "/env", [status]).load() is None
+
+    # Sessions without an identity cannot have indexes persisted.
+    with mock.patch.object(ShellSession, "identity", None):
+        assert cache.lookup(session, "kind", "/env", [status]) is None
+
+
+def test_tracer_get_cached_index(tmpdir):
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"status": ""})
+    paths = [op.join(tmpdir, "status")]
+
+    class Tracer(DistributionTracer):
+        _create_package = _get_packagefields_for_files = None
+        identify_distributions = None
+
+    build = mock.Mock(return_value={"a": 1})
+    tracer = Tracer(session=ShellSession())
+    assert tracer._get_cached_index("kind", "/env", paths, build) == {"a": 1}
+    assert build.call_count == 1
+
+    cache = IndexCache(op.join(tmpdir, "cache"))
+    for _ in range(2):
+        tracer = Tracer(session=ShellSession(), index_cache=cache)
+        assert tracer._get_cached_index("kind", "/env", lambda: paths,
+                                        build) == {"a": 1}
+    assert build.call_count == 2
+
+    # Empty indexes are not persisted.
+    build = mock.Mock(return_value={})
+    for _ in range(2):
+        assert tracer._get_cached_index("kind", "/empty", paths, build) == {}
+    assert build.call_count == 2
@@ -197,6 +197,106 @@ def test_tracer(docker_container):
     assert packages['/usr/bin/ls']['packager'].startswith('CentOS BuildSystem')
 
 
+def test_get_packagefields_for_files_rpm_db():
+    from ...distributions.redhat import _RPM_PACKAGE_TAGS
+
+    def pkg_line(name, version):
+        values = dict((field, "(none)") for field, _ in _RPM_PACKAGE_TAGS)
+        values.update(pkgid="%s-%s-1.el7.x86_64" % (name, version),
+                      name=name, version=version, group="System/Base")
+        return "\t".join(values[field] for field, _ in _RPM_PACKAGE_TAGS)
+
+    outputs = {
+        "[%{FILENAMES}": (
+            "/usr/bin\tcoreutils-8.22-1.el7.x86_64\n"
+            "/usr/bin/ls\tcoreutils-8.22-1.el7.x86_64\n"
+            "/usr/bin/shared\tcoreutils-8.22-1.el7.x86_64\n"
+            "/usr/bin/shared\tbash-4.2-1.el7.x86_64\n"),
+        "%{NAME}": "\n".join([pkg_line("coreutils", "8.22"),
+                               pkg_line("bash", "4.2"),
+                               "garbage"]) + "\n",
+    }
+    commands = []
+
+    class FakeSession(object):
+        def execute_command(self, command):
+            commands.append(command)
+            if command[:2] == ["sh", "-c"]:
+                # Resolution of directories: /bin links to /usr/bin.
+                return "".join("%s\t%s\n" % (d, "/usr/bin" if d == "/bin"
+                                               else "")
+                               for d in command[4:]), ""
+            assert command[:3] == ["rpm", "-qa", "--queryformat"]
+            for prefix, out in outputs.items():
+                if command[3].startswith(prefix):
+                    return out, ""
+            raise AssertionError("Unexpected command %s" % command)
+
+    tracer = RPMTracer(FakeSession())
+    tracer.RPM_DB_MIN_FILES = 3
+    with swallow_logs(new_level=logging.INFO) as log:
+        out = tracer._get_packagefields_for_files(
+            ["/usr/bin/ls", "/usr/bin/shared", "/bin/ls", "/not/packaged"])
+        assert "Multiple packages found for file /usr/bin/shared" in log.out
+    assert sorted(out) == ["/bin/ls", "/usr/bin/ls", "/usr/bin/shared"]
+    assert out["/bin/ls"]["name"] == "coreutils"
+    assert [c[4:] for c in commands if c[0] == "sh"] == [["/bin", "/not"]]
+    del commands[:]
+    assert out["/usr/bin/ls"]["name"] == "coreutils"
+    assert out["/usr/bin/ls"]["pkgid"] == "coreutils-8.22-1.el7.x86_64"
+    assert out["/usr/bin/ls"]["group"] == "System/Base"
+    RPMPackage(**out["/usr/bin/ls"])
+    # The database is queried only once, and then used for any number of
+    # files.
+    tracer._get_packagefields_for_files(["/usr/bin/ls"])
+    assert not commands
+
+    # Packages still installed are verified using only the package details.
+    del commands[:]
+    tracer = RPMTracer(FakeSession())
+    dist = RedhatDistribution(name="redhat", packages=[
+        RPMPackage(name="bash", pkgid="bash-4.2-1.el7.x86_64",
+                   files=["/usr/bin/bash"]),
+        RPMPackage(name="coreutils", pkgid="coreutils-8.21-1.el7.x86_64",
+                   files=["/usr/bin/cp"]),
+    ])
+    reused = tracer.get_reusable_packagefields([dist])
+    assert list(reused) == ["/usr/bin/bash"]
+    assert reused["/usr/bin/bash"]["version"] == "4.2"
+    assert len(commands) == 1
+
+
+def test_get_packagefields_for_few_files():
+    from ...distributions.redhat import _RPM_PACKAGE_FORMAT
+    from ...distributions.redhat import _RPM_PACKAGE_TAGS
+
+    values = dict((field, "(none)") for field, _ in _RPM_PACKAGE_TAGS)
+    values.update(pkgid="bash-4.2-1.el7.x86_64", name="bash", version="4.2")
+    commands = []
+
+    class FakeSession(object):
+        def execute_command(self, command):
+            commands.append(command)
+            if command[:2] == ["sh", "-c"]:
+                assert command[4:] == ["/bin/bash", "/not/packaged"]
+                return ("file\t/bin/bash\npkg\tbash-4.2-1.el7.x86_64\n"
+                        "file\t/not/packaged\n"
+                        "file /not/packaged is not owned by any package\n"), ""
+            assert command[:4] == ["rpm", "-q", "--queryformat",
+                                   _RPM_PACKAGE_FORMAT]
+            assert command[4:] == ["bash-4.2-1.el7.x86_64"]
+            return "\t".join(values[f] for f, _ in _RPM_PACKAGE_TAGS), ""
+
+    # Below the threshold, rpm is queried for the files rather than dumping
+    # the whole database.
+    tracer = RPMTracer(FakeSession())
+    out = tracer._get_packagefields_for_files(["/bin/bash", "/not/packaged"])
+    assert list(out) == ["/bin/bash"]
+    assert out["/bin/bash"]["version"] == "4.2"
+    assert len(commands) == 2
+    assert tracer._rpm_db is None
+
+
 def test_distribution(docker_container, centos_spec):
     from ...resource.docker_container import DockerContainer
     # Test setup
@@ -7,14 +7,22 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
+import hashlib
+import json
 import os.path as op
+from unittest import mock
 
 import pytest
 
 from ...cmd import Runner
+from ...distributions.index_cache import IndexCache
 from ...distributions.singularity import SingularityTracer
+from ...resource.shell import ShellSession
+from ...support.exceptions import CommandError
 from ...support.external_versions import external_versions
 from ...tests.skip import mark
+from ...tests.utils import create_tree
+from ...utils import md5sum
 
 
 @mark.skipif_no_network
@@ -48,3 +56,69 @@ def test_singularity_trace(tmpdir):
         assert img_info.singularity_version == '2.4-feature-squashbuild-secbuild.g217367c'
         assert img_info.base_image == "busybox"
         assert 'non-existent-image' in remaining_files
+
+
+def test_singularity_trace_cached(tmpdir):
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"img": "image"})
+    img = op.join(tmpdir, "img")
+    session = ShellSession()
+    execute_command = session.execute_command
+    labels = {"MAINTAINER": "me",
+              "org.label-schema.build-size": "1MB"}
+
+    def execute(cmd, **kwargs):
+        if cmd[:2] == ["singularity", "inspect"]:
+            if not op.exists(cmd[2]):
+                raise CommandError(cmd=cmd, msg="no image")
+            return json.dumps(labels), ""
+        return execute_command(cmd, **kwargs)
+
+    tracer = SingularityTracer(
+        session=session, index_cache=IndexCache(op.join(tmpdir, "cache")))
+    with mock.patch.object(session, "execute_command",
+                           side_effect=execute) as ex, \
+            mock.patch.object(session, "digest",
+                              wraps=session.digest) as digest:
+        dist, remaining_files = next(
+            tracer.identify_distributions([img, "non-existent-image"]))
+        assert ex.call_count == 2
+        assert digest.call_count == 1
+        img_info = dist.images[0]
+        assert img_info.md5 == md5sum(img)
+        assert img_info.maintainer == "me"
+        assert img_info.build_size == "1MB"
+        assert img_info.path == img
+        assert remaining_files == {"non-existent-image"}
+
+        # The image is neither inspected nor read again while unchanged ...
+        dist, _ = next(tracer.identify_distributions([img]))
+        assert dist.images[0].md5 == img_info.md5
+        assert ex.call_count == 2
+        assert digest.call_count == 1
+
+        # ... but it is once it changes.
+        with open(img, "a") as f:
+            f.write(" changed")
+        dist, _ = next(tracer.identify_distributions([img]))
+        assert dist.images[0].md5 == md5sum(img)
+        assert digest.call_count == 2
+
+    # Other digests are computed on request, without reusing the index of
+    # the md5 ones.
+    tracer = SingularityTracer(
+        session=session, index_cache=IndexCache(op.join(tmpdir, "cache")),
+        digests=["sha256", "md5"])
+    with mock.patch.object(session, "execute_command",
+                           side_effect=execute), \
+            mock.patch.object(session, "digest",
+                              wraps=session.digest) as digest:
+        dist, _ = next(tracer.identify_distributions([img]))
+        digest.assert_called_once_with(img, ["md5", "sha256"],
+                                       blocksize=tracer.blocksize)
+    with open(img, "rb") as f:
+        assert dist.images[0].sha256 == hashlib.sha256(f.read()).hexdigest()
+    assert dist.images[0].md5 == md5sum(img)
+
+    with pytest.raises(ValueError):
+        SingularityTracer(session=session, digests=["crc32"])
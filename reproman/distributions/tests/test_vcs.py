@@ -14,6 +14,7 @@ import attr
 import copy
 import logging
 import pytest
+from unittest import mock
 
 from reproman.cmd import GitRunner
 from reproman.distributions.vcs import VCSTracer
@@ -234,6 +235,44 @@ def test_git_repo_remotes(git_repo_pair):
     assert not dists_remote[0][0].packages[0].remotes.values()
 
 
+def test_git_repo_single_query(git_repo_pair):
+    repo_local, _ = git_repo_pair
+    tracer = VCSTracer()
+    paths = [os.path.join(repo_local, "foo"),
+             os.path.join(repo_local, "bar")]
+    with mock.patch.object(tracer._session, "execute_command",
+                           wraps=tracer._session.execute_command) as ex:
+        dists = list(tracer.identify_distributions(paths))
+    pkg = dists[0][0].packages[0]
+    assert pkg.hexsha
+    assert pkg.root_hexsha
+    assert pkg.tracked_remote == "origin"
+    assert pkg.remotes["origin"]["contains"]
+    # Locating the repository, listing its files, and all the metadata.
+    git_calls = [c for c in ex.call_args_list if "git " in str(c[0][0])]
+    assert len(git_calls) == 3
+
+
+def test_resolve_probes_directory_once(git_repo, tmpdir):
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"a": "", "b": "", "sub": {"c": ""}})
+    paths = [op.join(tmpdir, "a"), op.join(tmpdir, "b"),
+             op.join(tmpdir, "sub", "c"),
+             op.join(git_repo, "foo"), op.join(git_repo, "subdir", "baz")]
+    tracer = VCSTracer()
+    with mock.patch.object(tracer._session, "execute_command",
+                           wraps=tracer._session.execute_command) as ex:
+        dists = list(tracer.identify_distributions(paths))
+    assert_distributions(
+        dists, expected_length=1,
+        expected_unknown=set(paths[:3]),
+        expected_subset={"packages": [{"path": git_repo}]})
+    # Files in subdirectories of a known repository need no probing either.
+    probes = [c for c in ex.call_args_list
+              if "--show-toplevel" in str(c[0][0])]
+    assert len(probes) == 3
+
+
 def test_git_install_no_remote():
     dist = GitDistribution(name="git",
                            packages=[GitRepo(path="/tmp/shouldn't/matter")])
@@ -12,9 +12,9 @@ import abc
 import attr
 import os
 
+from bisect import bisect_left
 from collections import defaultdict
-from os.path import dirname, isdir, isabs, abspath
-from os.path import exists, lexists
+from os.path import dirname, isabs, abspath
 from os.path import join as opj
 
 from logging import getLogger
@@ -323,7 +323,14 @@ class GitSVNRepoShim(object):
         self.path = path.rstrip(os.sep)  # TODO: might be done as some rg to attr.ib
         self._session = session
         self._all_files = None
-        self._branch = None
+
+    def reset(self):
+        """Forget what was learned about the repository
+
+        Its state (e.g. the checked out revision or files) might have changed
+        since it was queried.
+        """
+        self._all_files = None
 
     def _session_execute_command(self, cmd, **kwargs):
         """Run in the session but providing our self.path as the cwd"""
@@ -333,14 +340,19 @@ class GitSVNRepoShim(object):
 
     @property
     def all_files(self):
-        """Lazy evaluation for _all_files. If session changes, result would be old"""
+        """Sorted list of the files (relative to path) under VCS control
+
+        Lazy evaluation for _all_files. If session changes, result would be
+        old (until reset).
+        """
         if self._all_files is None:
             out, err = self._session_execute_command(self._ls_files_command)
             assert not err
-            self._all_files = set(filter(None, out.split('\n')))
+            all_files = filter(None, out.split('\n'))
             if self._ls_files_filter:
-                self._all_files = self._ls_files_filter(self._all_files)
-            self._all_files = set(self._all_files)  # for efficient lookups
+                all_files = self._ls_files_filter(all_files)
+            # sorted for lookups by bisection
+            self._all_files = sorted(set(all_files))
         return self._all_files
 
     def owns_path(self, path):
@@ -357,7 +369,9 @@ class GitSVNRepoShim(object):
         #  For now just a strict check, and we would want to request all files
         #  which repo knows about
         rpath = path[len(self.path)+1:]
-        return rpath in self.all_files
+        all_files = self.all_files
+        idx = bisect_left(all_files, rpath)
+        return idx < len(all_files) and all_files[idx] == rpath
 
     @classmethod
     def get_at_dirpath(cls, session, dirpath):
@@ -399,7 +413,7 @@ class SVNRepoShim(GitSVNRepoShim):
         # ho ho -- no longer the case that there is .svn in each subfolder:
         # http://stackoverflow.com/a/9070242
         found = False
-        if exists(opj(dirpath, '.svn')):  # early detection
+        if session.exists(opj(dirpath, '.svn')):  # early detection
             found = True
         # but still might be under SVN
         if not found:
@@ -481,10 +495,36 @@ class SVNRepoShim(GitSVNRepoShim):
         return self._info['Repository UUID']
 
 
+_GIT_METADATA_MARKER = "@@@reproman "
+
+# Collects everything GitRepoShim reports about a repository, so it takes a
+# single command per repository (which matters for remote sessions).  Every
+# section is introduced by a marker line, and left empty if its query fails
+# (e.g., no commits yet or detached HEAD).
+_GIT_METADATA_SCRIPT = """\
+m='{marker}'
+hexsha=$(git rev-parse --quiet --verify HEAD 2>/dev/null)
+echo "${{m}}hexsha"; echo "$hexsha"
+echo "${{m}}root_hexsha"
+[ -n "$hexsha" ] && git rev-list --max-parents=0 HEAD 2>/dev/null
+echo "${{m}}describe"; git describe --tags 2>/dev/null
+echo "${{m}}branch"; git symbolic-ref --quiet --short HEAD 2>/dev/null
+echo "${{m}}remotes"; git remote 2>/dev/null
+echo "${{m}}contains"
+[ -n "$hexsha" ] && git branch -r --contains "$hexsha" 2>/dev/null
+echo "${{m}}config"; git config --get-regexp '^(remote|branch)\\.' 2>/dev/null
+exit 0
+""".format(marker=_GIT_METADATA_MARKER)
+
+
 class GitRepoShim(GitSVNRepoShim):
 
     _ls_files_command = 'git ls-files'
 
+    def __init__(self, *args, **kwargs):
+        super(GitRepoShim, self).__init__(*args, **kwargs)
+        self._metadata = None
+
     _vcs_class = GitRepo
     _vcs_distribution_class = GitDistribution
 
@@ -522,30 +562,57 @@ class GitRepoShim(GitSVNRepoShim):
                 return None
         return out.strip()
 
+    def reset(self):
+        super(GitRepoShim, self).reset()
+        self._metadata = None
+
+    def _get_metadata(self):
+        """Query all the metadata of the repository in a single invocation
+
+        Returns
+        -------
+        dict
+          Output lines of each section of _GIT_METADATA_SCRIPT, and the
+          configuration of remotes and branches under "config".
+        """
+        if self._metadata is None:
+            out, _ = self._session_execute_command(
+                ["sh", "-c", _GIT_METADATA_SCRIPT])
+            metadata = defaultdict(list)
+            lines = None
+            for line in out.splitlines():
+                if line.startswith(_GIT_METADATA_MARKER):
+                    lines = metadata[line[len(_GIT_METADATA_MARKER):]]
+                elif line and lines is not None:
+                    lines.append(line)
+            config = {}
+            for line in metadata.pop("config", []):
+                key, _, value = line.partition(" ")
+                # As `git config KEY`, report the last value of multi-valued
+                # keys.
+                config[key] = value
+            metadata["config"] = config
+            self._metadata = metadata
+        return self._metadata
+
+    def _get_metadata_line(self, section):
+        lines = self._get_metadata()[section]
+        return lines[-1].strip() if lines else None
+
     @property
     def hexsha(self):
-        try:
-            return self._run_git('rev-parse HEAD')
-        except CommandError:
-            # might still be the first yet to be committed state in the branch
-            return None
+        # None if it might still be the first yet to be committed state in
+        # the branch
+        return self._get_metadata_line("hexsha")
 
     @property
     def root_hexsha(self):
-        try:
-            rev_list = self._run_git('rev-list --max-parents=0 HEAD').split('\n')
-            return rev_list[-1]
-        except CommandError:
-            # might still be the first yet to be committed state in the branch
-            return None
+        return self._get_metadata_line("root_hexsha")
 
     @property
     def describe(self):
         """Let's use git describe"""
-        try:
-            return self._run_git('describe --tags', expect_fail=True)
-        except CommandError:
-            return None
+        return self._get_metadata_line("describe")
 
     @property
     def remotes(self):
@@ -558,34 +625,28 @@ class GitRepoShim(GitSVNRepoShim):
         # version which is not yet pushed... so what additional information
         # would this check provide us?  We better record current branch,
         # and mark remote which is tracked for it
-        hexsha = self.hexsha
+        metadata = self._get_metadata()
         # which remotes contain this commit, so we could provide this
         # possibly valuable information
-        if not hexsha:  # just initialized
+        if not self.hexsha:  # just initialized
             return {}
 
-        remote_branches = self._run_git(
-            ["branch", "-r", "--contains", hexsha]).splitlines()
-                                               # e.g. "origin/HEAD -> origin/master"
-        remote_branches = [b.strip() for b in remote_branches if " -> " not in b]
+        # e.g. "origin/HEAD -> origin/master"
+        remote_branches = [b.strip() for b in metadata["contains"]
+                           if " -> " not in b]
 
         if not remote_branches:
             return {}
         containing_remotes = set(x.split('/', 1)[0] for x in remote_branches)
+        config = metadata["config"]
         remotes = {}
-        for remote in self._run_git('remote').splitlines():
+        for remote in metadata["remotes"]:
+            remote = remote.strip()
             rec = {}
             for f in 'url', 'pushurl':
-                try:
-                    v = self._run_git('config remote.%s.%s' % (remote, f)
-                                      , expect_fail=True
-                                      #, expect_stderr=True
-                                     )
-                    if v is not None:
-                        rec[f] = v
-                except CommandError:
-                    # must have no value
-                    pass
+                v = config.get('remote.%s.%s' % (remote, f))
+                if v:
+                    rec[f] = v
             if remote in containing_remotes:
                 rec['contains'] = True
             remotes[remote] = rec
@@ -596,22 +657,14 @@ class GitRepoShim(GitSVNRepoShim):
         branch = self.branch
         if not branch:
             return None
-        return self._run_git(
-                'config branch.%s.remote' % (branch,)
-                #, expect_stderr=True
-                , expect_fail=True
-        ) or None         # want explicit None
+        # want explicit None
+        return self._get_metadata()["config"].get(
+            'branch.%s.remote' % (branch,)) or None
 
     @property
     def branch(self):
-        if self._branch is None:
-            try:
-                branch = self._run_git('symbolic-ref --short HEAD')
-            except CommandError:
-                # We're in a detached state.
-                return None
-            self._branch = branch
-        return self._branch
+        # None if we're in a detached state.
+        return self._get_metadata_line("branch")
 
     def has_revision(self, revision):
         """Does the repository have `revision`?
@@ -650,8 +703,15 @@ class VCSTracer(DistributionTracer):
         # dictionary to contain per each inspected/known directory a VCS
         # instance it belongs to
         self._known_repos = {}
+        # directories which were already sniffed for repositories, so
+        # whatever was found there is among _known_repos
+        self._probed_dirpaths = set()
 
     def identify_distributions(self, files):
+        # Repositories known from a previous call might have changed since.
+        for shim in self._known_repos.values():
+            shim.reset()
+        self._probed_dirpaths = set()
         repos, remaining_files = self.identify_packages_from_files(
             files, root_key="path")
         pkgs_per_distr = defaultdict(list)
@@ -663,9 +723,12 @@ class VCSTracer(DistributionTracer):
 
     def _get_packagefields_for_files(self, files):
         out = {}
-        for f in files:
+        paths = {f: f if isabs(f) else abspath(f) for f in files}
+        isdirs = self._session.isdir_many(set(paths.values()))
+        for f, path in paths.items():
             lgr.log(6, "%s testing file %s", self, f)
-            shim = self._resolve_file(f)
+            shim = self._resolve_file(
+                path, dirpath=path if isdirs.get(path) else dirname(path))
             if not shim:
                 continue
             # we probably do not want all the attributes to just report which
@@ -693,41 +756,52 @@ class VCSTracer(DistributionTracer):
         attrs = only_with_values(attrs)
         return instantiate_attr_object(shim._vcs_class, attrs)
 
-    def _resolve_file(self, path):
-        """Given a path, return path of the repository it belongs to"""
-        # very naive just to get a ball rolling
+    def _resolve_file(self, path, dirpath=None):
+        """Given a path, return shim of the repository it belongs to
+
+        Parameters
+        ----------
+        path : str
+        dirpath : str, optional
+            The path itself if it is a directory, or its parent directory.
+            Queried from the session if not provided.
+        """
         if not isabs(path):
             path = abspath(path)
-        dirpath = path if isdir(path) else dirname(path)
-
-        # quick check first
-        if dirpath in self._known_repos:
-            return self._known_repos[dirpath]
-
-        # it could still be a subdirectory known to the repository known above it
-        for repo in self._known_repos.values():
-            # XXX this design is nohow accounts for some fancy cases where
-            # someone could use GIT_TREE and other trickery to have out of the
-            # directory checkout.  May be some time we would get there but
-            # for now
-            # should be ok
-
-            # could be less efficient than some str manipulations but ok for now
-            if os.path.commonprefix((repo.path, path)) != repo.path:
-                continue
-
-            # could be less efficient than some str manipulations but ok for now
-            # since we rely on a strict check (must be registered within the repo)
-            if repo.owns_path(path):
-                return repo
+        if dirpath is None:
+            dirpath = path if self._session.isdir(path) else dirname(path)
+
+        # A repository containing the path has its root at dirpath or above
+        # it, so check the known roots among those, the nearest first.
+        # XXX this design is nohow accounts for some fancy cases where
+        # someone could use GIT_TREE and other trickery to have out of the
+        # directory checkout.  May be some time we would get there but
+        # for now should be ok
+        rootpath = dirpath
+        while True:
+            repo = self._known_repos.get(rootpath)
+            if repo is not None:
+                # we rely on a strict check (must be registered within the
+                # repo) for all but the files directly at the top
+                if rootpath == dirpath or repo.owns_path(path):
+                    return repo
+            parent = dirname(rootpath)
+            if parent == rootpath:
+                break
+            rootpath = parent
 
         # ok -- if it is not among known repos, we need to 'sniff' around
-        # if there is a repository at that path
+        # if there is a repository at that path, unless we did already
+        if dirpath in self._probed_dirpaths:
+            return None
+        self._probed_dirpaths.add(dirpath)
+        if not self._session.exists(dirpath):
+            return None
         for Shim in self.SHIMS:
             lgr.log(5, "Trying %s for path %s", Shim, path)
-            shim = Shim.get_at_dirpath(self._session, dirpath) \
-                if lexists(dirpath) else None
-            if shim:
+            shim = Shim.get_at_dirpath(self._session, dirpath)
+            # a known one was considered above already
+            if shim and shim.path not in self._known_repos:
                 # so there is one nearby -- record it
                 self._known_repos[shim.path] = shim
                 # but it might still not to know about the file
@@ -99,7 +99,8 @@ class VenvTracer(DistributionTracer):
     """
 
     def _init(self):
-        self._path_root = PathRoot(self._is_venv_directory)
+        self._path_root = PathRoot(self._is_venv_directory,
+                                   self._are_venv_directories)
 
     def _get_packagefields_for_files(self, files):
         raise NotImplementedError
@@ -118,6 +119,37 @@ class VenvTracer(DistributionTracer):
             return {}, {}
         return packages, file_to_pkg
 
+    def _get_venv_index(self, venv_path):
+        """Return details of the packages and the Python of a virtualenv
+
+        The index is reused from the index cache, if any, while neither
+        site-packages/ nor the Python of the virtualenv change.
+        """
+        def build():
+            packages, file_to_pkg = self._get_package_details(venv_path)
+            if not packages:
+                return None
+            return self._build_venv_index(venv_path, packages, file_to_pkg)
+
+        index = self._get_cached_index(
+            "venv", venv_path,
+            lambda: ([venv_path + "/bin/python"]
+                     + piputils.get_site_packages_dirs(self._session,
+                                                       venv_path)),
+            build)
+        if index is None:
+            index = self._build_venv_index(venv_path, {}, {})
+        return index
+
+    def _build_venv_index(self, venv_path, packages, file_to_pkg):
+        local_pkgs = piputils.get_pip_packages(self._session,
+                                               venv_path + "/bin/pip",
+                                               restriction="local")
+        return {"packages": packages,
+                "files": file_to_pkg,
+                "local": sorted(local_pkgs),
+                "python_version": self._python_version(venv_path)}
+
     def _is_venv_directory(self, path):
         try:
             self._session.execute_command(["grep", "-q", "VIRTUAL_ENV",
@@ -128,6 +160,13 @@ class VenvTracer(DistributionTracer):
             return False
         return True
 
+    def _are_venv_directories(self, paths):
+        # Only directories with an activate script need a closer look.
+        activate = {path: path + "/bin/activate" for path in paths}
+        exists = self._session.exists_many(activate.values())
+        return {path: exists[activate[path]] and self._is_venv_directory(path)
+                for path in paths}
+
     def _get_venv_path(self, path):
         return self._path_root(path)
 
@@ -135,15 +174,15 @@ class VenvTracer(DistributionTracer):
         unknown_files = set(files)
         found_package_count = 0
 
+        self._path_root.prime(files)
         venv_paths = map(self._get_venv_path, files)
         venv_paths = set(filter(None, venv_paths))
 
         venvs = []
         for venv_path in venv_paths:
-            package_details, file_to_pkg = self._get_package_details(venv_path)
-            local_pkgs = set(piputils.get_pip_packages(self._session,
-                                                       venv_path + "/bin/pip",
-                                                       restriction="local"))
+            index = self._get_venv_index(venv_path)
+            package_details, file_to_pkg = index["packages"], index["files"]
+            local_pkgs = set(index["local"])
             pkg_to_found_files = defaultdict(list)
             for path in set(unknown_files):  # Clone the set
                 # The supplied path may be relative or absolute, but
@@ -186,7 +225,7 @@ class VenvTracer(DistributionTracer):
             venvs.append(
                 VenvEnvironment(
                     path=venv_path,
-                    python_version=self._python_version(venv_path),
+                    python_version=index["python_version"],
                     system_site_packages=any(not p.local for p in packages),
                     packages=packages))
 
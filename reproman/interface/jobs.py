@@ -9,9 +9,13 @@
 """Operate on `reproman run` jobs.
 """
 
+import collections
 from functools import partial
 import operator
 import logging
+import queue
+import threading
+import time
 import yaml
 
 from reproman.dochelpers import exc_str
@@ -21,6 +25,8 @@ from reproman.support.jobs.orchestrators import ORCHESTRATORS
 from reproman.resource import get_manager
 from reproman.support.param import Parameter
 from reproman.support.constraints import EnsureChoice
+from reproman.support.constraints import EnsureFloat
+from reproman.support.constraints import EnsureNone
 from reproman.support.exceptions import OrchestratorError
 from reproman.support.exceptions import ResourceNotFoundError
 from reproman.utils import chpwd
@@ -70,8 +76,9 @@ def match(query_id, jobids):
                              .format(query_id, ", ".join(matches)))
 
 
-def _resurrect_orc(job):
-    resource = get_manager().get_resource(job["resource_id"], "id")
+def _resurrect_orc(job, resource=None, session=None):
+    if resource is None:
+        resource = get_manager().get_resource(job["resource_id"], "id")
     try:
         # Create chpwd separately so that this try-except block doesn't cover
         # the context manager suite below.
@@ -84,22 +91,156 @@ def _resurrect_orc(job):
     with cd:
         orchestrator_class = ORCHESTRATORS[job["orchestrator"]]
         orc = orchestrator_class(resource, job["submitter"], job,
-                                 resurrection=True)
+                                 resurrection=True, session=session)
         orc.submitter.submission_id = job.get("_submission_id")
     return orc
 
 
+def _query_status(orc):
+    """Return the status of `orc`'s job and the status of its submission.
+    """
+    return orc.get_status_summary(), orc.submitter.status
+
+
+def _connect(resource_id):
+    resource = get_manager().get_resource(resource_id, "id")
+    resource.connect()
+    return resource, resource.get_session()
+
+
+def _query_statuses(orcs):
+    results = []
+    for job, orc in orcs:
+        try:
+            results.append((job, _query_status(orc)))
+        except Exception as exc:
+            results.append((job, exc))
+    return results
+
+
+def _start_daemon(results, key, fn, *args):
+    """Call `fn` in a daemon thread, putting (key, result, exception) into
+    the `results` queue.
+
+    Unlike those of `concurrent.futures`, daemon threads do not keep the
+    process alive if `fn` hangs, e.g. on an unresponsive resource.
+    """
+    def target():
+        try:
+            result = fn(*args)
+        except Exception as exc:
+            results.put((key, None, exc))
+        else:
+            results.put((key, result, None))
+
+    thread = threading.Thread(target=target, daemon=True,
+                              name="reproman-jobs-{}".format(key))
+    thread.start()
+    return thread
+
+
+def query_status_concurrently(jobs, timeout=None, max_workers=8):
+    """Query the status of `jobs`, concurrently across their resources.
+
+    The jobs on a resource share a single session and are queried one after
+    the other.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        Job records.
+    timeout : float or None, optional
+        Give up on the jobs of a resource if connecting to it and querying
+        them takes longer than this many seconds.  The queries run in daemon
+        threads, which are abandoned then.
+    max_workers : int, optional
+        Maximal number of resources to query at once.
+
+    Returns
+    -------
+    Generator of (job, queried) tuples, in the order the queries complete.
+    `queried` is either the return value of `_query_status` or the exception
+    raised when querying the job, which is a TimeoutError if the resource did
+    not respond in time.
+    """
+    groups = collections.OrderedDict()
+    for job in jobs:
+        groups.setdefault(job["resource_id"], []).append(job)
+
+    results = queue.Queue()
+    waiting = list(groups)
+    # Resource ID -> None while connecting, then the orchestrators of its
+    # jobs while querying them.
+    pending = {}
+    started = {}
+    while waiting or pending:
+        while waiting and len(pending) < max_workers:
+            rid = waiting.pop(0)
+            started[rid] = time.time()
+            pending[rid] = None
+            _start_daemon(results, rid, _connect, rid)
+        wait_for = None
+        if timeout is not None:
+            now = time.time()
+            for rid in list(pending):
+                if now - started[rid] > timeout:
+                    del pending[rid]
+                    exc = TimeoutError(
+                        "no response from resource within {} seconds"
+                        .format(timeout))
+                    for job in groups[rid]:
+                        yield job, exc
+            if not pending:
+                continue
+            # Wake up when the earliest running resource times out.
+            wait_for = max(min(started[rid] + timeout - now
+                               for rid in pending), 0.01)
+        try:
+            rid, result, exc = results.get(timeout=wait_for)
+        except queue.Empty:
+            continue
+        if rid not in pending:
+            # Came in after timing out.
+            continue
+        orcs = pending.pop(rid)
+        if exc is not None:
+            for job in groups[rid]:
+                yield job, exc
+            continue
+        if orcs is not None:
+            # Statuses of the jobs on the resource are in.
+            for item in result:
+                yield item
+            continue
+        # Connected to the resource.  Resurrecting changes the working
+        # directory, so it must be done in this thread.
+        resource, session = result
+        orcs = []
+        for job in groups[rid]:
+            try:
+                orcs.append(
+                    (job, _resurrect_orc(job, resource=resource,
+                                         session=session)))
+            except Exception as exc:
+                yield job, exc
+        pending[rid] = orcs
+        _start_daemon(results, rid, _query_statuses, orcs)
+
+
 # Action functions
 
 
-def show_oneline(job, status=False):
+def show_oneline(job, status=False, queried=None):
     """Display `job` as a single summary line.
+
+    If `status` is true, include the status of the job, as already `queried`
+    or by querying the resource now.
     """
     fmt = "{status}{j[_jobid]} on {j[resource_name]} via {j[submitter]}$ {cmd}"
     if status:
-        orc = _resurrect_orc(job)
-        orc_status = orc.status
-        _, queried_status = orc.submitter.status
+        summary, (_, queried_status) = \
+            queried or _query_status(_resurrect_orc(job))
+        orc_status = summary.summary
         if orc_status == queried_status:
             # Drop repeated status (e.g., our and condor's "running").
             queried_status = None
@@ -120,29 +261,48 @@ def show_oneline(job, status=False):
         )
 
 
-def show(job, status=False):
+def show(job, status=False, queried=None):
     """Display detailed information about `job`.
+
+    If `status` is true, include the status of the job, as already `queried`
+    or by querying the resource now.
     """
     if status:
-        orc = _resurrect_orc(job)
-        queried_normalized, queried = orc.submitter.status
-        job["status"] = {"orchestrator": orc.status,
+        summary, (queried_normalized, queried) = \
+            queried or _query_status(_resurrect_orc(job))
+        job["status"] = {"orchestrator": summary.summary,
+                         "subjobs": dict(summary.counts),
+                         "completed": summary.completed,
                          "queried": queried,
                          "queried_normalized": queried_normalized}
     print(yaml.safe_dump(job))
 
 
+def _remove_event_log(job_file):
+    """Remove the event log of the job in `job_file` from its resource.
+
+    The job is deleted locally regardless, so failing to reach the resource
+    (e.g., because it was deleted) is not an error.
+    """
+    try:
+        _resurrect_orc(_load(job_file)).remove_event_log()
+    except Exception as exc:
+        lgr.debug("Failed to remove event log of job in %s: %s",
+                  job_file, exc_str(exc))
+
+
 def fetch(job):
     """Fetch `job` locally.
     """
     orc = _resurrect_orc(job)
-    if orc.has_completed:
+    summary = orc.get_status_summary()
+    if summary.completed:
         orc.fetch()
         LREG.unregister(orc.jobid)
     else:
         lgr.warning("Not fetching incomplete job %s [status: %s]",
                     job["_jobid"],
-                    orc.status or "unknown")
+                    summary.summary or "unknown")
 
 
 class Jobs(Interface):
@@ -154,7 +314,8 @@ class Jobs(Interface):
 
       - show: Display more information for each job over multiple lines
 
-      - delete: Unregister a job locally
+      - delete: Unregister a job locally and remove its event log from the
+        resource
 
       - fetch: Fetch a completed job
 
@@ -183,12 +344,20 @@ class Jobs(Interface):
             args=("-s", "--status"),
             action="store_true",
             doc="""Query the resource for status information when listing or
-            showing jobs"""),
+            showing jobs.  Resources are queried concurrently, and the jobs
+            are displayed as their status comes in."""),
+        timeout=Parameter(
+            args=("--timeout",),
+            metavar="SECONDS",
+            constraints=EnsureFloat() | EnsureNone(),
+            doc="""When querying the status, give up on the jobs of a
+            resource that doesn't respond within this many seconds."""),
         # TODO: Add ability to restrict to resource.
     )
 
     @staticmethod
-    def __call__(queries, action="auto", all_=False, status=False):
+    def __call__(queries, action="auto", all_=False, status=False,
+                 timeout=120):
         job_files = LREG.find_job_files()
 
         if not job_files:
@@ -214,6 +383,7 @@ class Jobs(Interface):
         # We don't need to load the job to delete it, so check that first.
         if action == "delete":
             for i in matched_ids:
+                _remove_event_log(job_files[i])
                 LREG.unregister(i)
         else:
             jobs = [_load(job_files[i]) for i in matched_ids or job_files]
@@ -227,11 +397,25 @@ class Jobs(Interface):
             else:
                 raise RuntimeError("Unknown action: {}".format(action))
 
-            for job in jobs:
+            if status and fn is not fetch:
+                items = query_status_concurrently(jobs, timeout=timeout)
+            else:
+                items = ((job, None) for job in jobs)
+
+            for job, queried in items:
                 try:
-                    fn(job)
+                    if isinstance(queried, Exception):
+                        raise queried
+                    elif queried is None:
+                        fn(job)
+                    else:
+                        fn(job, queried=queried)
                 except OrchestratorError as exc:
                     lgr.error("job %s failed: %s", job["_jobid"], exc_str(exc))
                 except ResourceNotFoundError:
                     lgr.error("Resource %s (%s) no longer exists",
                               job["resource_id"], job["resource_name"])
+                except TimeoutError as exc:
+                    lgr.error("Failed to query status of job %s on %s: %s",
+                              job["_jobid"], job["resource_name"],
+                              exc_str(exc))
@@ -18,6 +18,8 @@ from reproman.resource.session import Session
 from .common_opts import resref_opt
 from .common_opts import resref_type_opt
 from .base import Interface
+from ..distributions.index_cache import IndexCache
+from ..support.constraints import EnsureInt
 from ..support.constraints import EnsureNone
 from ..support.constraints import EnsureStr
 from ..support.exceptions import InsufficientArgumentsError
@@ -73,13 +75,43 @@ class Retrace(Interface):
             instance can be passed as the value for `resref`.  PY]""",
             constraints=EnsureStr() | EnsureNone()),
         resref_type=resref_type_opt,
+        use_agent=Parameter(
+            args=("--use-agent",),
+            action="store_true",
+            doc="""Serve file system queries through a single persistent helper
+            process started within the resource instead of running a command
+            per query.  This considerably speeds up tracing many paths on
+            remote resources, and requires Python within the resource."""),
+        jobs=Parameter(
+            args=("-j", "--jobs"),
+            metavar="N",
+            doc="""Number of tracers to probe the environment concurrently.
+            Files are still assigned to packages by one tracer at a time, in
+            the order of the tracers.""",
+            constraints=EnsureInt() | EnsureNone()),
+        since=Parameter(
+            args=("--since",),
+            metavar="SPEC",
+            doc="""ReproMan spec produced by a previous retrace.  Files which
+            it assigns to packages still installed at the same version are
+            not looked up again.  ATM only Debian and RPM packages are
+            verified, files of other distributions are traced anew.""",
+            constraints=EnsureStr() | EnsureNone()),
+        skip_index_cache=Parameter(
+            args=("--skip-index-cache",),
+            action="store_true",
+            doc="""Neither reuse nor persist the indexes of package databases
+            (e.g., of conda environments or virtualenvs).  By default, these
+            are kept under the user cache directory and reused while the
+            package database of an environment stays unchanged."""),
     )
 
     # TODO: add a session/resource so we could trace within
     # arbitrary sessions
     @staticmethod
     def __call__(path=None, spec=None, output_file=None,
-                 resref=None, resref_type="auto"):
+                 resref=None, resref_type="auto", use_agent=False,
+                 jobs=None, since=None, skip_index_cache=False):
         # heavy import -- should be delayed until actually used
 
         if not (spec or path):
@@ -103,6 +135,13 @@ class Retrace(Interface):
         # The tracers assume normalized paths.
         paths = list(map(normpath, paths))
 
+        previous_distributions = None
+        if since:
+            lgr.info("reading previous spec file %s", since)
+            from reproman.formats.reproman import RepromanProvenance
+            previous_distributions = \
+                RepromanProvenance(since).get_distributions()
+
         if isinstance(resref, Session):
             # TODO: Special case for Python callers.  Is this something we want
             # to handle more generally at the interface level?
@@ -117,10 +156,27 @@ class Retrace(Interface):
         #       Generalize
         # TODO: RF so that only the above portion is reprozip specific.
         # If we are to reuse their layout largely -- the rest should stay as is
-        (distributions, files) = identify_distributions(
-            paths,
-            session=session
-        )
+        agent_started = use_agent and session.start_agent()
+        if use_agent and not agent_started:
+            lgr.warning("Could not start an agent, running commands instead")
+        # Tracers probe the same paths over and over again, and nothing
+        # should change the file system while we are tracing.
+        cache_enabled = session.cache is None
+        session.enable_cache()
+        try:
+            (distributions, files) = identify_distributions(
+                paths,
+                session=session,
+                jobs=jobs,
+                index_cache=None if skip_index_cache else IndexCache(),
+                previous_distributions=previous_distributions
+            )
+        finally:
+            # Leave an agent alone if the caller handed us the session.
+            if agent_started and not isinstance(resref, Session):
+                session.stop_agent()
+            if cache_enabled:
+                session.disable_cache()
         from reproman.distributions.base import EnvironmentSpec
         spec = EnvironmentSpec(
             distributions=distributions,
@@ -139,13 +195,22 @@ class Retrace(Interface):
 # TODO: session should be with a state.  Idea is that if we want
 #  to trace while inheriting all custom PATHs which that run might have
 #  had
-def identify_distributions(files, session=None, tracer_classes=None):
+def identify_distributions(files, session=None, tracer_classes=None,
+                           jobs=None, index_cache=None,
+                           previous_distributions=None):
     """Identify packages files belong to
 
     Parameters
     ----------
     files : iterable
       Files to consider
+    jobs : int, optional
+      Number of tracers to run `detect` concurrently
+    index_cache : IndexCache, optional
+      Cache for the tracers to persist indexes of environments in
+    previous_distributions : list of Distribution, optional
+      Distributions identified previously, e.g. by an earlier retrace.  Files
+      of their packages which are still installed are not looked up again.
 
     Returns
     -------
@@ -167,6 +232,12 @@ def identify_distributions(files, session=None, tracer_classes=None):
     # as they identify files belonging to them
     files_to_consider = set(files)
 
+    # Tracers are instantiated anew on every iteration, but whether they apply
+    # to the environment needs to be figured out only once.
+    detections = detect_tracers(tracer_classes, session, jobs=jobs)
+    # Likewise, verify only once which previous package assignments hold.
+    reusable = {}
+
     distributions = []
     files_processed = set()
     files_to_trace = files_to_consider
@@ -186,9 +257,10 @@ def identify_distributions(files, session=None, tracer_classes=None):
 
         for Tracer in tracer_classes:
             lgr.debug("Tracing using %s", Tracer.__name__)
-            # TODO: memoize across all loops
-            # Identify directories from the files_to_consider
-            dirs = set(filter(session.isdir, files_to_trace))
+            # Identify directories from the files_to_consider.  Repeated
+            # queries are answered by the session cache if it is enabled.
+            dirs = {f for f, isdir in session.isdir_many(files_to_trace).items()
+                    if isdir}
 
             # Pull out directories if the tracer can't handle them
             if Tracer.HANDLES_DIRS:
@@ -198,12 +270,19 @@ def identify_distributions(files, session=None, tracer_classes=None):
                 files_to_trace = files_to_consider - dirs
                 files_skipped = files_to_consider - files_to_trace
 
-            tracer = Tracer(session=session)
+            tracer = Tracer(session=session, index_cache=index_cache)
+            if Tracer in detections:
+                tracer.detected = detections[Tracer]
+            if previous_distributions and detections.get(Tracer, True):
+                if Tracer not in reusable:
+                    reusable[Tracer] = tracer.get_reusable_packagefields(
+                        previous_distributions)
+                tracer.reused_packagefields = reusable[Tracer]
             begin = time.time()
             # yoh things the idea was that tracer might trace even without
             #     files, so we should not just 'continue' the loop if there is no
             #     files_to_trace
-            if files_to_trace:
+            if files_to_trace and detections.get(Tracer, True):
                 remaining_files_to_trace = files_to_trace
                 nenvs = 0
                 for env, remaining_files_to_trace in tracer.identify_distributions(
@@ -231,6 +310,43 @@ def identify_distributions(files, session=None, tracer_classes=None):
     return distributions, files_to_consider
 
 
+def detect_tracers(tracer_classes, session, jobs=None):
+    """Run `detect` of the tracers, possibly concurrently
+
+    Parameters
+    ----------
+    tracer_classes : list of DistributionTracer classes
+    session : Session
+    jobs : int, optional
+      Number of detections to run at the same time.
+
+    Returns
+    -------
+    dict
+      Maps tracer classes with `detect` to its results.
+    """
+    # Tracers not derived from DistributionTracer might lack `detect`.  The
+    # caller then traces with them unconditionally.
+    tracers = [Tracer(session=session) for Tracer in tracer_classes
+               if hasattr(Tracer, "detect")]
+
+    def detect(tracer):
+        begin = time.time()
+        detected = tracer.detected
+        lgr.debug("Detection by %s took %f seconds: %s",
+                  tracer.__class__.__name__, time.time() - begin, detected)
+        return detected
+
+    if jobs and jobs > 1 and len(tracers) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(detect, tracers))
+    else:
+        results = list(map(detect, tracers))
+    return {tracer.__class__: detected
+            for tracer, detected in zip(tracers, results)}
+
+
 def get_tracer_classes():
     """A helper which returns a list of all available Tracers
 
@@ -12,14 +12,19 @@
 from argparse import REMAINDER
 import collections
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import copy
 import glob
 import logging
 import itertools
 import textwrap
+import threading
 import yaml
 
 from shlex import quote as shlex_quote
 
+from reproman.dochelpers import exc_str
 from reproman.interface.base import Interface
 from reproman.interface.common_opts import resref_opt
 from reproman.interface.common_opts import resref_type_opt
@@ -27,6 +32,7 @@ from reproman.support.constraints import EnsureChoice
 from reproman.support.exceptions import InsufficientArgumentsError
 from reproman.support.exceptions import JobError
 from reproman.support.jobs.local_registry import LocalRegistry
+from reproman.support.jobs.orchestrators import DataladOrchestrator
 from reproman.support.jobs.orchestrators import Orchestrator
 from reproman.support.jobs.orchestrators import ORCHESTRATORS
 from reproman.support.jobs.submitters import SUBMITTERS
@@ -109,7 +115,8 @@ def _combine_batch_params(params):
 
     Returns
     -------
-    A generator that yields a record, computing the product from the values.
+    An iterator that yields a record, computing the product from the values
+    as it goes, so that large products are never held in memory.
 
     >>> from pprint import pprint
     >>> params = ["k0=val1,val2,val3", "k1=val4,val5"]
@@ -122,13 +129,15 @@ def _combine_batch_params(params):
      {'k0': 'val3', 'k1': 'val5'}]
     """
     if not params:
-        return
+        return iter([])
+    # Parse the parameters right away, so that invalid ones are reported
+    # before any records are consumed.
+    values = list(_parse_batch_params(params))
     # Note: If we want to support pairing the ith elements rather than taking
     # the product, we could add a parameter that signals to use zip() rather
     # than product(). If we do that, we'll also want to check that the values
     # for each key are the same length, probably in _parse_batch_params().
-    for i in itertools.product(*_parse_batch_params(params)):
-        yield dict(i)
+    return map(dict, itertools.product(*values))
 
 
 def _resolve_batch_parameters(spec_file, params):
@@ -143,7 +152,9 @@ def _resolve_batch_parameters(spec_file, params):
 
     Returns
     -------
-    List of records or None if neither `spec_file` or `params` is specified.
+    Iterable of records or None if neither `spec_file` or `params` is
+    specified.  Records of `params` are generated lazily, so the result can
+    be iterated over only once.
     """
     if spec_file and params:
         raise ValueError(
@@ -154,10 +165,64 @@ def _resolve_batch_parameters(spec_file, params):
         with open(spec_file) as pf:
             resolved = yaml.safe_load(pf)
     elif params:
-        resolved = list(_combine_batch_params(params))
+        resolved = _combine_batch_params(params)
     return resolved
 
 
+def _resolve_job_spec(spec, command=None):
+    """Resolve the batch parameters, command, and orchestrator of `spec`.
+
+    Parameters
+    ----------
+    spec : dict
+        Combined job spec.  It is updated in place.
+    command : list of str, optional
+        Command given via the CLI, which takes precedence over the one in
+        `spec`.
+    """
+    spec["_resolved_batch_parameters"] = _resolve_batch_parameters(
+        spec.get("batch_spec"), spec.get("batch_parameters"))
+
+    # Treat "command" as a special case because it's a list and the
+    # template expects a string.
+    if not command and "command_str" in spec:
+        spec["_resolved_command_str"] = spec["command_str"]
+    elif not command and "command" not in spec:
+        raise InsufficientArgumentsError(
+            "No command specified via CLI or job spec")
+    else:
+        command = command or spec["command"]
+        # Unlike datalad run, we're only accepting a list form for now.
+        spec["command"] = command
+        spec["_resolved_command_str"] = " ".join(map(shlex_quote, command))
+
+    if "orchestrator" not in spec:
+        # TODO: We could just set this as the default for the Parameter,
+        # but it probably makes sense to have the default configurable per
+        # resource.
+        lgr.debug("No orchestrator specified; setting to 'plain'")
+        spec["orchestrator"] = "plain"
+    if spec["orchestrator"] not in ORCHESTRATORS:
+        raise ValueError("Unknown orchestrator {!r}; expected one of {}"
+                         .format(spec["orchestrator"],
+                                 ", ".join(ORCHESTRATORS)))
+
+
+def _resolve_resource_ref(spec, resref=None, resref_type="auto"):
+    """Return the resource reference and its type for `spec`.
+
+    `resref`, if given, takes precedence over the resource in `spec`.
+    """
+    if resref is None:
+        if "resource_id" in spec:
+            return spec["resource_id"], "id"
+        elif "resource_name" in spec:
+            return spec["resource_name"], "name"
+        else:
+            raise InsufficientArgumentsError("No resource specified")
+    return resref, resref_type
+
+
 JOB_PARAMETERS = collections.OrderedDict(
     [
         ("root_directory", Orchestrator.root_directory),
@@ -194,6 +259,24 @@ JOB_PARAMETERS = collections.OrderedDict(
          """Container to use for execution. This should match the name of a container
          registered with the datalad-container extension. This option is valid
          only for DataLad run orchestrators."""),
+        ("fetch_mode",
+         """How plain orchestrators fetch outputs and the status, stdout, and
+         stderr files of subjobs: "full" (the default) fetches all of them,
+         "delta" only the files whose size or modification time differs from
+         the local copy, and "checksum" only those whose size or content
+         differs."""),
+        ("input_store",
+         """If set to "hardlink" or "symlink", plain orchestrators upload
+         inputs to a store under the root directory, keyed by their content,
+         and link them into the working directory.  Inputs already in the
+         store are not uploaded again.  Hardlinks fall back to symlinks
+         across file systems.  Commands must not modify such inputs in
+         place."""),
+        ("submit_mode",
+         """How the runscript, submission script, and other files of a job
+         are sent to the resource: "files" (the default) uploads them one by
+         one, "bundle" sends them as a single archive that is unpacked by the
+         same command that submits the job."""),
         # TODO: Add more information for the rest of these.
         ("memory, num_processes",
          """Supported by Condor and PBS submitters."""),
@@ -209,6 +292,138 @@ JOB_PARAMETERS = collections.OrderedDict(
 )
 
 
+def submit_jobs(specs, command=None, resref=None, resref_type="auto",
+                max_workers=8):
+    """Prepare and submit a separate job for each of `specs`.
+
+    Unlike calling `run` for each spec, jobs on the same resource share a
+    single connection and session, and the default root directory is
+    determined only once per resource.  The jobs of a resource are prepared
+    and submitted one after the other, while different resources are
+    handled concurrently.  All submitted jobs are then registered at once.
+
+    Parameters
+    ----------
+    specs : list of dict
+        Combined job specs, as `run` would build from job spec files and
+        parameters.  They are updated in place.
+    command : list of str, optional
+        Command for all jobs, taking precedence over the specs.
+    resref, resref_type : optional
+        Resource for all jobs, taking precedence over the "resource_id" or
+        "resource_name" of the specs.
+    max_workers : int, optional
+        Maximal number of resources to handle concurrently.
+
+    Returns
+    -------
+    List of orchestrators of the submitted jobs, in the order of `specs`.
+
+    Raises
+    ------
+    JobError
+        If some of the jobs could not be submitted.  Those that were are
+        still registered.
+    """
+    orcs = _submit_jobs(specs, command, resref, resref_type, max_workers)
+    _check_submitted(orcs)
+    return orcs
+
+
+def _submit_jobs(specs, command=None, resref=None, resref_type="auto",
+                 max_workers=8):
+    """Like `submit_jobs`, but with None in place of jobs that failed.
+    """
+    manager = get_manager()
+    resources = {}
+    groups = collections.OrderedDict()
+    # Resolve everything up front, so invalid specs do not leave a partially
+    # submitted batch behind.
+    for idx, spec in enumerate(specs):
+        _resolve_job_spec(spec, command)
+        ref = _resolve_resource_ref(spec, resref, resref_type)
+        if ref not in resources:
+            resources[ref] = manager.get_resource(*ref)
+        resource = resources[ref]
+        groups.setdefault(resource.id, (resource, []))[1].append(idx)
+
+    orcs = [None] * len(specs)
+    # DataLad orchestrators all operate on the local dataset (commits,
+    # configuration, pushes) and set the SSH identity in the process
+    # environment, so only plain orchestrators run concurrently.
+    datalad_lock = threading.Lock()
+
+    def submit_group(resource, indices):
+        resource.connect()
+        session = resource.get_session()
+        default_root = None
+        for idx in indices:
+            spec = specs[idx]
+            use_default_root = not spec.get("root_directory")
+            if use_default_root and default_root:
+                spec["root_directory"] = default_root
+            orchestrator_class = ORCHESTRATORS[spec["orchestrator"]]
+            if issubclass(orchestrator_class, DataladOrchestrator):
+                lock = datalad_lock
+            else:
+                lock = contextlib.nullcontext()
+            try:
+                with lock:
+                    orc = orchestrator_class(
+                        resource, spec.get("submitter"), spec,
+                        session=session)
+                    if use_default_root:
+                        default_root = orc.root_directory
+                    orc.prepare_remote()
+                    orc.submit()
+            except Exception as exc:
+                lgr.error("Failed to submit job %d to %s: %s",
+                          idx, resource.name, exc_str(exc))
+                continue
+            orcs[idx] = orc
+
+    with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(groups)))) as executor:
+        futures = [executor.submit(submit_group, resource, indices)
+                   for resource, indices in groups.values()]
+    for future, (resource, _) in zip(futures, groups.values()):
+        exc = future.exception()
+        if exc is not None:
+            lgr.error("Failed to submit jobs to %s: %s",
+                      resource.name, exc_str(exc))
+
+    submitted = [orc for orc in orcs if orc is not None]
+    if submitted:
+        LocalRegistry().register_many(
+            [(orc.jobid, orc.as_dict()) for orc in submitted])
+    return orcs
+
+
+def _check_submitted(orcs):
+    """Raise JobError if any of `orcs` (from `_submit_jobs`) failed.
+    """
+    failed = [idx for idx, orc in enumerate(orcs) if orc is None]
+    if failed:
+        raise JobError("Failed to submit {} of {} jobs (specs {})"
+                       .format(len(failed), len(orcs),
+                               ", ".join(map(str, failed))))
+
+
+def _fetch_followed(orc, lreg, on_remote_finish=None):
+    """Follow `orc`, fetch its results, and unregister it from `lreg`.
+
+    Returns
+    -------
+    List of failed subjobs.
+    """
+    orc.follow()
+    orc.fetch(on_remote_finish=on_remote_finish)
+    lreg.unregister(orc.jobid)
+    # TODO: this would duplicate what is done in each .fetch
+    # implementation above anyways.  We might want to make
+    # fetch return a record with fetched content and failed subjobs
+    return orc.get_failed_subjobs()
+
 _more_than_once_doc = " [CMD: This option can be given more than once. CMD]"
 
 
@@ -261,6 +476,18 @@ class Run(Interface):
             doc=(JOB_PARAMETERS["batch_parameters"] +
                  " See [CMD: --batch-spec CMD][PY: `batch_spec` PY]"
                  " for specifying more complex records." + _more_than_once_doc)),
+        batch_jobs=Parameter(
+            args=("--batch-jobs", "--bj"),
+            dest="batch_jobs",
+            metavar="PATH",
+            doc="""YAML file that defines a list of job specs. A separate job
+            is submitted for each of them, e.g. to run on different resources
+            or with different submitters. Each spec takes precedence over
+            the files given via [CMD: --job-spec CMD][PY: `job_specs` PY],
+            whereas job parameters and other options take precedence over
+            it. Jobs on the same resource share a single session. Only
+            [CMD: --follow CMD][PY: `follow=True` PY] is supported as a follow
+            action."""),
         job_specs=Parameter(
             args=("--job-spec", "--js"),
             dest="job_specs",
@@ -324,7 +551,7 @@ class Run(Interface):
     def __call__(command=None, message=None,
                  resref=None, resref_type="auto",
                  list_=None, submitter=None, orchestrator=None,
-                 batch_spec=None, batch_parameters=None,
+                 batch_spec=None, batch_parameters=None, batch_jobs=None,
                  job_specs=None, job_parameters=None,
                  inputs=None, outputs=None,
                  follow=False):
@@ -359,8 +586,9 @@ class Run(Interface):
             print("\n".join(items))
             return
 
-        # TODO: globbing for inputs/outputs and command string formatting is
-        # only supported for DataLad-based orchestrators.
+        # TODO: command string formatting other than with batch records
+        # ("{p[KEY]}"), e.g. "{inputs}", is only supported for DataLad-based
+        # orchestrators.
 
         # CLI things that can also be specified in spec.
         cli_spec = {
@@ -379,44 +607,46 @@ class Run(Interface):
 
         job_parameters = parse_kv_list(job_parameters)
 
-        # Precedence: CLI option > CLI job parameter > spec file
+        # Precedence: CLI option > CLI job parameter > batch job > spec file
+        if batch_jobs:
+            if follow not in (False, True):
+                raise ValueError(
+                    "Follow action {!r} is not supported with batch jobs"
+                    .format(follow))
+            base_specs = _load_specs(job_specs or [])
+            with open(batch_jobs) as fh:
+                records = yaml.safe_load(fh)
+            orcs = _submit_jobs(
+                [_combine_job_specs(copy.deepcopy(
+                    base_specs + [record, job_parameters, cli_spec]))
+                 for record in records],
+                command, resref, resref_type)
+            if follow:
+                # Follow the jobs that were submitted even if others failed.
+                lreg = LocalRegistry()
+                failed = []
+                for orc in orcs:
+                    if orc is not None:
+                        subjobs = _fetch_followed(orc, lreg)
+                        if subjobs:
+                            failed.append(
+                                "{} (subjobs {})".format(
+                                    orc.jobid, ", ".join(map(str, subjobs))))
+                _check_submitted(orcs)
+                if failed:
+                    raise JobError("Failed jobs: " + "; ".join(failed))
+            else:
+                _check_submitted(orcs)
+            return
+
         spec = _combine_job_specs(_load_specs(job_specs or []) +
                                   [job_parameters, cli_spec])
+        _resolve_job_spec(spec, command)
 
-        spec["_resolved_batch_parameters"] = _resolve_batch_parameters(
-            spec.get("batch_spec"), spec.get("batch_parameters"))
-
-        # Treat "command" as a special case because it's a list and the
-        # template expects a string.
-        if not command and "command_str" in spec:
-            spec["_resolved_command_str"] = spec["command_str"]
-        elif not command and "command" not in spec:
-            raise InsufficientArgumentsError(
-                "No command specified via CLI or job spec")
-        else:
-            command = command or spec["command"]
-            # Unlike datalad run, we're only accepting a list form for now.
-            spec["command"] = command
-            spec["_resolved_command_str"] = " ".join(map(shlex_quote, command))
-
-        if resref is None:
-            if "resource_id" in spec:
-                resref = spec["resource_id"]
-                resref_type = "id"
-            elif "resource_name" in spec:
-                resref = spec["resource_name"]
-                resref_type = "name"
-            else:
-                raise InsufficientArgumentsError("No resource specified")
         manager = get_manager()
-        resource = manager.get_resource(resref, resref_type)
-
-        if "orchestrator" not in spec:
-            # TODO: We could just set this as the default for the Parameter,
-            # but it probably makes sense to have the default configurable per
-            # resource.
-            lgr.debug("No orchestrator specified; setting to 'plain'")
-            spec["orchestrator"] = "plain"
+        resource = manager.get_resource(
+            *_resolve_resource_ref(spec, resref, resref_type))
+
         orchestrator_class = ORCHESTRATORS[spec["orchestrator"]]
         orc = orchestrator_class(resource, spec.get("submitter"), spec)
 
@@ -428,7 +658,6 @@ class Run(Interface):
         lreg.register(orc.jobid, orc.as_dict())
 
         if follow:
-            orc.follow()
             if follow is True:
                 remote_fn = None
             else:
@@ -449,11 +678,6 @@ class Run(Interface):
                         manager.stop(res)
                         if do_delete:
                             manager.delete(res)
-            orc.fetch(on_remote_finish=remote_fn)
-            lreg.unregister(orc.jobid)
-            # TODO: this would duplicate what is done in each .fetch
-            # implementation above anyways.  We might want to make
-            # fetch return a record with fetched content and failed subjobs
-            failed = orc.get_failed_subjobs()
+            failed = _fetch_followed(orc, lreg, on_remote_finish=remote_fn)
             if failed:
                 raise JobError(failed=failed)
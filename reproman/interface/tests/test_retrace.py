@@ -18,6 +18,7 @@ from reproman.tests.utils import (
 )
 from reproman.tests.skip import mark
 
+from ..retrace import detect_tracers
 from ..retrace import identify_distributions
 
 def test_retrace(reprozip_spec2):
@@ -32,6 +33,26 @@ def test_retrace(reprozip_spec2):
         assert_in("reading spec file " + reprozip_spec2, log.lines)
 
 
+def test_retrace_use_agent(reprozip_spec2):
+    with make_tempfile() as outfile, \
+            swallow_logs(new_level=logging.DEBUG) as log:
+        main(['retrace', '--use-agent',
+              '--spec', reprozip_spec2,
+              '--output-file', outfile])
+        assert_in("Started agent for ShellSession", log.lines)
+        provenance = Provenance.factory(outfile)
+        assert len(provenance.get_distributions()) == 1
+
+
+def test_retrace_jobs(reprozip_spec2):
+    with make_tempfile() as outfile:
+        main(['retrace', '--jobs', '3',
+              '--spec', reprozip_spec2,
+              '--output-file', outfile])
+        provenance = Provenance.factory(outfile)
+        assert len(provenance.get_distributions()) == 1
+
+
 def test_retrace_to_output_file(reprozip_spec2):
     with make_tempfile() as outfile:
         args = ['retrace',
@@ -56,12 +77,12 @@ def test_retrace_normalize_paths():
 def get_tracer_session(protocols):
     class FakeSession(object):
         """A fake session attributes and methods of which should not
-        actually be used only but isdir.
+        actually be used only but isdir_many.
         If anything else is accessed, it means that we have some assumptions
         """
 
-        def isdir(self, _):
-            return False  # TODO: make it parametric
+        def isdir_many(self, paths):
+            return {p: False for p in paths}  # TODO: make it parametric
 
     tracer_classes = []
     for itracer, protocol in enumerate(protocols):
@@ -70,7 +91,7 @@ def get_tracer_session(protocols):
             _protocol = protocol[:]
             HANDLES_DIRS = False  # ???
 
-            def __init__(self, session):
+            def __init__(self, session, index_cache=None):
                 assert session
                 assert self._protocol, \
                     "No more protocols to go through, but were were asked to"
@@ -149,4 +170,91 @@ def test_retrace_loop_over_tracers():
         ],
         files=["file1", "file2"],
         tenvs=['Env1', 'Env2', 'Env2.1', 'Env3'],
-        tfiles={'file3'})
\ No newline at end of file
+        tfiles={'file3'})
+
+
+def test_retrace_detect_once():
+    import threading
+    from reproman.distributions.base import DistributionTracer
+
+    class FakeSession(object):
+        def isdir_many(self, paths):
+            return {p: False for p in paths}
+
+    detect_threads = []
+
+    def make_tracer(applies, claims):
+        class DetectingTracer(DistributionTracer):
+            HANDLES_DIRS = False
+
+            def detect(self):
+                detect_threads.append(threading.current_thread().name)
+                return applies
+
+            def identify_distributions(self, files):
+                assert self.detected, "should not be called"
+                if claims in files:
+                    yield "Env-" + claims, files - {claims}
+
+            _create_package = _get_packagefields_for_files = None
+        return DetectingTracer
+
+    tracer_classes = [make_tracer(False, "f1"), make_tracer(True, "f2")]
+    session = FakeSession()
+    assert detect_tracers(tracer_classes, session, jobs=2) == {
+        tracer_classes[0]: False, tracer_classes[1]: True}
+    assert len(detect_threads) == 2
+    del detect_threads[:]
+
+    dists, unknown_files = identify_distributions(
+        ["f1", "f2"], session, tracer_classes=tracer_classes, jobs=2)
+    assert dists == ["Env-f2"]
+    assert unknown_files == {"f1"}
+    # detect() ran once per tracer despite multiple iterations.
+    assert len(detect_threads) == 2
+
+
+def test_retrace_previous_distributions():
+    from reproman.distributions.base import DistributionTracer
+
+    class FakeSession(object):
+        def isdir_many(self, paths):
+            return {p: False for p in paths}
+
+    class FakePackage(object):
+        def __init__(self, name):
+            self.name = name
+            self.files = []
+
+    queried = []
+    verified = []
+
+    class ReusingTracer(DistributionTracer):
+        HANDLES_DIRS = False
+
+        def get_reusable_packagefields(self, distributions):
+            verified.append(distributions)
+            return {"old": {"name": "pkg"}, "gone": {"name": "pkg"}}
+
+        def identify_distributions(self, files):
+            packages, unknown_files = self.identify_packages_from_files(files)
+            if packages:
+                yield packages, unknown_files
+
+        def _get_packagefields_for_files(self, files):
+            queried.extend(files)
+            return {f: {"name": "pkg"} for f in files if f.startswith("new")}
+
+        def _create_package(self, name):
+            return FakePackage(name)
+
+    dists, unknown_files = identify_distributions(
+        ["old", "new", "other"], FakeSession(),
+        tracer_classes=[ReusingTracer],
+        previous_distributions=["previous"])
+    # Verified once, even though the remaining file is traced again.
+    assert verified == [["previous"]]
+    assert sorted(queried) == ["new", "other", "other"]
+    [[pkg]] = dists
+    assert sorted(pkg.files) == ["new", "old"]
+    assert unknown_files == {"other"}
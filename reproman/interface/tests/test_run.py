@@ -14,15 +14,19 @@ from unittest.mock import patch
 import os
 import os.path as op
 import shutil
+import threading
 import time
+import yaml
 
 import pytest
 
 from reproman.api import jobs
 from reproman.api import run
+from reproman.interface import jobs as jobs_mod
 from reproman.interface.run import _combine_batch_params
 from reproman.interface.run import _combine_job_specs
 from reproman.interface.run import _resolve_batch_parameters
+from reproman.resource.shell import Shell
 from reproman.utils import chpwd
 from reproman.utils import swallow_logs
 from reproman.utils import swallow_outputs
@@ -160,6 +164,9 @@ def test_resolve_batch_params_eq(tmpdir, params, spec):
         fh.write(spec)
     from_param_str = _resolve_batch_parameters(spec_file=None, params=params)
     from_spec = _resolve_batch_parameters(spec_file=fname, params=None)
+    if from_param_str is not None:
+        # Records from parameters are generated lazily.
+        from_param_str = list(from_param_str)
     assert from_param_str == from_spec
 
 
@@ -285,11 +292,19 @@ def test_run_and_fetch(context):
     with swallow_outputs() as output:
         jobs(queries=[], status=True)
         assert "myshell" in output.out
-        assert len(registry.find_job_files()) == 1
+        jobfiles = registry.find_job_files()
+        assert len(jobfiles) == 1
+        jobid, jobfile = list(jobfiles.items())[0]
+        with open(jobfile) as fh:
+            event_log = op.join(yaml.safe_load(fh)["root_directory"],
+                                "events", jobid)
         try_fetch(lambda: jobs(queries=[], action="fetch", all_=True))
         assert len(registry.find_job_files()) == 0
 
     assert op.exists(op.join(path, "ok"))
+    # The event log does not pile up on the resource.
+    assert op.isdir(op.dirname(event_log))
+    assert not op.exists(event_log)
 
 
 def test_run_and_follow(context):
@@ -309,6 +324,85 @@ def test_run_and_follow(context):
     assert op.exists(op.join(path, "ok"))
 
 
+def test_run_batch_jobs(context):
+    path = context["directory"]
+    run = context["run_fn"]
+    jobs = context["jobs_fn"]
+    registry = context["registry"]
+
+    create_tree(
+        path,
+        tree={"jobs.yaml": ("- command_str: 'touch a'\n"
+                            "  outputs: [a]\n"
+                            "- command: [touch, b]\n"
+                            "  outputs: [b]\n"),
+              "js.yaml": "resource_name: myshell\n"})
+
+    with patch.object(Shell, "get_session", autospec=True,
+                      side_effect=Shell.get_session) as get_session:
+        run(job_specs=["js.yaml"], batch_jobs="jobs.yaml")
+    # Both jobs went through a single session.
+    assert get_session.call_count == 1
+    assert len(registry.find_job_files()) == 2
+
+    with swallow_outputs():
+        try_fetch(lambda: jobs(queries=[], action="fetch", all_=True))
+    assert not registry.find_job_files()
+    assert op.exists(op.join(path, "a"))
+    assert op.exists(op.join(path, "b"))
+
+
+def test_run_batch_jobs_partial_failure(context):
+    path = context["directory"]
+    run = context["run_fn"]
+    registry = context["registry"]
+
+    create_tree(
+        path,
+        tree={"jobs.yaml": ("- command: [touch, a]\n"
+                            "  outputs: [a]\n"
+                            "- command: [touch, b]\n"
+                            "  submitter: nonexistent\n")})
+
+    with pytest.raises(JobError) as exc:
+        run(resref="myshell", batch_jobs="jobs.yaml")
+    assert "1 of 2 jobs (specs 1)" in str(exc.value)
+    # The job that was submitted is still registered.
+    assert len(registry.find_job_files()) == 1
+
+    # With --follow, the submitted job is still followed and fetched.
+    with pytest.raises(JobError) as exc:
+        run(resref="myshell", batch_jobs="jobs.yaml", follow=True)
+    assert "1 of 2 jobs (specs 1)" in str(exc.value)
+    assert len(registry.find_job_files()) == 1
+    assert op.exists(op.join(path, "a"))
+
+    with pytest.raises(ValueError):
+        run(resref="myshell", batch_jobs="jobs.yaml", follow="stop")
+
+
+def test_run_batch_jobs_follow(context):
+    path = context["directory"]
+    run = context["run_fn"]
+    registry = context["registry"]
+
+    create_tree(
+        path,
+        tree={"jobs.yaml": ("- command: [touch, a]\n"
+                            "  outputs: [a]\n"
+                            "- command: ['false']\n"
+                            "- command: [touch, b]\n"
+                            "  outputs: [b]\n")})
+
+    with pytest.raises(JobError) as exc:
+        run(resref="myshell", batch_jobs="jobs.yaml", follow=True)
+    assert "(subjobs 0)" in str(exc.value)
+    # All jobs were followed, fetched, and unregistered.
+    assert not registry.find_job_files()
+    assert op.exists(op.join(path, "a"))
+    assert op.exists(op.join(path, "b"))
+
+
 @pytest.mark.parametrize("action",
                          ["stop", "stop-if-success",
                           "delete", "delete-if-success"])
@@ -385,10 +479,20 @@ def test_jobs_delete(context):
     jobfiles = registry.find_job_files()
     assert len(jobfiles) == 1
     jobid = list(jobfiles.keys())[0]
+    with open(jobfiles[jobid]) as fh:
+        event_log = op.join(yaml.safe_load(fh)["root_directory"],
+                            "events", jobid)
+    for _ in range(50):
+        if op.exists(event_log):
+            break
+        time.sleep(0.1)
+    assert op.exists(event_log)
     with swallow_outputs():
         jobs(queries=[jobid[3:]], action="delete")
     assert len(registry.find_job_files()) == 0
     assert not op.exists(op.join(path, "ok"))
+    # The event log is removed from the resource.
+    assert not op.exists(event_log)
 
 
 def test_jobs_show(context):
@@ -407,6 +511,64 @@ def test_jobs_show(context):
         assert "status:" in output.out
 
 
+def test_jobs_status_concurrent(context):
+    run = context["run_fn"]
+    jobs = context["jobs_fn"]
+    resman = context["resource_manager"]
+
+    resman.create("othershell", resource_type="shell")
+    run(command=["doesntmatter0"], resref="myshell")
+    run(command=["doesntmatter1"], resref="myshell")
+    run(command=["doesntmatter2"], resref="othershell")
+
+    with swallow_outputs() as output:
+        with patch.object(Shell, "connect", autospec=True) as connect:
+            jobs(queries=[], status=True)
+        # One connection per resource.
+        assert connect.call_count == 2
+        lines = output.out.splitlines()
+        assert len(lines) == 3
+        assert all("[status: " in line for line in lines)
+        assert sum("on myshell" in line for line in lines) == 2
+
+
+def test_jobs_status_timeout(context):
+    run = context["run_fn"]
+    jobs = context["jobs_fn"]
+    resman = context["resource_manager"]
+
+    resman.create("slowshell", resource_type="shell")
+    run(command=["doesntmatter0"], resref="myshell")
+    run(command=["doesntmatter1"], resref="slowshell")
+
+    release = threading.Event()
+    hung = []
+    query_statuses = jobs_mod._query_statuses
+
+    def slow_on_slowshell(orcs):
+        if any(job["resource_name"] == "slowshell" for job, _ in orcs):
+            hung.append(threading.current_thread())
+            release.wait(10)
+        return query_statuses(orcs)
+
+    try:
+        with swallow_outputs() as output:
+            with swallow_logs(new_level=logging.ERROR) as log:
+                with patch.object(jobs_mod, "_query_statuses",
+                                  slow_on_slowshell):
+                    jobs(queries=[], status=True, timeout=0.5)
+                assert "Failed to query status" in log.out
+                assert "slowshell" in log.out
+            assert "myshell" in output.out
+            assert "slowshell" not in output.out
+        # The query still hangs, but would not keep the process from exiting.
+        [thread] = hung
+        assert thread.is_alive()
+        assert thread.daemon
+    finally:
+        release.set()
+
+
 def test_jobs_unknown_action(context):
     run = context["run_fn"]
     jobs = context["jobs_fn"]
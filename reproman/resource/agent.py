@@ -0,0 +1,319 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Persistent helper process serving filesystem queries for a session.
+
+Many session methods (exists, isdir, read, ...) are implemented by running a
+fresh command within the resource.  That is cheap locally, but over SSH or
+`docker exec` each call costs a full round-trip.  A `SessionAgent` instead
+starts a small Python helper once within the resource and sends it newline
+delimited JSON requests over the same channel, one JSON response per request.
+"""
+
+import base64
+import json
+import logging
+import struct
+import subprocess
+import threading
+
+from reproman.dochelpers import exc_str
+from reproman.support.exceptions import SessionRuntimeError
+from reproman.utils import to_unicode
+
+lgr = logging.getLogger('reproman.resource.agent')
+
+
+# The helper runs within the resource, so it should stick to the standard
+# library and to constructs which work with both Python 2 and 3.
+AGENT_SCRIPT = r'''
+import base64, hashlib, json, os, sys
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mode, st.st_size, st.st_mtime]
+
+def _read(path):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("ascii")
+
+def _mkdir(path, parents=False):
+    if parents:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    else:
+        os.mkdir(path)
+    return True
+
+def _stat_tree(top):
+    tree = {}
+    if os.path.exists(top):
+        tree[""] = _stat(top)
+    for root, dirs, files in os.walk(top, followlinks=True):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            st = _stat(path)
+            if st:
+                tree[os.path.relpath(path, top)] = st
+    return tree
+
+def _digest(path, digests, blocksize):
+    hashes = [hashlib.new(d) for d in digests]
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            for h in hashes:
+                h.update(block)
+    return dict((d, h.hexdigest()) for d, h in zip(digests, hashes))
+
+OPS = {
+    "ping": lambda: "pong",
+    "stat": _stat,
+    "stat_many": lambda paths: [_stat(p) for p in paths],
+    "stat_tree": _stat_tree,
+    "exists": os.path.exists,
+    "isdir": os.path.isdir,
+    "read": _read,
+    "listdir": os.listdir,
+    "mtime": os.path.getmtime,
+    "mkdir": _mkdir,
+    "digest": _digest,
+}
+
+stdin = getattr(sys.stdin, "buffer", sys.stdin)
+stdout = getattr(sys.stdout, "buffer", sys.stdout)
+for line in iter(stdin.readline, b""):
+    req = json.loads(line.decode("utf-8"))
+    try:
+        resp = {"id": req["id"],
+                "result": OPS[req["op"]](*req.get("args", []))}
+    except Exception as exc:
+        resp = {"id": req["id"],
+                "error": "%s: %s" % (exc.__class__.__name__, exc)}
+    stdout.write((json.dumps(resp) + "\n").encode("utf-8"))
+    stdout.flush()
+'''
+
+# Pick up whatever Python is available within the resource.
+AGENT_COMMAND = [
+    'sh', '-c',
+    'PY=$(command -v python3 || command -v python) && exec "$PY" -c "$1"',
+    'reproman-agent', AGENT_SCRIPT]
+
+
+class AgentError(SessionRuntimeError):
+    """The agent failed to serve a request.
+    """
+
+
+class AgentChannel(object):
+    """Bidirectional byte channel to a running agent.
+
+    Subclasses provide `write` (send all given bytes), `readline` (return the
+    next line as bytes, or an empty bytes object on EOF), and `close`.
+    """
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def readline(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ProcessAgentChannel(AgentChannel):
+    """Channel to an agent running as a local subprocess.
+
+    Parameters
+    ----------
+    command : list
+        Command to start the agent, e.g. `AGENT_COMMAND` possibly prefixed
+        with a command to enter the resource.
+    env : dict, optional
+        Environment for the process.
+    """
+
+    def __init__(self, command, env=None):
+        self._proc = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, env=env)
+
+    def write(self, data):
+        self._proc.stdin.write(data)
+        self._proc.stdin.flush()
+
+    def readline(self):
+        return self._proc.stdout.readline()
+
+    def close(self):
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+        self._proc.stdout.close()
+
+
+class ParamikoAgentChannel(AgentChannel):
+    """Channel to an agent started via a paramiko transport.
+
+    Parameters
+    ----------
+    transport : paramiko.Transport
+    command : str
+    """
+
+    def __init__(self, transport, command):
+        self._chan = transport.open_session()
+        self._chan.exec_command(command)
+        self._stdin = self._chan.makefile('wb')
+        self._stdout = self._chan.makefile('rb')
+
+    def write(self, data):
+        self._stdin.write(data)
+        self._stdin.flush()
+
+    def readline(self):
+        return self._stdout.readline()
+
+    def close(self):
+        self._chan.shutdown_write()
+        self._chan.close()
+
+
+class DockerAgentChannel(AgentChannel):
+    """Channel to an agent started via `docker exec`.
+
+    Without a TTY, Docker multiplexes the output of the process into frames,
+    each prefixed with an 8 byte header (stream type, 3 bytes of padding, and
+    a big-endian payload size).  Only stdout frames are kept.
+
+    Parameters
+    ----------
+    client : docker.APIClient
+    container : dict or str
+    command : list
+    """
+
+    def __init__(self, client, container, command):
+        execute = client.exec_create(container=container, cmd=command,
+                                     stdin=True)
+        sock = client.exec_start(exec_id=execute['Id'], socket=True)
+        self._response = sock
+        # exec_start returns a SocketIO wrapper for a Unix socket.
+        self._sock = getattr(sock, '_sock', sock)
+        self._buffer = b''
+
+    def write(self, data):
+        self._sock.sendall(data)
+
+    def _recv_exactly(self, size):
+        chunks = []
+        while size:
+            chunk = self._sock.recv(size)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def readline(self):
+        while b'\n' not in self._buffer:
+            header = self._recv_exactly(8)
+            if header is None:
+                line, self._buffer = self._buffer, b''
+                return line
+            stream, size = struct.unpack('>BxxxL', header)
+            payload = self._recv_exactly(size) or b''
+            if stream == 1:
+                self._buffer += payload
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line + b'\n'
+
+    def close(self):
+        self._response.close()
+
+
+class SessionAgent(object):
+    """Client side of the helper process serving filesystem queries.
+
+    Requests are serialized, so a single agent can be shared across threads.
+
+    Parameters
+    ----------
+    channel : AgentChannel
+        Channel to an already started agent.
+    """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.alive = True
+
+    def call(self, op, *args):
+        """Run `op` with `args` within the agent and return its result.
+
+        Raises
+        ------
+        AgentError
+            If the operation failed or the agent is no longer responding.  In
+            the latter case `alive` is set to False.
+        """
+        with self._lock:
+            if not self.alive:
+                raise AgentError("Agent is not running")
+            self._counter += 1
+            request = {"id": self._counter, "op": op, "args": list(args)}
+            try:
+                self._channel.write(
+                    (json.dumps(request) + "\n").encode("utf-8"))
+                line = self._channel.readline()
+            except (OSError, EOFError) as exc:
+                self.alive = False
+                raise AgentError("Failed to communicate with agent: %s"
+                                 % exc_str(exc))
+            if not line:
+                self.alive = False
+                raise AgentError("Agent exited unexpectedly")
+            try:
+                response = json.loads(to_unicode(line))
+            except ValueError as exc:
+                # Stray output got in the way, so the responses can no longer
+                # be matched to the requests.
+                self.alive = False
+                raise AgentError("Agent sent malformed response %r: %s"
+                                 % (line, exc_str(exc)))
+        if response.get("id") != request["id"]:
+            self.alive = False
+            raise AgentError("Agent responded out of order: %r" % response)
+        if "error" in response:
+            raise AgentError("%s(%s) failed: %s"
+                             % (op, ", ".join(map(repr, args)),
+                                response["error"]))
+        return response["result"]
+
+    def read(self, path):
+        """Return the content of `path` as bytes.
+        """
+        return base64.b64decode(self.call("read", path))
+
+    def close(self):
+        with self._lock:
+            self.alive = False
+            try:
+                self._channel.close()
+            except Exception as exc:  # Nothing to be done at this point.
+                lgr.debug("Failed to close agent channel: %s", exc_str(exc))
@@ -10,10 +10,8 @@
 import attr
 import docker
 import dockerpty
-import io
 import json
 import os
-import tarfile
 
 from .. import utils
 from ..cmd import Runner
@@ -22,6 +20,7 @@ from ..dochelpers import (
     borrowdoc,
     exc_str,
 )
+from ..resource.agent import AGENT_COMMAND, DockerAgentChannel
 from ..resource.session import POSIXSession, Session
 from .base import Resource
 from ..utils import attrib
@@ -234,6 +233,8 @@ class DockerSession(POSIXSession):
     client = attrib(default=attr.NOTHING)
     container = attrib(default=attr.NOTHING)
 
+    PUT_JOBS = 4
+
     @borrowdoc(Session)
     def _execute_command(self, command, env=None, cwd=None, with_shell=True):
         command = self._prefix_command(utils.command_as_string(command),
@@ -267,6 +268,17 @@ class DockerSession(POSIXSession):
 
     # XXX should we start/stop on open/close or just assume that it is running already?
 
+    @property
+    @borrowdoc(Session)
+    def identity(self):
+        container = self.container
+        if isinstance(container, dict):
+            container = container.get('Id')
+        return "docker:%s" % container if container else None
+
+    @borrowdoc(Session)
+    def _open_agent_channel(self):
+        return DockerAgentChannel(self.client, self.container, AGENT_COMMAND)
 
     @borrowdoc(Session)
     def put(self, src_path, dest_path, uid=-1, gid=-1):
@@ -275,13 +287,10 @@ class DockerSession(POSIXSession):
         dest_path = self._prepare_dest_path(src_path, dest_path,
                                             local=False, absolute_only=True)
         dest_dir, dest_basename = os.path.split(dest_path)
-        tar_stream = io.BytesIO()
-        tar_file = tarfile.TarFile(fileobj=tar_stream, mode='w')
-        tar_file.add(src_path, arcname=dest_basename)
-        tar_file.close()
-        tar_stream.seek(0)
-        self.client.put_archive(container=self.container['Id'], path=dest_dir,
-            data=tar_stream)
+        # The archive is streamed as it is being created.
+        self.client.put_archive(
+            container=self.container['Id'], path=dest_dir,
+            data=utils.iter_tar_chunks(src_path, arcname=dest_basename))
 
         if uid > -1 or gid > -1:
             self.chown(dest_path, uid, gid)
@@ -293,10 +302,8 @@ class DockerSession(POSIXSession):
         dest_dir = os.path.dirname(dest_path)
         stream, stat = self.client.get_archive(self.container, src_path)
         # get_archive() returns a generator with the content (in 2 MB chunks by
-        # default). Consider exposing those chunks as a stream rather than
-        # joining them.
-        tarball = tarfile.open(fileobj=io.BytesIO(b"".join(stream)))
-        tarball.extractall(path=dest_dir)
+        # default), extracted as they arrive.
+        utils.extract_tar_chunks(stream, dest_dir)
         os.rename(os.path.join(dest_dir, src_basename), dest_path)
 
         if uid > -1 or gid > -1:
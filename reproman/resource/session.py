@@ -12,26 +12,78 @@ import logging
 lgr = logging.getLogger('reproman.resource.session')
 
 import attr
+import base64
+from collections import namedtuple
 from functools import partial
+from functools import wraps
+import inspect
+import json
 import os
 import os.path as op
 import re
 from shlex import quote as shlex_quote
+import stat
 import subprocess
 from tempfile import NamedTemporaryFile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from reproman.cmd import Runner
 from reproman.dochelpers import exc_str, borrowdoc
+from reproman.resource.agent import SessionAgent
+from reproman.resource.session_cache import SessionCache
+from reproman.support.digests import Digester
 from reproman.support.exceptions import (
     CommandError,
     SessionRuntimeError,
 )
-from reproman.utils import updated, to_unicode
+from reproman.utils import execute_command_batch, updated, to_unicode
 
 import logging
 lgr = logging.getLogger('reproman.session')
 
 
+PathStat = namedtuple("PathStat", ["mode", "size", "mtime"])
+PathStat.__doc__ = """Status of a path as returned by `Session.stat_many`"""
+
+
+class TransferStats(object):
+    """Accumulate the amount of transferred data to report the throughput.
+    """
+
+    def __init__(self):
+        self.nfiles = 0
+        self.nbytes = 0
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes, nfiles=1):
+        with self._lock:
+            self.nfiles += nfiles
+            self.nbytes += nbytes
+
+    def log(self, what, how):
+        elapsed = max(time.time() - self._start, 1e-6)
+        # not to be chatty about single files, e.g. of job submissions
+        lgr.log(logging.INFO if self.nfiles > 1 else logging.DEBUG,
+                "%s %d files (%.1f MB) %s in %.2f sec: %.2f MB/s",
+                what, self.nfiles, self.nbytes / 1e6, how, elapsed,
+                self.nbytes / 1e6 / elapsed)
+
+
+def _get_local_size(path):
+    """Return number of files and bytes of local `path`"""
+    if not op.isdir(path):
+        return 1, op.getsize(path)
+    nfiles = nbytes = 0
+    for root, _, fnames in os.walk(path):
+        for f in fnames:
+            nfiles += 1
+            nbytes += op.getsize(op.join(root, f))
+    return nfiles, nbytes
+
+
 @attr.s
 class Session(object):
     """Interface for Resources to provide interaction within that environment"""
@@ -47,6 +99,10 @@ class Session(object):
         """
         self._env = {}           # environment which would be in-effect only for this session
         self._env_permanent = {}  # environment variables which would be in-effect in future sessions if resource is persistent
+        self._agent = None  # see start_agent
+        # Guards swapping _agent, which other threads may be calling
+        self._agent_lock = threading.Lock()
+        self.cache = None  # see enable_cache
 
     def __enter__(self):
         self.open()
@@ -59,6 +115,16 @@ class Session(object):
         """Sugaring shortcut to `execute_command`"""
         return self.execute_command(*args, **kwargs)
 
+    @property
+    def identity(self):
+        """String identifying the environment the session operates in.
+
+        It is used to associate information persisted across sessions with
+        the environment, so it should stay the same for all sessions into
+        that environment.  None if there is no such identity.
+        """
+        return None
+
     # By default don't do anything special
     def open(self):
         """
@@ -74,7 +140,206 @@ class Session(object):
         Called when a session ends.
         """
         # XXX may be here we should dump permanent env settings?
-        pass
+        self.stop_agent()
+
+    def start_agent(self):
+        """Start a persistent helper to serve filesystem queries.
+
+        While the agent is running, methods such as `exists`, `isdir`, `read`,
+        `get_mtime`, `mkdir`, and `listdir` are served over a single channel
+        instead of running a separate command for each call.  Whenever the
+        agent fails to serve a request, the method falls back to running a
+        command.
+
+        Returns
+        -------
+        bool
+            True if the agent is running.  False if the session does not
+            support an agent or it failed to start (e.g., no Python within the
+            resource).
+        """
+        agent = self._agent
+        if agent is not None and agent.alive:
+            return True
+        try:
+            channel = self._open_agent_channel()
+        except NotImplementedError:
+            lgr.debug("%s does not support an agent", self.__class__.__name__)
+            return False
+        except Exception as exc:
+            lgr.warning("Failed to start agent for %s: %s",
+                        self.__class__.__name__, exc_str(exc))
+            return False
+        agent = SessionAgent(channel)
+        try:
+            agent.call("ping")
+        except SessionRuntimeError as exc:
+            lgr.warning("Agent for %s is not responding: %s",
+                        self.__class__.__name__, exc_str(exc))
+            agent.close()
+            return False
+        lgr.debug("Started agent for %s", self.__class__.__name__)
+        with self._agent_lock:
+            previous, self._agent = self._agent, agent
+        if previous is not None:
+            previous.close()
+        return True
+
+    def stop_agent(self, agent=None):
+        """Stop the agent started by `start_agent`, if any.
+
+        Parameters
+        ----------
+        agent : SessionAgent, optional
+            Stop only if this is still the running agent.
+        """
+        with self._agent_lock:
+            if agent is not None and agent is not self._agent:
+                return
+            agent, self._agent = self._agent, None
+        if agent is not None:
+            agent.close()
+
+    # Queries memoized by enable_cache ...
+    _CACHED_QUERIES = ("exists", "isdir", "read", "get_mtime")
+    # ... their bulk counterparts, along with the per-path query they cache ...
+    _CACHED_BULK_QUERIES = {"stat_many": "stat",
+                            "isdir_many": "isdir",
+                            "exists_many": "exists"}
+    # ... and the methods invalidating them, with the argument holding the
+    # affected path.
+    _CACHE_INVALIDATORS = {"mkdir": "path",
+                           "put": "dest_path",
+                           "chmod": "path",
+                           "chown": "path"}
+
+    def enable_cache(self, maxsize=100000):
+        """Memoize results of file system queries within this session.
+
+        Results of `exists`, `isdir`, `read`, `get_mtime` and the `*_many`
+        variants are cached until the path is modified via `mkdir`, `put`,
+        `chmod`, or `chown`.  Changes made by other means, e.g. by
+        commands run through `execute_command`, are not noticed, so the cache
+        should be enabled only while the file system is not expected to
+        change, or `cache.clear()` should be called after such changes.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximal number of results to keep.
+
+        Returns
+        -------
+        SessionCache
+        """
+        if self.cache is not None:
+            return self.cache
+        self.cache = SessionCache(maxsize)
+        for name in self._CACHED_QUERIES:
+            setattr(self, name, self._cached_query(name))
+        for name, query in self._CACHED_BULK_QUERIES.items():
+            setattr(self, name, self._cached_bulk_query(name, query))
+        for name, argname in self._CACHE_INVALIDATORS.items():
+            setattr(self, name, self._cache_invalidator(name, argname))
+        return self.cache
+
+    def disable_cache(self):
+        """Stop memoizing file system queries started by `enable_cache`.
+        """
+        if self.cache is None:
+            return
+        for name in (self._CACHED_QUERIES
+                     + tuple(self._CACHED_BULK_QUERIES)
+                     + tuple(self._CACHE_INVALIDATORS)):
+            self.__dict__.pop(name, None)
+        self.cache.log_stats()
+        self.cache = None
+
+    def _cached_query(self, name):
+        method = getattr(self, name)
+
+        @wraps(method)
+        def cached(path, *args, **kwargs):
+            if args or kwargs:  # e.g., non-default read mode
+                return method(path, *args, **kwargs)
+            found, value = self.cache.get(name, path)
+            if not found:
+                value = method(path)
+                self.cache.set(name, path, value)
+            return value
+        return cached
+
+    def _cached_bulk_query(self, name, query):
+        method = getattr(self, name)
+
+        @wraps(method)
+        def cached(paths):
+            result = {}
+            missing = []
+            for path in paths:
+                found, value = self.cache.get(query, path)
+                if found:
+                    result[path] = value
+                else:
+                    missing.append(path)
+            if missing:
+                for path, value in method(missing).items():
+                    self.cache.set(query, path, value)
+                    result[path] = value
+            return result
+        return cached
+
+    def _cache_invalidator(self, name, argname):
+        method = getattr(self, name)
+        signature = inspect.signature(method)
+
+        @wraps(method)
+        def invalidating(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                arguments = signature.bind(*args, **kwargs).arguments
+                path = arguments.get(argname)
+                if path:
+                    self.cache.invalidate(
+                        path,
+                        recursive=name == "put"
+                        or arguments.get("recursive", False))
+        return invalidating
+
+    def _open_agent_channel(self):
+        """Start `reproman.resource.agent.AGENT_COMMAND` within the resource.
+
+        Returns
+        -------
+        AgentChannel
+        """
+        raise NotImplementedError
+
+    def _call_agent(self, op, *args):
+        """Serve `op` by the agent if one is running.
+
+        Returns
+        -------
+        tuple (handled, result)
+            `handled` is False if there is no running agent or the agent
+            failed to serve the request, in which case the caller should fall
+            back to its regular implementation.
+        """
+        # Another thread might stop the agent meanwhile.
+        agent = self._agent
+        if agent is None:
+            return False, None
+        try:
+            return True, agent.call(op, *args)
+        except SessionRuntimeError as exc:
+            lgr.debug("Agent failed, falling back to a command: %s",
+                      exc_str(exc))
+            if not agent.alive:
+                lgr.warning("Agent for %s has stopped, no longer using it",
+                            self.__class__.__name__)
+                self.stop_agent(agent)
+            return False, None
 
     def set_envvar(self, variable, value=None, permanent=False, format=False):
         """Set environment variable(s) to be used within the session
@@ -321,7 +586,8 @@ class Session(object):
         dest_dir = dest_base = None
         if dest_path:
             dest_dir, dest_base = op.split(dest_path)
-            if dest_dir and not exists(dest_dir):
+            if dest_dir and (local or dest_dir not in self._known_dirs) \
+               and not exists(dest_dir):
                 mkdir(dest_dir)
 
         if not dest_base:
@@ -352,6 +618,67 @@ class Session(object):
         """
         raise NotImplementedError
 
+    # Number of `put`s that `put_many` runs at once.  Sessions over a
+    # connection with high latency benefit from more.
+    PUT_JOBS = 1
+
+    # Directories known to exist on the resource while `put_many` runs, so
+    # `_prepare_dest_path` need not check for them.
+    _known_dirs = frozenset()
+
+    def put_many(self, pairs, jobs=None, retries=2):
+        """Copy several local files or directories to the resource.
+
+        The destination directories are created with a single command, and
+        then the transfers are run concurrently.
+
+        Parameters
+        ----------
+        pairs : list of tuples
+            (src_path, dest_path) pairs, where `dest_path` is the full path
+            of the copy on the resource.
+        jobs : int, optional
+            Number of transfers to run at once.  Defaults to `PUT_JOBS`.
+        retries : int, optional
+            Number of times to retry a failed transfer.
+
+        Raises
+        ------
+        The exception of a transfer that failed after all retries.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return
+        dirs = sorted({op.dirname(dest) for _, dest in pairs} - {""})
+        for _ in execute_command_batch(self, ["mkdir", "-p"], dirs):
+            pass
+        stats = TransferStats()
+
+        def put(pair):
+            src, dest = pair
+            for attempt in range(retries + 1):
+                try:
+                    self.put(src, dest)
+                    break
+                except Exception as exc:
+                    if attempt == retries:
+                        raise
+                    lgr.debug("Failed to upload %s (attempt %d of %d): %s",
+                              src, attempt + 1, retries + 1, exc_str(exc))
+                    time.sleep(0.5 * (attempt + 1))
+            nfiles, nbytes = _get_local_size(src)
+            stats.add(nbytes, nfiles)
+
+        jobs = min(jobs or self.PUT_JOBS, len(pairs))
+        self._known_dirs = frozenset(dirs)
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                # list() to raise the first failure, if any
+                list(executor.map(put, pairs))
+        finally:
+            del self._known_dirs
+        stats.log("Uploaded", "with {} concurrent transfers".format(jobs))
+
     def put_text(self, text, target, executable=False):
         """Put file with content `text` at `target`.
 
@@ -364,7 +691,8 @@ class Session(object):
         executable : boolean, optional
             Whether to mark file as executable.
         """
-        with NamedTemporaryFile('w', prefix="reproman-", delete=False) as tfh:
+        with NamedTemporaryFile('w', prefix="reproman-", delete=False,
+                                encoding="utf-8") as tfh:
             tfh.write(text)
         if executable:
             os.chmod(tfh.name, 0o775)
@@ -411,6 +739,29 @@ class Session(object):
         """
         raise NotImplementedError
 
+    def digest(self, path, digests=None, blocksize=1 << 16):
+        """Compute digests of a file within the resource
+
+        The file is read in blocks where it lives, so only the digests are
+        transferred.
+
+        Parameters
+        ----------
+        path : string
+            Path to file on resource
+        digests : list of str, optional
+            Names of hashlib algorithms (the default is
+            `Digester.DEFAULT_DIGESTS`)
+        blocksize : int, optional
+            Size of the blocks to read the file in
+
+        Returns
+        -------
+        dict
+            Maps each algorithm to the hex digest
+        """
+        raise NotImplementedError
+
     #
     # Somewhat optional since could be implemented with native "POSIX" commands
     #
@@ -468,6 +819,79 @@ class Session(object):
         """
         raise NotImplementedError
 
+    def stat_many(self, paths):
+        """Return status of multiple paths, querying the resource in bulk
+
+        Parameters
+        ----------
+        paths : iterable of str
+            Paths to query.  Symbolic links are followed.
+
+        Returns
+        -------
+        dict
+            Maps each path to a `PathStat`, or to None if the path does not
+            exist (or could not be queried).
+        """
+        raise NotImplementedError
+
+    def stat_tree(self, path):
+        """Return status of `path` and everything under it, symlinks followed
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        dict
+            Maps paths relative to `path` to their `PathStat`.  `path` itself
+            is included under "".  Empty if `path` does not exist.
+        """
+        raise NotImplementedError
+
+    def isdir_many(self, paths):
+        """Return which of `paths` are directories
+
+        Sessions which do not implement `stat_many` query each path
+        separately.
+
+        Parameters
+        ----------
+        paths : iterable of str
+
+        Returns
+        -------
+        dict
+            Maps each path to True if it is pointing to a directory
+        """
+        paths = list(paths)
+        try:
+            stats = self.stat_many(paths)
+        except NotImplementedError:
+            return {p: self.isdir(p) for p in paths}
+        return {p: st is not None and stat.S_ISDIR(st.mode)
+                for p, st in stats.items()}
+
+    def exists_many(self, paths):
+        """Return which of `paths` exist
+
+        Parameters
+        ----------
+        paths : iterable of str
+
+        Returns
+        -------
+        dict
+            Maps each path to True if it exists
+        """
+        paths = list(paths)
+        try:
+            stats = self.stat_many(paths)
+        except NotImplementedError:
+            return {p: self.exists(p) for p in paths}
+        return {p: st is not None for p, st in stats.items()}
+
     def chmod(self, path, mode, recursive=False):
         """Set the mode of the indicated path
 
@@ -711,6 +1135,9 @@ class POSIXSession(Session):
 
     def exists(self, path):
         """Return if file exists"""
+        handled, result = self._call_agent("exists", path)
+        if handled:
+            return result
         try:
             out, err = self.execute_command(self.exists_command(path),
                                             with_shell=False)
@@ -736,6 +1163,9 @@ class POSIXSession(Session):
     # Seems to have no generic implementation in POSIX?  TODO: check
     #  may be we could assume presence of e.g. python so we could use std library?
     def get_mtime(self, path):
+        handled, result = self._call_agent("mtime", path)
+        if handled:
+            return str(result)
         # TODO:  too common of a pattern -- we need a helper to wrap such calls
         out, err = self.execute_command(self.get_mtime_command(path))
         return out.strip()
@@ -745,11 +1175,46 @@ class POSIXSession(Session):
         command = "import os, sys; print(os.path.getmtime(sys.argv[1]))"
         return ['python', '-c', command, path]
 
+    _PY_DIGEST_CMD = [
+        'python', '-c',
+        "import hashlib, json, sys\n"
+        "path, blocksize, digests = sys.argv[1], int(sys.argv[2]), sys.argv[3:]\n"
+        "hashes = [hashlib.new(d) for d in digests]\n"
+        "with open(path, 'rb') as f:\n"
+        "    for block in iter(lambda: f.read(blocksize), b''):\n"
+        "        for h in hashes:\n"
+        "            h.update(block)\n"
+        "print(json.dumps(dict((d, h.hexdigest())\n"
+        "                      for d, h in zip(digests, hashes))))"]
+
+    @borrowdoc(Session)
+    def digest(self, path, digests=None, blocksize=1 << 16):
+        digests = list(digests or Digester.DEFAULT_DIGESTS)
+        handled, result = self._call_agent("digest", path, digests, blocksize)
+        if handled:
+            return result
+        try:
+            out, _ = self.execute_command(
+                self._PY_DIGEST_CMD + [path, str(blocksize)] + digests)
+            return json.loads(out)
+        except (CommandError, ValueError) as exc:
+            lgr.debug("python is not usable to compute digests, "
+                      "falling back to coreutils: %s", exc_str(exc))
+        # e.g. "md5sum", which read the file once per digest though
+        result = {}
+        for d in digests:
+            out, _ = self.execute_command([d + "sum", "--", path])
+            result[d] = out.split(None, 1)[0].lstrip("\\")
+        return result
+
     #
     # Somewhat optional since could be implemented with native "POSIX" commands
     #
     def read(self, path, mode='r'):
         """Return context manager to open files for reading or editing"""
+        handled, result = self._call_agent("read", path)
+        if handled:
+            return to_unicode(base64.b64decode(result))
         out, err = self.execute_command(["cat", path])
         if err:
             raise SessionRuntimeError("Running had std error output: %s" % err)
@@ -758,6 +1223,9 @@ class POSIXSession(Session):
     def mkdir(self, path, parents=False):
         """Create a directory
         """
+        handled, _ = self._call_agent("mkdir", path, parents)
+        if handled:
+            return
         command = ["mkdir"]
         if parents: command.append("-p")
         command += [path]
@@ -771,6 +1239,9 @@ class POSIXSession(Session):
         return path.rstrip()  # Remove newline
 
     def isdir(self, path):
+        handled, result = self._call_agent("isdir", path)
+        if handled:
+            return result
         try:
             out, err = self.execute_command(self.isdir_command(path))
         except Exception as exc:  # TODO: More specific exception?
@@ -788,6 +1259,129 @@ class POSIXSession(Session):
         command = ['test', '-d', shlex_quote(path), '&&', 'echo', 'Found']
         return ['bash', '-c', ' '.join(command)]
 
+    # "/" goes first, so we can tell whether stat supported the format at all
+    # (it is not POSIX, but GNU coreutils and busybox provide it).
+    _STAT_MANY_CMD = [
+        'sh', '-c',
+        'stat -L -c "%f %s %Y %y %n" -- / "$@" 2>/dev/null; exit 0', 'sh']
+    _PY_STAT_MANY_CMD = [
+        'python', '-c',
+        "import json, os, sys\n"
+        "def st(p):\n"
+        "    try:\n"
+        "        s = os.stat(p)\n"
+        "    except OSError:\n"
+        "        return None\n"
+        "    return [s.st_mode, s.st_size, s.st_mtime]\n"
+        "print(json.dumps(dict((p, st(p)) for p in sys.argv[1:])))"]
+
+    @borrowdoc(Session)
+    def stat_many(self, paths):
+        paths = list(paths)
+        if not paths:
+            return {}
+        handled, result = self._call_agent("stat_many", paths)
+        if handled:
+            return {p: PathStat(*st) if st else None
+                    for p, st in zip(paths, result)}
+
+        stats = {}
+        try:
+            for out, _, _ in execute_command_batch(
+                    self, self._STAT_MANY_CMD, paths):
+                stats.update(self._parse_stat_output(out))
+        except ValueError as exc:
+            lgr.debug("stat is not usable, falling back to python: %s",
+                      exc_str(exc))
+            for out, _, _ in execute_command_batch(
+                    self, self._PY_STAT_MANY_CMD, paths):
+                stats.update(
+                    (p, PathStat(*st) if st else None)
+                    for p, st in json.loads(out).items())
+        return {p: stats.get(p) for p in paths}
+
+    _STAT_TREE_CMD = [
+        'sh', '-c',
+        'find -L "$1" -printf "%y %m %s %T@ %P\\0" 2>/dev/null; exit 0', 'sh']
+    _PY_STAT_TREE_CMD = [
+        'python', '-c',
+        "import json, os, sys\n"
+        "def st(p):\n"
+        "    s = os.stat(p)\n"
+        "    return [s.st_mode, s.st_size, s.st_mtime]\n"
+        "top = sys.argv[1]\n"
+        "tree = {'': st(top)} if os.path.exists(top) else {}\n"
+        "for root, dirs, files in os.walk(top, followlinks=True):\n"
+        "    for name in dirs + files:\n"
+        "        p = os.path.join(root, name)\n"
+        "        try:\n"
+        "            tree[os.path.relpath(p, top)] = st(p)\n"
+        "        except OSError:\n"
+        "            pass\n"
+        "print(json.dumps(tree))"]
+    # find's %y types.  Symlinks are followed, so those left are broken.
+    _FIND_TYPES = {'f': stat.S_IFREG, 'd': stat.S_IFDIR, 'p': stat.S_IFIFO,
+                   's': stat.S_IFSOCK, 'b': stat.S_IFBLK, 'c': stat.S_IFCHR}
+
+    @borrowdoc(Session)
+    def stat_tree(self, path):
+        handled, result = self._call_agent("stat_tree", path)
+        if handled:
+            return {p: PathStat(*st) for p, st in result.items()}
+        out, _ = self.execute_command(self._STAT_TREE_CMD + [path])
+        if out:
+            return self._parse_find_output(out)
+        # find might not support -printf (e.g., busybox)
+        if not self.exists(path):
+            return {}
+        lgr.debug("find is not usable, falling back to python")
+        out, _ = self.execute_command(self._PY_STAT_TREE_CMD + [path])
+        return {p: PathStat(*st) for p, st in json.loads(out).items()}
+
+    @classmethod
+    def _parse_find_output(cls, out):
+        """Parse output of `_STAT_TREE_CMD` into a {path: PathStat} dict.
+        """
+        tree = {}
+        for record in out.split("\0"):
+            if not record:
+                continue
+            type_, mode, size, mtime, path = record.split(" ", 4)
+            if type_ not in cls._FIND_TYPES:
+                continue
+            tree[path] = PathStat(cls._FIND_TYPES[type_] | int(mode, 8),
+                                  int(size), float(mtime))
+        return tree
+
+    @staticmethod
+    def _parse_stat_output(out):
+        """Parse output of `_STAT_MANY_CMD` into a {path: PathStat} dict.
+
+        Raises ValueError if the output does not start with the entry for "/".
+        """
+        lines = out.splitlines()
+        if not lines or not lines[0].endswith(" /"):
+            raise ValueError("Unexpected output of stat: %r" % out[:100])
+        stats = {}
+        for line in lines[1:]:
+            # %y is "DATE TIME[.FRACTION] ZONE", with the fraction of the
+            # second that %Y lacks.
+            mode, size, mtime, _, time, _, path = line.split(" ", 6)
+            mtime = int(mtime)
+            if "." in time:
+                mtime += float("0." + time.split(".")[1])
+            stats[path] = PathStat(int(mode, 16), int(size), mtime)
+        return stats
+
+    def listdir(self, path):
+        """Return names of the entries in directory `path`
+        """
+        handled, result = self._call_agent("listdir", path)
+        if handled:
+            return result
+        out, err = self.execute_command(["ls", "-1A", path])
+        return [f for f in out.split('\n') if f]
+
     def chmod(self, path, mode, recursive=False):
         """Set the mode of a remote path
         """
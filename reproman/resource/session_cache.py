@@ -0,0 +1,150 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Memoization of file system queries within a session."""
+
+from collections import OrderedDict
+import os.path as op
+import stat
+import threading
+
+import logging
+lgr = logging.getLogger('reproman.resource.session_cache')
+
+
+class SessionCache(object):
+    """Bounded LRU cache of file system query results.
+
+    Entries are keyed by the query (e.g., "isdir") and the path.  A cached
+    "stat" result also answers "exists" and "isdir" queries for that path.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximal number of entries to keep.  The least recently used entries
+        are dropped first.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # (query, path) -> value
+        # Index of the entries, so that invalidation does not need to scan
+        # all of them: normalized path -> its keys in _data, and path ->
+        # paths directly underneath it that have entries (or whose
+        # descendants have).
+        self._keys = {}
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, query, path):
+        """Look up the result of `query` for `path`.
+
+        Returns
+        -------
+        tuple (found, value)
+        """
+        with self._lock:
+            key = (query, path)
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            stat_key = ("stat", path)
+            if query in ("exists", "isdir") and stat_key in self._data:
+                self._data.move_to_end(stat_key)
+                self.hits += 1
+                st = self._data[stat_key]
+                if query == "exists":
+                    return True, st is not None
+                return True, st is not None and stat.S_ISDIR(st.mode)
+            self.misses += 1
+            return False, None
+
+    def set(self, query, path, value):
+        with self._lock:
+            key = (query, path)
+            if key not in self._data:
+                self._index(key)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._unindex(self._data.popitem(last=False)[0])
+
+    def _index(self, key):
+        path = op.normpath(key[1])
+        keys = self._keys.get(path)
+        if keys is None:
+            keys = self._keys[path] = set()
+            child, parent = path, op.dirname(path)
+            while parent != child:
+                children = self._children.setdefault(parent, set())
+                if child in children:
+                    break
+                children.add(child)
+                child, parent = parent, op.dirname(parent)
+        keys.add(key)
+
+    def _unindex(self, key):
+        path = op.normpath(key[1])
+        keys = self._keys[path]
+        keys.discard(key)
+        if keys:
+            return
+        del self._keys[path]
+        # Prune the branch that no longer leads to any entry.
+        while path not in self._keys and not self._children.get(path):
+            self._children.pop(path, None)
+            parent = op.dirname(path)
+            if parent == path:
+                break
+            self._children.get(parent, set()).discard(path)
+            path = parent
+
+    def _drop(self, path):
+        for key in list(self._keys.get(path, ())):
+            del self._data[key]
+            self._unindex(key)
+
+    def invalidate(self, path, recursive=False):
+        """Drop entries for `path` and its parent directories.
+
+        Parameters
+        ----------
+        path : str
+        recursive : bool, optional
+            Drop entries for anything underneath `path` as well.
+        """
+        path = op.normpath(path)
+        affected = [path]
+        parent = op.dirname(path)
+        while parent not in affected:
+            affected.append(parent)
+            parent = op.dirname(parent)
+        with self._lock:
+            if recursive:
+                pending = list(self._children.get(path, ()))
+                while pending:
+                    child = pending.pop()
+                    affected.append(child)
+                    pending.extend(self._children.get(child, ()))
+            for pth in affected:
+                self._drop(pth)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._keys.clear()
+            self._children.clear()
+
+    def log_stats(self, prefix="Session cache"):
+        lgr.debug("%s: %d hits, %d misses, %d entries",
+                  prefix, self.hits, self.misses, len(self._data))
@@ -14,6 +14,7 @@ from .base import Resource
 from reproman.cmd import Runner
 from reproman.dochelpers import borrowdoc
 from reproman.resource.session import Session
+from reproman.support.digests import Digester
 from reproman.support.exceptions import CommandError
 from reproman.utils import attrib
 
@@ -22,7 +23,8 @@ lgr = logging.getLogger('reproman.resource.shell')
 
 import os
 
-from .session import POSIXSession, get_updated_env
+from .agent import AGENT_COMMAND, ProcessAgentChannel
+from .session import PathStat, POSIXSession, get_updated_env
 
 
 # For now just assuming that local shell is a POSIX shell
@@ -31,6 +33,8 @@ from .session import POSIXSession, get_updated_env
 class ShellSession(POSIXSession):
     """Local shell session"""
 
+    PUT_JOBS = 4
+
     def __init__(self):
         super(ShellSession, self).__init__()
         self._runner = None
@@ -41,8 +45,19 @@ class ShellSession(POSIXSession):
 
     @borrowdoc(Session)
     def close(self):
+        super(ShellSession, self).close()
         self._runner = None
 
+    @property
+    @borrowdoc(Session)
+    def identity(self):
+        return "shell"
+
+    @borrowdoc(Session)
+    def _open_agent_channel(self):
+        env = get_updated_env(os.environ, self._env) if self._env else None
+        return ProcessAgentChannel(AGENT_COMMAND, env=env)
+
     @borrowdoc(Session)
     def _execute_command(self, command, env=None, cwd=None, with_shell=False):
         # XXX should it be a generic behavior to auto-start?
@@ -69,6 +84,34 @@ class ShellSession(POSIXSession):
     def isdir(self, path):
         return os.path.isdir(path)
 
+    @borrowdoc(Session)
+    def stat_many(self, paths):
+        stats = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stats[path] = None
+            else:
+                stats[path] = PathStat(st.st_mode, st.st_size, st.st_mtime)
+        return stats
+
+    @borrowdoc(Session)
+    def stat_tree(self, path):
+        tree = {}
+        if os.path.exists(path):
+            tree[""] = self.stat_many([path])[path]
+        for root, dirs, files in os.walk(path, followlinks=True):
+            paths = [os.path.join(root, name) for name in dirs + files]
+            for p, st in self.stat_many(paths).items():
+                if st is not None:
+                    tree[os.path.relpath(p, path)] = st
+        return tree
+
+    @borrowdoc(Session)
+    def digest(self, path, digests=None, blocksize=1 << 16):
+        return Digester(digests, blocksize=blocksize)(path)
+
     @borrowdoc(Session)
     def mkdir(self, path, parents=False):
         if not os.path.exists(path):
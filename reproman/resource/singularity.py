@@ -17,6 +17,7 @@ from ..cmd import Runner
 from ..dochelpers import borrowdoc
 from ..support.exceptions import CommandError, OutdatedExternalDependency
 from ..support.external_versions import external_versions
+from .agent import AGENT_COMMAND, ProcessAgentChannel
 from .session import POSIXSession, Session
 from .base import Resource
 from ..utils import attrib
@@ -185,6 +186,17 @@ class SingularitySession(POSIXSession):
 
         return (stdout, stderr)
 
+    @property
+    @borrowdoc(Session)
+    def identity(self):
+        return "singularity:%s" % self.name
+
+    @borrowdoc(Session)
+    def _open_agent_channel(self):
+        return ProcessAgentChannel(
+            ['singularity', 'exec', 'instance://{}'.format(self.name)]
+            + AGENT_COMMAND)
+
     def _put_file(self, src_path, dest_path):
         dest_path = self._prepare_dest_path(src_path, dest_path,
                                             local=False, absolute_only=True)
@@ -8,8 +8,6 @@
 """Resource sub-class to provide management of a SSH connection."""
 
 import attr
-import os
-import stat
 import getpass
 import uuid
 from ..log import LoggerHelper
@@ -26,6 +24,7 @@ from ..utils import attrib
 from ..utils import command_as_string
 from reproman.dochelpers import borrowdoc
 from reproman.resource.session import Session
+from reproman.resource.ssh_transfer import SSHTransfer
 from ..support.exceptions import CommandError
 
 # Silence CryptographyDeprecationWarning's.
@@ -170,6 +169,7 @@ class Ssh(SSH):
     pass
 
 
+from reproman.resource.agent import AGENT_COMMAND, ParamikoAgentChannel
 from reproman.resource.session import POSIXSession
 
 
@@ -177,6 +177,19 @@ from reproman.resource.session import POSIXSession
 class SSHSession(POSIXSession):
     connection = attrib(default=attr.NOTHING)
 
+    # Each transfer takes its own SFTP channel, and round-trips dominate.
+    PUT_JOBS = 8
+
+    def __attrs_post_init__(self):
+        super(SSHSession, self).__attrs_post_init__()
+        # Keeps its SFTP clients for the lifetime of the session.
+        self._transfer = SSHTransfer(self)
+
+    @borrowdoc(Session)
+    def close(self):
+        self._transfer.close()
+        super(SSHSession, self).close()
+
     @borrowdoc(Session)
     def _execute_command(self, command, env=None, cwd=None, with_shell=False,
                         handle_permission_denied=True):
@@ -217,18 +230,23 @@ class SSHSession(POSIXSession):
 
         return (result.stdout, result.stderr)
 
+    @property
+    @borrowdoc(Session)
+    def identity(self):
+        return "ssh:%s@%s:%s" % (self.connection.user, self.connection.host,
+                                 self.connection.port)
+
+    @borrowdoc(Session)
+    def _open_agent_channel(self):
+        if not self.connection.is_connected:
+            self.connection.open()
+        return ParamikoAgentChannel(self.connection.client.get_transport(),
+                                    command_as_string(AGENT_COMMAND))
+
     @borrowdoc(Session)
     def put(self, src_path, dest_path, uid=-1, gid=-1):
         dest_path = self._prepare_dest_path(src_path, dest_path, local=False)
-        sftp = self.connection.sftp()
-        self.transfer_recursive(
-            src_path, 
-            dest_path, 
-            os.path.isdir, 
-            os.listdir, 
-            sftp.mkdir, 
-            self.connection.put
-        )
+        self._transfer.put(src_path, dest_path)
 
         if uid > -1 or gid > -1:
             self.chown(dest_path, uid, gid, recursive=True)
@@ -236,15 +254,7 @@ class SSHSession(POSIXSession):
     @borrowdoc(Session)
     def get(self, src_path, dest_path=None, uid=-1, gid=-1):
         dest_path = self._prepare_dest_path(src_path, dest_path)
-        sftp = self.connection.sftp()
-        self.transfer_recursive(
-            src_path, 
-            dest_path, 
-            lambda f: stat.S_ISDIR(sftp.stat(f).st_mode), 
-            sftp.listdir, 
-            os.mkdir, 
-            self.connection.get
-        )
+        self._transfer.get(src_path, dest_path)
 
         if uid > -1 or gid > -1:
             self.chown(dest_path, uid, gid, remote=False, recursive=True)
@@ -0,0 +1,266 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Bulk transfers of file trees over SSH.
+
+Copying a tree file by file via a single SFTP channel costs several
+round-trips per file (stat, listdir, open, ...).  `SSHTransfer` instead
+lists the whole tree with a single command and then either transfers the
+files over a bounded pool of concurrent SFTP channels, or, for many small
+files, streams them as a tar archive over a single channel.
+"""
+
+import errno
+import logging
+import os
+import os.path as op
+import queue
+import stat
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from reproman.dochelpers import exc_str
+from reproman.resource.session import TransferStats
+from reproman.support.exceptions import CommandError
+from reproman.utils import command_as_string
+from reproman.utils import execute_command_batch
+from reproman.utils import extract_tar_chunks
+from reproman.utils import iter_tar_chunks
+
+lgr = logging.getLogger('reproman.resource.ssh_transfer')
+
+
+class SSHTransfer(object):
+    """Transfer files and directories between local machine and an SSHSession.
+
+    Parameters
+    ----------
+    session : SSHSession
+    jobs : int, optional
+        Maximal number of SFTP channels to transfer files concurrently.
+    tar_min_files : int or None, optional
+        Transfer a directory as a tar stream if it has at least that many
+        files, and they are small (see `tar_max_mean_size`).  None to always
+        use SFTP.
+    tar_max_mean_size : int, optional
+        Maximal mean size (in bytes) of files to transfer as a tar stream.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, session, jobs=4, tar_min_files=100,
+                 tar_max_mean_size=1 << 20):
+        self.session = session
+        self.jobs = jobs
+        self.tar_min_files = tar_min_files
+        self.tar_max_mean_size = tar_max_mean_size
+        # Idle SFTP clients, reused across transfers until `close`.
+        self._sftps = queue.Queue()
+
+    def close(self):
+        """Close the SFTP clients kept for reuse"""
+        while not self._sftps.empty():
+            self._sftps.get_nowait().close()
+
+    def _get_transport(self):
+        connection = self.session.connection
+        if not connection.is_connected:
+            connection.open()
+        return connection.client.get_transport()
+
+    def _open_sftp(self):
+        """Return a new SFTP client, over its own channel"""
+        import paramiko
+        return paramiko.SFTPClient.from_transport(self._get_transport())
+
+    def _exec_stream(self, command, input_chunks=None):
+        """Run `command` in the session, streaming its input or output
+
+        Parameters
+        ----------
+        command : list or str
+        input_chunks : iterable of bytes, optional
+            Fed to the standard input of the command.
+
+        Yields
+        ------
+        bytes
+            Chunks of the standard output of the command.
+
+        Raises
+        ------
+        CommandError
+            If the command fails.
+        """
+        command = command_as_string(command)
+        chan = self._get_transport().open_session()
+        try:
+            chan.exec_command(command)
+            if input_chunks is not None:
+                for chunk in input_chunks:
+                    chan.sendall(chunk)
+                chan.shutdown_write()
+            for chunk in iter(lambda: chan.recv(self.CHUNK_SIZE), b""):
+                yield chunk
+            status = chan.recv_exit_status()
+            if status:
+                err = chan.makefile_stderr("rb").read().decode(
+                    "utf-8", "replace")
+                raise CommandError(command, "Failed to run %r" % command,
+                                   status, "", err)
+        finally:
+            chan.close()
+
+    def _use_tar(self, sizes):
+        return (self.tar_min_files is not None
+                and len(sizes) >= self.tar_min_files
+                and sum(sizes) <= self.tar_max_mean_size * len(sizes))
+
+    def _transfer_files(self, pairs, method, stats):
+        """Transfer (source, destination, size, mode) `pairs` concurrently
+
+        Unlike fabric's, SFTPClient's methods do not preserve the mode of the
+        files, so it is set explicitly.  SFTP clients are kept for subsequent
+        transfers.
+
+        Parameters
+        ----------
+        pairs : list of tuples
+        method : {"get", "put"}
+            SFTPClient method to transfer a file with.
+        stats : TransferStats
+        """
+        sftps = self._sftps
+
+        def transfer(pair):
+            src, dest, size, mode = pair
+            try:
+                sftp = sftps.get_nowait()
+            except queue.Empty:
+                sftp = self._open_sftp()
+            try:
+                getattr(sftp, method)(src, dest)
+                if method == "put":
+                    sftp.chmod(dest, mode)
+            except Exception:
+                # The channel might be broken; don't reuse it.
+                sftp.close()
+                raise
+            sftps.put(sftp)
+            if method == "get":
+                os.chmod(dest, mode)
+            stats.add(size)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            # list() to raise the first failure, if any
+            list(executor.map(transfer, pairs))
+
+    def get(self, src_path, dest_path):
+        """Copy `src_path` from the session to local `dest_path`
+
+        Returns
+        -------
+        dict
+            Status of the copied tree as returned by `Session.stat_tree`.
+        """
+        stats = TransferStats()
+        tree = self.session.stat_tree(src_path)
+        if not tree:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    src_path)
+        if not stat.S_ISDIR(tree[""].mode):
+            # as fabric's Connection.get
+            if op.isdir(dest_path):
+                dest_path = op.join(dest_path, op.basename(src_path))
+            self._transfer_files([(src_path, dest_path, tree[""].size,
+                                   stat.S_IMODE(tree[""].mode))],
+                                 "get", stats)
+            os.utime(dest_path, (tree[""].mtime, tree[""].mtime))
+            stats.log("Fetched", "via SFTP")
+            return tree
+
+        files = {p: st for p, st in tree.items()
+                 if stat.S_ISREG(st.mode)}
+        if self._use_tar([st.size for st in files.values()]):
+            try:
+                if not op.exists(dest_path):
+                    os.makedirs(dest_path)
+                extract_tar_chunks(
+                    self._exec_stream(["tar", "-C", src_path, "-cf", "-",
+                                       "."]),
+                    dest_path)
+                stats.add(sum(st.size for st in files.values()),
+                          len(files))
+                stats.log("Fetched", "via tar")
+                return tree
+            except (CommandError, tarfile.TarError) as exc:
+                lgr.debug("Failed to fetch %s as a tar stream, "
+                          "falling back to SFTP: %s", src_path, exc_str(exc))
+
+        for p, st in sorted(tree.items()):
+            if stat.S_ISDIR(st.mode):
+                path = op.join(dest_path, p) if p else dest_path
+                if not op.exists(path):
+                    os.makedirs(path)
+        self._transfer_files(
+            [(op.join(src_path, p), op.join(dest_path, p), st.size,
+              stat.S_IMODE(st.mode))
+             for p, st in sorted(files.items())],
+            "get", stats)
+        # Keep modification times, so the copies could be compared to the
+        # originals without reading them.
+        for p, st in files.items():
+            os.utime(op.join(dest_path, p), (st.mtime, st.mtime))
+        stats.log("Fetched", "via SFTP")
+        return tree
+
+    def put(self, src_path, dest_path):
+        """Copy local `src_path` to `dest_path` within the session
+        """
+        stats = TransferStats()
+        if not op.isdir(src_path):
+            # as fabric's Connection.put
+            if self.session.isdir(dest_path):
+                dest_path = op.join(dest_path, op.basename(src_path))
+            st = os.stat(src_path)
+            self._transfer_files(
+                [(src_path, dest_path, st.st_size, stat.S_IMODE(st.st_mode))],
+                "put", stats)
+            stats.log("Uploaded", "via SFTP")
+            return
+
+        dirs = [dest_path]
+        files = []
+        for root, dirnames, filenames in os.walk(src_path):
+            relroot = op.relpath(root, src_path)
+            dirs.extend(op.normpath(op.join(dest_path, relroot, d))
+                        for d in dirnames)
+            for f in filenames:
+                st = os.stat(op.join(root, f))
+                files.append((op.join(root, f),
+                              op.normpath(op.join(dest_path, relroot, f)),
+                              st.st_size, stat.S_IMODE(st.st_mode)))
+
+        if self._use_tar([size for _, _, size, _ in files]):
+            try:
+                for _ in self._exec_stream(
+                        ["sh", "-c", 'mkdir -p "$1" && tar -C "$1" -xf -',
+                         "sh", dest_path],
+                        iter_tar_chunks(src_path, arcname=".",
+                                        chunk_size=self.CHUNK_SIZE)):
+                    pass
+                stats.add(sum(size for _, _, size, _ in files), len(files))
+                stats.log("Uploaded", "via tar")
+                return
+            except CommandError as exc:
+                lgr.debug("Failed to upload %s as a tar stream, "
+                          "falling back to SFTP: %s", src_path, exc_str(exc))
+
+        for _ in execute_command_batch(self.session, ["mkdir", "-p"], dirs):
+            pass
+        self._transfer_files(files, "put", stats)
+        stats.log("Uploaded", "via SFTP")
@@ -7,6 +7,7 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
 import logging
+import os.path as op
 from unittest.mock import patch, MagicMock, call
 
 from ...utils import merge_dicts
@@ -184,3 +185,33 @@ def test_image_name_latest_default():
                           ("busybox@ddeeaa", "busybox@ddeeaa"),
                           ("busybox", "busybox:latest")]:
         assert DockerContainer(name="cname", image=img).image == expected
+
+
+@mark.skipif_no_docker_dependencies
+def test_docker_session_transfer_streams(tmpdir):
+    from ..docker_container import DockerSession
+    from ...tests.utils import create_tree, ok_file_has_content
+    from ...utils import extract_tar_chunks, iter_tar_chunks
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"src": {"f": "content", "d": {"sub": "sub"}}})
+    client = MagicMock()
+    # Commands (e.g., testing the destination directory) succeed.
+    client.exec_start.return_value = [b"Found\n"]
+    client.exec_inspect.return_value = {"ExitCode": 0}
+    session = DockerSession(client=client, container={"Id": "cid"})
+
+    # put() hands the archive over in chunks ...
+    def put_archive(container, path, data):
+        assert not isinstance(data, bytes)
+        extract_tar_chunks(data, op.join(tmpdir, "container" + path))
+    client.put_archive.side_effect = put_archive
+    session.put(op.join(tmpdir, "src"), "/dest")
+    ok_file_has_content(op.join(tmpdir, "container", "dest", "f"), "content")
+
+    # ... and get() extracts the chunks it receives.
+    client.get_archive.return_value = (
+        iter_tar_chunks(op.join(tmpdir, "container", "dest"), arcname="dest",
+                        chunk_size=3),
+        {})
+    session.get("/dest", op.join(tmpdir, "got"))
+    ok_file_has_content(op.join(tmpdir, "got", "d", "sub"), "sub")
@@ -13,6 +13,7 @@ from fabric import Connection
 from importlib import import_module
 import pytest
 import tempfile
+from unittest.mock import patch
 import uuid
 
 from ..session import get_updated_env, Session
@@ -260,6 +261,17 @@ def check_methods(resource_test_dir):
         result = session.isdir('/no/such/dir')
         assert not result
 
+        # Check the batched variants
+        paths = ['/etc', '/etc/hosts', '/no/such/file']
+        assert session.isdir_many(paths) == {
+            '/etc': True, '/etc/hosts': False, '/no/such/file': False}
+        assert session.exists_many(paths) == {
+            '/etc': True, '/etc/hosts': True, '/no/such/file': False}
+        stats = session.stat_many(paths)
+        assert stats['/no/such/file'] is None
+        assert stats['/etc/hosts'].size == len(session.read('/etc/hosts'))
+        assert session.stat_many([]) == {}
+
         # Create a temporary test file
         with tempfile.TemporaryDirectory(dir=resource_test_dir) as tdir:
             create_tree(tdir,
@@ -389,6 +401,205 @@ def test_session_shell(check_methods):
     check_methods("ShellSession", ShellSession())
 
 
+def test_session_shell_agent(check_methods):
+    from reproman.resource.shell import ShellSession
+
+    # check_methods() leaves files named after the class behind.
+    class AgentShellSession(ShellSession):
+        pass
+
+    session = AgentShellSession()
+    assert session.start_agent()
+    try:
+        check_methods("ShellSession", session)
+        # The agent is still in use after serving (and failing) requests.
+        assert session._agent is not None
+    finally:
+        session.close()
+    assert session._agent is None
+
+
+def test_session_agent_calls(tmpdir):
+    from reproman.resource.agent import AgentError
+    from reproman.resource.shell import ShellSession
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"f": "content", "d": {"sub": ""}})
+    session = ShellSession()
+    assert session.start_agent()
+    # Starting again is a noop.
+    assert session.start_agent()
+    agent = session._agent
+    try:
+        assert agent.call("ping") == "pong"
+        fpath = os.path.join(tmpdir, "f")
+        mode, size, _ = agent.call("stat", fpath)
+        assert size == len("content")
+        assert agent.call("stat", os.path.join(tmpdir, "missing")) is None
+        assert agent.read(fpath) == b"content"
+        assert session.read(fpath) == "content"
+        assert session.get_mtime(fpath) == str(os.path.getmtime(fpath))
+        assert sorted(session.listdir(tmpdir)) == ["d", "f"]
+        with pytest.raises(AgentError):
+            agent.call("read", os.path.join(tmpdir, "missing"))
+        with pytest.raises(AgentError):
+            agent.call("no such op")
+        # Failures of individual requests do not stop the agent.
+        assert agent.alive
+    finally:
+        session.stop_agent()
+    assert not agent.alive
+    # Without an agent, methods still work.
+    assert session.read(fpath) == "content"
+    assert sorted(session.listdir(tmpdir)) == ["d", "f"]
+
+
+def test_session_agent_dead_falls_back(tmpdir):
+    from reproman.resource.shell import ShellSession
+    session = ShellSession()
+    assert session.start_agent()
+    # Simulate the agent going away under our feet.
+    session._agent._channel._proc.kill()
+    session._agent._channel._proc.wait()
+    with swallow_logs(new_level=logging.WARNING) as log:
+        assert session.exists(str(tmpdir))
+        assert "no longer using it" in log.out
+    assert session._agent is None
+
+
+def test_session_agent_malformed_response(tmpdir):
+    from reproman.resource.agent import AgentError
+    from reproman.resource.shell import ShellSession
+    session = ShellSession()
+    assert session.start_agent()
+    agent = session._agent
+    # E.g., a shell banner in the way of the response
+    with patch.object(agent._channel, "readline",
+                      return_value=b"Welcome!\n"):
+        with pytest.raises(AgentError):
+            agent.call("ping")
+    assert not agent.alive
+    with swallow_logs(new_level=logging.WARNING) as log:
+        assert session.exists(str(tmpdir))
+        assert "no longer using it" in log.out
+    assert session._agent is None
+
+
+def test_session_agent_stopped_concurrently(tmpdir):
+    from reproman.resource.agent import AgentError
+    from reproman.resource.shell import ShellSession
+    session = ShellSession()
+    assert session.start_agent()
+    agent = session._agent
+
+    def call(op, *args):
+        # Another thread stops the agent while this call is under way.
+        session.stop_agent()
+        raise AgentError("Agent exited unexpectedly")
+
+    with patch.object(agent, "call", call):
+        assert session.exists(str(tmpdir))
+    assert session._agent is None
+    # Stopping a previous agent leaves a new one running.
+    assert session.start_agent()
+    session.stop_agent(agent)
+    assert session._agent is not None
+    session.stop_agent()
+
+
+def test_posix_session_stat_many(tmpdir):
+    from reproman.resource.shell import ShellSession
+    from ..session import POSIXSession
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"a file": "content", "d": {}})
+    paths = [os.path.join(tmpdir, "a file"), os.path.join(tmpdir, "d"),
+             os.path.join(tmpdir, "missing")]
+    session = ShellSession()
+    expected = session.stat_many(paths)
+    assert expected[paths[0]].size == len("content")
+    assert expected[paths[2]] is None
+    # The command-based implementation, with stat or python ...
+    stats = POSIXSession.stat_many(session, paths)
+    assert {p: st and st[:2] for p, st in stats.items()} == \
+        {p: st and st[:2] for p, st in expected.items()}
+    # Modification times keep the fraction of the second.
+    for p in paths[:2]:
+        assert abs(stats[p].mtime - expected[p].mtime) < 1e-6
+    with patch.object(POSIXSession, "_STAT_MANY_CMD", ["echo"]):
+        stats = POSIXSession.stat_many(session, paths)
+    assert stats == expected
+    # ... and the agent agree.
+    assert session.start_agent()
+    try:
+        assert POSIXSession.stat_many(session, paths) == expected
+    finally:
+        session.stop_agent()
+
+
+def test_posix_session_stat_tree(tmpdir):
+    from reproman.resource.shell import ShellSession
+    from ..session import POSIXSession
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"a file": "content", "d": {"sub": "", "e": {}}})
+    os.symlink("a file", os.path.join(tmpdir, "link"))
+    os.symlink("missing", os.path.join(tmpdir, "broken"))
+    session = ShellSession()
+    expected = session.stat_tree(tmpdir)
+    assert sorted(expected) == ["", "a file", "d", "d/e", "d/sub", "link"]
+    assert expected["a file"].size == len("content")
+    assert expected["link"] == expected["a file"]
+    assert session.stat_tree(os.path.join(tmpdir, "a file")) == \
+        {"": expected["a file"]}
+    assert session.stat_tree(os.path.join(tmpdir, "missing")) == {}
+
+    def compare(tree):
+        assert {p: (st.mode, st.size, int(st.mtime))
+                for p, st in tree.items()} == \
+            {p: (st.mode, st.size, int(st.mtime))
+             for p, st in expected.items()}
+    # The command-based implementation, with find or python ...
+    compare(POSIXSession.stat_tree(session, tmpdir))
+    with patch.object(POSIXSession, "_STAT_TREE_CMD", ["true"]):
+        compare(POSIXSession.stat_tree(session, tmpdir))
+        assert POSIXSession.stat_tree(
+            session, os.path.join(tmpdir, "missing")) == {}
+    # ... and the agent agree.
+    assert session.start_agent()
+    try:
+        compare(POSIXSession.stat_tree(session, tmpdir))
+    finally:
+        session.stop_agent()
+
+
+def test_posix_session_digest(tmpdir):
+    from reproman.resource.shell import ShellSession
+    from reproman.support.digests import Digester
+    from ..session import POSIXSession
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"a file": "content" * 1000})
+    path = os.path.join(tmpdir, "a file")
+    expected = Digester()(path)
+    session = ShellSession()
+    assert session.digest(path) == expected
+    assert session.digest(path, ["md5"], blocksize=10) == \
+        {"md5": expected["md5"]}
+    # The command-based implementation, with python ...
+    assert POSIXSession.digest(session, path, blocksize=10) == expected
+    # ... or coreutils ...
+    with patch.object(POSIXSession, "_PY_DIGEST_CMD", ["false"]):
+        assert POSIXSession.digest(session, path) == expected
+    # ... and the agent agree.
+    assert session.start_agent()
+    try:
+        assert POSIXSession.digest(session, path, ["sha1"]) == \
+            {"sha1": expected["sha1"]}
+    finally:
+        session.stop_agent()
+
+
+def test_session_agent_unsupported():
+    assert not Session().start_agent()
+
+
 def import_resource(mod, cls):
     return getattr(import_module("reproman.resource." + mod),
                    cls)
@@ -445,3 +656,57 @@ def test_session_container(location, testing_container, check_methods):
                      if '/testing-container' in c['Names'])
     assert container
     check_methods(location[1], cls(client, container))
+
+
+def test_session_put_many(tmpdir):
+    from reproman.resource.shell import ShellSession
+    tmpdir = str(tmpdir)
+    src = os.path.join(tmpdir, "src")
+    dest = os.path.join(tmpdir, "dest")
+    create_tree(src, {"f%d" % i: str(i) for i in range(5)})
+    create_tree(src, {"d": {"sub": "sub"}})
+    pairs = [(os.path.join(src, "f%d" % i),
+              os.path.join(dest, "a" if i % 2 else "b", "f%d" % i))
+             for i in range(5)]
+    pairs.append((os.path.join(src, "d"), os.path.join(dest, "c", "d")))
+
+    session = ShellSession()
+    put = session.put
+    failed = []
+
+    def flaky_put(src_path, dest_path):
+        # Fail the first attempt for one of the files.
+        if src_path.endswith("f3") and not failed:
+            failed.append(src_path)
+            raise OSError("flaky")
+        return put(src_path, dest_path)
+
+    with patch.object(session, "put", side_effect=flaky_put), \
+            patch.object(session, "execute_command",
+                         wraps=session.execute_command) as ec, \
+            swallow_logs(new_level=logging.INFO) as log:
+        session.put_many(pairs, jobs=3)
+        # A single command created all the directories.
+        assert ec.call_count == 1
+        assert "Uploaded 6 files" in log.out
+    assert failed
+    for i in range(5):
+        with open(os.path.join(dest, "a" if i % 2 else "b", "f%d" % i)) as f:
+            assert f.read() == str(i)
+    with open(os.path.join(dest, "c", "d", "sub")) as f:
+        assert f.read() == "sub"
+
+    # Remote directories created by put_many are not checked again.
+    with patch.object(session, "_known_dirs", frozenset(["/known"])), \
+            patch.object(session, "exists",
+                         side_effect=AssertionError("should not be called")):
+        assert session._prepare_dest_path("f", "/known/f", local=False) == \
+            "/known/f"
+
+    def failing_put(src_path, dest_path):
+        raise OSError("broken")
+
+    with patch.object(session, "put", side_effect=failing_put), \
+            patch("reproman.resource.session.time.sleep"):
+        with pytest.raises(OSError):
+            session.put_many(pairs[:1], retries=1)
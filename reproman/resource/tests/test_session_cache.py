@@ -0,0 +1,121 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import logging
+import os
+import os.path as op
+from unittest.mock import patch
+
+from ..session import PathStat
+from ..session_cache import SessionCache
+from ..shell import ShellSession
+from ...tests.utils import create_tree
+from ...utils import swallow_logs
+
+
+def test_session_cache_lru():
+    cache = SessionCache(maxsize=2)
+    assert cache.get("isdir", "/a") == (False, None)
+    cache.set("isdir", "/a", True)
+    cache.set("isdir", "/b", False)
+    assert cache.get("isdir", "/a") == (True, True)
+    # /b is the least recently used one now.
+    cache.set("isdir", "/c", True)
+    assert cache.get("isdir", "/b") == (False, None)
+    assert cache.get("isdir", "/c") == (True, True)
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_session_cache_stat_answers():
+    cache = SessionCache()
+    cache.set("stat", "/d", PathStat(0o40755, 0, 0))
+    cache.set("stat", "/f", PathStat(0o100644, 3, 0))
+    cache.set("stat", "/none", None)
+    assert cache.get("isdir", "/d") == (True, True)
+    assert cache.get("isdir", "/f") == (True, False)
+    assert cache.get("exists", "/f") == (True, True)
+    assert cache.get("exists", "/none") == (True, False)
+    assert cache.get("read", "/f") == (False, None)
+
+
+def test_session_cache_invalidate():
+    cache = SessionCache()
+    for path in ["/", "/a", "/a/b", "/a/b/c", "/a/bc", "/x"]:
+        cache.set("exists", path, True)
+    cache.invalidate("/a/b")
+    assert sorted(k[1] for k in cache._data) == ["/a/b/c", "/a/bc", "/x"]
+    cache.invalidate("/a/b", recursive=True)
+    assert sorted(k[1] for k in cache._data) == ["/a/bc", "/x"]
+    cache.clear()
+    assert not len(cache)
+
+
+def test_session_cache_index():
+    cache = SessionCache(maxsize=3)
+    cache.set("exists", "/a/b/c", True)
+    cache.set("isdir", "/a/b/c/", False)
+    cache.set("exists", "/a/d", True)
+    assert cache._keys["/a/b/c"] == {("exists", "/a/b/c"),
+                                     ("isdir", "/a/b/c/")}
+    # Evicted entries leave the index ...
+    cache.set("exists", "/x", True)
+    cache.set("exists", "/y", True)
+    assert sorted(cache._keys) == ["/a/d", "/x", "/y"]
+    assert "/a/b" not in cache._children
+    assert cache._children["/a"] == {"/a/d"}
+    # ... as do invalidated ones.
+    cache.invalidate("/", recursive=True)
+    assert not len(cache)
+    assert not cache._keys
+    assert not cache._children
+
+
+def test_session_enable_cache(tmpdir):
+    tmpdir = str(tmpdir)
+    create_tree(tmpdir, {"f": "content"})
+    fpath = op.join(tmpdir, "f")
+    session = ShellSession()
+    cache = session.enable_cache()
+    assert session.enable_cache() is cache
+
+    with patch("os.stat", wraps=os.stat) as stat:
+        assert session.stat_many([fpath])[fpath].size == len("content")
+        assert stat.call_count == 1
+        # Answered by the cache, including the derived queries.
+        session.stat_many([fpath])
+        assert session.isdir_many([fpath]) == {fpath: False}
+        assert session.exists_many([fpath]) == {fpath: True}
+        assert stat.call_count == 1
+
+    assert session.read(fpath) == "content"
+    with open(fpath, "w") as f:
+        f.write("changed")
+    assert session.read(fpath) == "content"
+
+    # Modifications through the session invalidate the cache.
+    dpath = op.join(tmpdir, "d")
+    assert not session.isdir(dpath)
+    session.mkdir(dpath)
+    assert session.isdir(dpath)
+    session.put(fpath, op.join(dpath, "f"))
+    assert session.exists(op.join(dpath, "f"))
+    session.chmod(tmpdir, "755", recursive=True)
+    assert session.read(fpath) == "changed"
+
+    # Getting files changes only the local file system.
+    assert session.exists(op.join(dpath, "f"))
+    with patch.object(cache, "invalidate") as invalidate:
+        session.get(op.join(dpath, "f"), op.join(tmpdir, "g"))
+        assert not invalidate.called
+
+    with swallow_logs(new_level=logging.DEBUG) as log:
+        session.disable_cache()
+        assert "hits" in log.out
+    assert session.cache is None
+    assert "isdir" not in session.__dict__
@@ -0,0 +1,155 @@
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the reproman package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+
+import logging
+import os
+import os.path as op
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+from ..shell import ShellSession
+from ..ssh_transfer import SSHTransfer
+from ...support.exceptions import CommandError
+from ...tests.utils import create_tree
+from ...tests.utils import ok_file_has_content
+from ...utils import swallow_logs
+
+
+class LocalSFTP(object):
+    """Like paramiko's SFTPClient, copies content but not the mode"""
+
+    def get(self, src, dest):
+        shutil.copyfile(src, dest)
+
+    put = get
+
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
+
+    def close(self):
+        pass
+
+
+class LocalTransfer(SSHTransfer):
+    """Transfer within the local machine, instead of over SSH"""
+
+    def __init__(self, *args, **kwargs):
+        super(LocalTransfer, self).__init__(ShellSession(), *args, **kwargs)
+        self.nsftp = 0
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def _open_sftp(self):
+        with self._lock:
+            self.nsftp += 1
+        return LocalSFTP()
+
+    def _exec_stream(self, command, input_chunks=None):
+        self.commands.append(command)
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        if input_chunks is not None:
+            out, _ = proc.communicate(b"".join(input_chunks))
+            yield out
+        else:
+            proc.stdin.close()
+            for chunk in iter(lambda: proc.stdout.read(100), b""):
+                yield chunk
+        if proc.wait():
+            raise CommandError(command, "failed", proc.returncode)
+
+
+@pytest.fixture
+def tree(tmpdir):
+    path = op.join(str(tmpdir), "src")
+    create_tree(path, {"f": "f" * 1000,
+                       "x": "#!/bin/sh\n",
+                       "d": {"sub%d" % i: str(i) for i in range(10)},
+                       "empty": {}})
+    os.utime(op.join(path, "f"), (1000000000, 1000000000))
+    os.chmod(op.join(path, "x"), 0o755)
+    return path
+
+
+def check_copy(path):
+    ok_file_has_content(op.join(path, "f"), "f" * 1000)
+    assert os.stat(op.join(path, "f")).st_mtime == 1000000000
+    for i in range(10):
+        ok_file_has_content(op.join(path, "d", "sub%d" % i), str(i))
+    assert op.isdir(op.join(path, "empty"))
+    assert os.access(op.join(path, "x"), os.X_OK)
+    assert not os.access(op.join(path, "f"), os.X_OK)
+
+
+@pytest.mark.parametrize("tar_min_files", [None, 1], ids=["sftp", "tar"])
+def test_ssh_transfer_get(tree, tar_min_files):
+    dest = op.join(op.dirname(tree), "dest")
+    transfer = LocalTransfer(jobs=3, tar_min_files=tar_min_files)
+    with swallow_logs(new_level=logging.INFO) as log:
+        result = transfer.get(tree, dest)
+        assert "Fetched 12 files" in log.out
+        assert "MB/s" in log.out
+    check_copy(dest)
+    assert result["f"].size == 1000
+    if tar_min_files:
+        assert transfer.nsftp == 0
+    else:
+        assert 0 < transfer.nsftp <= 3
+        assert not transfer.commands
+
+
+@pytest.mark.parametrize("tar_min_files", [None, 1], ids=["sftp", "tar"])
+def test_ssh_transfer_put(tree, tar_min_files):
+    dest = op.join(op.dirname(tree), "dest")
+    transfer = LocalTransfer(jobs=3, tar_min_files=tar_min_files)
+    transfer.put(tree, dest)
+    ok_file_has_content(op.join(dest, "f"), "f" * 1000)
+    for i in range(10):
+        ok_file_has_content(op.join(dest, "d", "sub%d" % i), str(i))
+    assert op.isdir(op.join(dest, "empty"))
+    assert os.access(op.join(dest, "x"), os.X_OK)
+    assert bool(transfer.nsftp) != bool(tar_min_files)
+
+
+def test_ssh_transfer_reuse_sftp(tree):
+    transfer = LocalTransfer(jobs=3, tar_min_files=None)
+    for i in range(3):
+        transfer.put(tree, op.join(op.dirname(tree), "dest%d" % i))
+    # SFTP clients are reused across transfers, not opened for each.
+    assert 0 < transfer.nsftp <= 3
+    for i in range(3):
+        transfer.put(op.join(tree, "x"),
+                     op.join(op.dirname(tree), "x%d" % i))
+        assert os.access(op.join(op.dirname(tree), "x%d" % i), os.X_OK)
+    assert transfer.nsftp <= 3
+    transfer.close()
+    assert transfer._sftps.empty()
+
+
+def test_ssh_transfer_tar_fallback(tree):
+    dest = op.join(op.dirname(tree), "dest")
+    transfer = LocalTransfer(tar_min_files=1)
+    transfer._exec_stream = lambda *args: LocalTransfer._exec_stream(
+        transfer, ["false"])
+    transfer.get(tree, dest)
+    check_copy(dest)
+    assert transfer.nsftp
+
+
+def test_ssh_transfer_get_file(tree):
+    dest = op.dirname(tree)
+    LocalTransfer().get(op.join(tree, "d", "sub1"), dest)
+    ok_file_has_content(op.join(dest, "sub1"), "1")
+
+
+def test_ssh_transfer_get_missing(tree):
+    with pytest.raises(FileNotFoundError):
+        LocalTransfer().get(op.join(tree, "missing"), tree)
@@ -250,3 +250,136 @@ def parse_dpkgquery_line(line):
         if res['architecture'] is None:
             res.pop('architecture')
     return res
+
+
+# Dump everything needed to map files to packages from the dpkg database
+# (given as the only argument) in a single pass.  Each section is introduced
+# by a marker line, which neither the status file nor the file lists can
+# contain.
+DPKG_DB_DUMP_SCRIPT = """\
+cd "$1" || exit 1
+echo '@@@ status'; cat status
+echo '@@@ diversions'; cat diversions 2>/dev/null
+echo '@@@ mtimes'; find info -name '*.list' -printf '%T@ %f\\n'
+echo '@@@ lists'; find info -name '*.list' -exec grep -H '' {} +
+exit 0
+"""
+
+
+@attr.s
+class DpkgDatabase(object):
+    """Content of the dpkg database as parsed by `parse_dpkg_db_dump`
+    """
+    # "name" and "name:arch" -> deb822 fields of installed packages
+    packages = attrib(default=attr.Factory(dict))
+    # path -> list of dpkg-query like records ({"name", "architecture"})
+    owners = attrib(default=attr.Factory(dict))
+    # paths diverted from or to
+    diversions = attrib(default=attr.Factory(set))
+    # basename of a .list file -> its mtime
+    list_mtimes = attrib(default=attr.Factory(dict))
+
+    def get_list_mtime(self, name, architecture=None):
+        """Return mtime of the file list of a package, or None if unknown
+        """
+        if architecture:
+            mtime = self.list_mtimes.get(
+                "%s:%s.list" % (name, architecture))
+            if mtime is not None:
+                return mtime
+        return self.list_mtimes.get(name + ".list")
+
+    def add_package(self, pkg):
+        """Register deb822 fields `pkg` of an installed package
+        """
+        self.packages[pkg["package"]] = pkg
+        if "architecture" in pkg:
+            self.packages["%(package)s:%(architecture)s" % pkg] = pkg
+
+    def to_json(self):
+        """Return the content as a structure serializable to JSON
+
+        Shared package fields and owner records are stored only once.
+        """
+        return {
+            # Package names cannot contain colons, so these are the fields
+            # of every package exactly once.
+            "packages": [pkg for key, pkg in self.packages.items()
+                         if ":" not in key],
+            "owners": {path: [r["name"] + (":" + r["architecture"]
+                                           if "architecture" in r else "")
+                              for r in records]
+                       for path, records in self.owners.items()},
+            "diversions": sorted(self.diversions),
+            "list_mtimes": self.list_mtimes,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Recreate the database from the output of `to_json`
+        """
+        db = cls(diversions=set(data["diversions"]),
+                 list_mtimes=data["list_mtimes"])
+        for pkg in data["packages"]:
+            db.add_package(pkg)
+        records = {}
+        for path, names in data["owners"].items():
+            for name in names:
+                if name not in records:
+                    records[name] = _list_file_to_record(name + ".list")
+                db.owners.setdefault(path, []).append(records[name])
+        return db
+
+
+def _list_file_to_record(fname):
+    name = fname[:-len(".list")]
+    if ":" in name:
+        name, architecture = name.split(":", 1)
+        return {"name": name, "architecture": architecture}
+    return {"name": name}
+
+
+def parse_dpkg_db_dump(output):
+    """Parse output of `DPKG_DB_DUMP_SCRIPT`
+
+    Returns
+    -------
+    DpkgDatabase
+    """
+    sections = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith("@@@ "):
+            current = sections.setdefault(line[4:], [])
+        elif current is not None:
+            current.append(line)
+
+    db = DpkgDatabase()
+    if "status" not in sections or "lists" not in sections:
+        raise ValueError("Incomplete dump of the dpkg database")
+
+    for pkg in parse_apt_cache_show_pkgs_output(
+            "\n".join(sections["status"])):
+        if pkg.get("status", "").split()[-1:] != ["installed"]:
+            continue
+        db.add_package(pkg)
+
+    # The diversions file consists of triplets: from, to, and the package.
+    diversions = sections.get("diversions", [])
+    for idx in range(0, len(diversions) - 2, 3):
+        db.diversions.update(diversions[idx:idx + 2])
+
+    for line in sections.get("mtimes", []):
+        mtime, _, fname = line.partition(" ")
+        db.list_mtimes[fname] = float(mtime)
+
+    records = {}  # share records across files of the same package
+    for line in sections["lists"]:
+        fname, sep, path = line.partition(".list:")
+        if not sep or not path:
+            continue
+        fname = fname.rsplit("/", 1)[-1] + ".list"
+        if fname not in records:
+            records[fname] = _list_file_to_record(fname)
+        db.owners.setdefault(path, []).append(records[fname])
+    return db
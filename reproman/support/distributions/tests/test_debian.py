@@ -9,12 +9,18 @@
 
 """
 
+import json
+
 from ..debian import DebianReleaseSpec
 from ..debian import get_spec_from_release_file
 from ..debian import parse_dpkgquery_line
+from ..debian import parse_dpkg_db_dump
+from ..debian import DpkgDatabase
 
 from reproman.tests.utils import eq_, assert_is_subset_recur
 
+import pytest
+
 
 def test_get_spec_from_release_file(f=None):
     content = """\
@@ -373,3 +379,53 @@ def test_parse_dpkgquery_line():
             ('diversion by dash from: /bin/sh', None)
     ]:
         assert parse_dpkgquery_line(line) == expected
+
+
+def test_parse_dpkg_db_dump():
+    db = parse_dpkg_db_dump("""\
+@@@ status
+Package: dash
+Status: install ok installed
+Architecture: amd64
+Version: 0.5.12-2
+
+Package: zlib1g
+Status: install ok installed
+Architecture: amd64
+Multi-Arch: same
+Version: 1:1.2.13
+
+Package: gone
+Status: deinstall ok config-files
+Architecture: amd64
+Version: 1.0
+@@@ diversions
+/bin/sh
+/bin/sh.distrib
+dash
+@@@ mtimes
+1600000000.5 dash.list
+1600000001.0 zlib1g:amd64.list
+@@@ lists
+info/dash.list:/bin/dash
+info/dash.list:/usr
+info/zlib1g:amd64.list:/usr
+info/zlib1g:amd64.list:/usr/lib/x86_64-linux-gnu/libz.so.1
+""")
+    assert sorted(db.packages) == ["dash", "dash:amd64",
+                                   "zlib1g", "zlib1g:amd64"]
+    assert db.packages["zlib1g:amd64"]["version"] == "1:1.2.13"
+    assert db.diversions == {"/bin/sh", "/bin/sh.distrib"}
+    assert db.owners["/bin/dash"] == [{"name": "dash"}]
+    assert db.owners["/usr/lib/x86_64-linux-gnu/libz.so.1"] == \
+        [{"name": "zlib1g", "architecture": "amd64"}]
+    assert len(db.owners["/usr"]) == 2
+    assert db.get_list_mtime("dash", "amd64") == 1600000000.5
+    assert db.get_list_mtime("zlib1g", "amd64") == 1600000001.0
+
+    # The database survives a round trip through JSON.
+    assert DpkgDatabase.from_json(json.loads(json.dumps(db.to_json()))) == db
+    assert db.get_list_mtime("zlib1g") is None
+
+    with pytest.raises(ValueError):
+        parse_dpkg_db_dump("")
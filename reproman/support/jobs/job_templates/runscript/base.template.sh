@@ -11,6 +11,10 @@ num_subjobs={{ _num_subjobs }}
 metadir={{ shlex_quote(_meta_directory) }}
 rootdir={{ shlex_quote(root_directory) }}
 workdir={{ shlex_quote(working_directory) }}
+# Completion events are appended to this log, so that they can be followed
+# without polling the batch system.
+eventlog="$rootdir/events/$jobid"
+mkdir -p "$rootdir/events"
 
 _reproman_cmd_idx=$(($subjob + 1))
 export _reproman_cmd_idx
@@ -22,10 +26,15 @@ echo "[ReproMan] pre-command..."
 cd "$workdir"
 {% endblock %}
 
+# Each 26-byte record of the index holds the offset and length of a command
+# in the NUL-separated command array, so the command of this subjob can be
+# read without scanning the array.
+cmdarray="$metadir/"{{ shlex_quote(_command_array_file) }}
 get_command () {
-    perl -n0e \
-         '$idx=$ENV{_reproman_cmd_idx}; print "$_" if $. == $idx;' \
-         "$metadir/command-array"
+    record=$(dd if="$cmdarray.idx" bs=26 skip="$subjob" count=1 2>/dev/null)
+    test -n "$record" || return 0
+    set -- $record
+    tail -c +$(($1 + 1)) "$cmdarray" | head -c "$2"
 }
 
 cmd=$(get_command)
@@ -45,6 +54,7 @@ echo "[ReproMan] ... within $PWD"
     (echo "failed: $?" >"$metadir/status.$subjob";
      mkdir -p "$metadir/failed" && touch "$metadir/failed/$subjob")
 {% endblock %}
+echo "$subjob $(cat "$metadir/status.$subjob")" >>"$eventlog"
 
 if test $num_subjobs -eq $_reproman_cmd_idx
 then
@@ -69,4 +79,5 @@ echo "[ReproMan] post-command..."
 
 mkdir -p "$rootdir/completed/"
 touch "$rootdir/completed/$jobid"
+echo "completed" >>"$eventlog"
 fi
@@ -60,6 +60,37 @@ class LocalRegistry(object):
             yaml.safe_dump(kwds, jfh)
         lgr.info("Registered job %s", jobid)
 
+    def register_many(self, jobs):
+        """Register several jobs at once.
+
+        Unlike calling `register` for each job, the registry is listed only
+        once, and none of the jobs is registered if any of them already is.
+
+        Parameters
+        ----------
+        jobs : list of (str, dict)
+            Full ID of each job and the values to dump to its job file.
+        """
+        if not op.exists(self._root):
+            os.makedirs(self._root)
+
+        jobids = [jobid for jobid, _ in jobs]
+        taken = set(os.listdir(self._root))
+        clashes = set()
+        for jobid in jobids:
+            if jobid in taken:
+                clashes.add(jobid)
+            taken.add(jobid)
+        if clashes:
+            raise ValueError("Already registered: {}"
+                             .format(", ".join(sorted(clashes))))
+
+        for jobid, kwds in jobs:
+            with open(op.join(self._root, jobid), "w") as jfh:
+                yaml.safe_dump(kwds, jfh)
+            lgr.debug("Registered job %s", jobid)
+        lgr.info("Registered %d jobs", len(jobs))
+
     def unregister(self, jobid):
         """Unregister a job.
 
@@ -20,12 +20,19 @@ This module has three main parts:
 """
 
 import abc
+import base64
 import collections
 from contextlib import contextmanager
+import io
 import json
 import logging
 import os
 import os.path as op
+import shutil
+import stat
+import subprocess
+import tarfile
+from tempfile import mkdtemp
 import uuid
 import time
 import yaml
@@ -40,6 +47,7 @@ from reproman.utils import chpwd
 from reproman.utils import write_update
 from reproman.resource.shell import ShellSession
 from reproman.resource.ssh import SSHSession
+from reproman.support.digests import Digester
 from reproman.support.jobs.submitters import SUBMITTERS
 from reproman.support.jobs.template import Template
 from reproman.support.exceptions import CommandError
@@ -49,6 +57,108 @@ from reproman.support.external_versions import external_versions
 lgr = logging.getLogger("reproman.support.jobs.orchestrators")
 
 
+class JobStatus(object):
+    """Status of all subjobs of a job.
+
+    Parameters
+    ----------
+    statuses : list of str
+        Content of the status file of each subjob, or "unknown" if the subjob
+        has not written one (yet).
+    failed : list of int, optional
+        Subjobs marked as failed.
+    completed : bool, optional
+        Whether the run, including post-command processing, has completed.
+    """
+
+    CATEGORIES = ("submitted", "running", "succeeded", "failed", "unknown")
+
+    def __init__(self, statuses, failed=None, completed=False):
+        self.statuses = statuses
+        self.failed = sorted(failed or [])
+        self.completed = completed
+
+    @staticmethod
+    def categorize(status):
+        """Map a status written by the runscript to one of `CATEGORIES`.
+        """
+        # The runscript writes, e.g., "failed: 1" or "pre-command failure".
+        if status.startswith("fail") or status.endswith("failure"):
+            return "failed"
+        return status if status in JobStatus.CATEGORIES else "unknown"
+
+    @property
+    def counts(self):
+        """Number of subjobs in each of `CATEGORIES`.
+        """
+        counts = collections.OrderedDict((c, 0) for c in self.CATEGORIES)
+        failed = set(self.failed)
+        for idx, status in enumerate(self.statuses):
+            category = "failed" if idx in failed else self.categorize(status)
+            counts[category] += 1
+        return counts
+
+    @property
+    def summary(self):
+        """Single line summary, e.g. "succeeded" or "2 running, 1 failed".
+        """
+        if len(self.statuses) == 1:
+            return self.statuses[0]
+        counts = [(c, n) for c, n in self.counts.items() if n]
+        if len(counts) == 1:
+            return counts[0][0]
+        return ", ".join("{} {}".format(n, c) for c, n in counts)
+
+    def __repr__(self):
+        return "{}({!r}, failed={!r}, completed={!r})".format(
+            self.__class__.__name__, self.statuses, self.failed,
+            self.completed)
+
+
+SUBMIT_MODES = ("files", "bundle")
+
+# Name of the command array in the metadata directory.  Its index is next to
+# it, with an ".idx" suffix.
+COMMAND_ARRAY_FILE = "command-array"
+# Width of the byte offset and length fields in each record of the command
+# array index.  A record, including the separating space and the newline, is
+# 26 bytes, as the runscript expects.
+COMMAND_INDEX_WIDTH = 12
+
+
+def _write_command_array(commands, array_fh, index_fh):
+    """Write the command array and its index.
+
+    Commands are separated by NUL characters in the array.  The index has a
+    fixed-size record per command with the byte offset and length of its
+    UTF-8 encoding in the array, so that a subjob can seek to its command
+    rather than scan the array.  Commands are written as they come, so
+    `commands` can be a generator of any length.
+
+    Parameters
+    ----------
+    commands : iterable of str
+    array_fh, index_fh : file objects
+        Binary files to write the array and the index to.
+
+    Returns
+    -------
+    int, the number of commands.
+    """
+    record = "{{:{0}d}} {{:{0}d}}\n".format(COMMAND_INDEX_WIDTH)
+    offset = 0
+    count = 0
+    for cmd in commands:
+        data = cmd.encode("utf-8")
+        if count:
+            array_fh.write(b"\0")
+        array_fh.write(data)
+        index_fh.write(record.format(offset, len(data)).encode("ascii"))
+        offset += len(data) + 1
+        count += 1
+    return count
+
+
 # Abstract orchestrators
 
 
@@ -77,15 +187,21 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
     resurrection : boolean, optional
         Whether this instance represents a previous Orchestrator that already
         submitted a job. This allows a detached job to be fetched.
+    session : Session instance, optional
+        Session of the connected `resource` to use, so that it can be shared
+        between orchestrators.  By default, connect to `resource` and start a
+        new session.
     """
 
     template_name = None
 
     def __init__(self, resource, submission_type, job_spec=None,
-                 resurrection=False):
+                 resurrection=False, session=None):
         self.resource = resource
-        self.resource.connect()
-        self.session = resource.get_session()
+        if session is None:
+            self.resource.connect()
+            session = resource.get_session()
+        self.session = session
         self._resurrection = resurrection
 
         # TODO: Probe remote and try to infer.
@@ -93,6 +209,8 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
         self.submitter = submitter_class(self.session)
 
         self.job_spec = job_spec or {}
+        # Local directory with the command array until it is submitted
+        self._staging_dir = None
 
         if resurrection:
             important_keys = ["_jobid", "root_directory", "working_directory",
@@ -173,6 +291,12 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
         The information here will be used to re-initialize an equivalent object
         (e.g., if fetching results from a detached run).
         """
+        kwds = dict(self.template.kwds) if self.template else {}
+        # The records have been expanded into the command array (and the
+        # "*_array" keys of DataLad orchestrators).  They are not needed to
+        # re-initialize the orchestrator but, for large batches, would
+        # dominate the size of the job files, if they are not a generator.
+        kwds.pop("_resolved_batch_parameters", None)
         # Items that may not be in `templates.kwds`.
         to_dump = {"resource_id": self.resource.id,
                    "resource_name": self.resource.name,
@@ -186,42 +310,175 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
                    # incremented to signal a compatible change (e.g., a new
                    # field is added, but the code doesn't require it).
                    "_spec_version": "1.0"}
-        return dict(self.template.kwds if self.template else {},
-                    **to_dump)
+        return dict(kwds, **to_dump)
 
     def _prepare_spec(self):
         """Prepare the spec for the run.
 
-        At the moment, this involves constructing the "_command_array",
-        "_inputs_array", and "_outputs_array" keys.
+        The command is formatted with each batch record, if any, and written
+        to a local command array as the records come, so that neither the
+        records nor the commands are kept in memory.  The spec keeps only the
+        number of subjobs ("_num_subjobs"), the name of the command array,
+        and the inputs and outputs of all subjobs ("_all_inputs" and
+        "_all_outputs").
         """
         from reproman.support.globbedpaths import GlobbedPaths
 
         spec = self.job_spec
-        if spec.get("_resolved_batch_parameters"):
-            raise OrchestratorError(
-                "Batch parameters are currently only supported "
-                "in DataLad orchestrators")
+        # An empty list of records is the same as none.
+        records = spec.pop("_resolved_batch_parameters", None) or None
+        expanded = {key: set() for key in ["inputs", "outputs"]
+                    if key in spec}
+
+        def commands():
+            for record in records or [{}]:
+                for key in expanded:
+                    patterns = spec[key]
+                    if records is not None:
+                        patterns = [p.format(p=record) for p in patterns]
+                    expanded[key].update(
+                        GlobbedPaths(patterns).expand(dot=False))
+                cmd_str = spec.get("_resolved_command_str")
+                if cmd_str is not None and records is not None:
+                    cmd_str = cmd_str.format(p=record)
+                yield cmd_str
 
-        for key in ["inputs", "outputs"]:
-            if key in spec:
-                gp = GlobbedPaths(spec[key])
-                spec["_{}_array".format(key)] = [gp.expand(dot=False)]
         if "_resolved_command_str" in spec:
-            spec["_command_array"] = [spec["_resolved_command_str"]]
-        # Note: This doesn't adjust the command. We currently don't support any
-        # datalad-run-like command formatting.
+            nsubjobs = self._stage_command_array(commands())
+            if not nsubjobs:
+                raise OrchestratorError("No batch records to run")
+            spec["_num_subjobs"] = nsubjobs
+            spec["_command_array_file"] = COMMAND_ARRAY_FILE
+        else:
+            for _ in commands():
+                pass
+        for key, paths in expanded.items():
+            spec["_all_{}".format(key)] = sorted(paths)
+
+    def _stage_command_array(self, commands):
+        """Write `commands` to a local command array to submit.
+
+        Returns
+        -------
+        int, the number of commands.
+        """
+        self._staging_dir = mkdtemp(prefix="reproman-")
+        array = op.join(self._staging_dir, COMMAND_ARRAY_FILE)
+        with open(array, "wb") as array_fh, \
+                open(array + ".idx", "wb") as index_fh:
+            return _write_command_array(commands, array_fh, index_fh)
+
+    def _clean_staging_dir(self):
+        if self._staging_dir is not None:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+            self._staging_dir = None
+
+    @property
+    def num_subjobs(self):
+        """Number of subjobs, i.e. commands in the command array.
+        """
+        spec = self.job_spec
+        if "_num_subjobs" in spec:
+            return spec["_num_subjobs"]
+        return len(spec["_command_array"])
 
     @abc.abstractmethod
     def prepare_remote(self):
         """Prepare remote for run.
         """
 
+    # Unpack the submission files into the metadata directory $1 from the
+    # base64-encoded archive $2 or, if that is empty, from the archive file
+    # $3.  Then run the submission command (the remaining arguments) and
+    # print its output.
+    _SUBMIT_BUNDLE_SCRIPT = r"""
+set -e
+meta="$1"
+mkdir -p "$meta"
+if test -n "$2"
+then
+    printf '%s' "$2" | base64 -d | tar -C "$meta" -xzf -
+else
+    tar -C "$meta" -xzf "$3"
+    rm -f "$3"
+fi
+shift 3
+exec "$@"
+"""
+
+    # Largest base64-encoded bundle to pass within the submission command.
+    # Larger ones are uploaded first.
+    BUNDLE_INLINE_MAX = 1 << 16
+
+    def _get_bundle_wrapper(self, files, paths=()):
+        """Return command that unpacks `files` and runs a submission command.
+
+        Parameters
+        ----------
+        files : list of tuples
+            (name, text, executable) of the files to place in the metadata
+            directory.
+        paths : list of tuples, optional
+            (name, path) of local files to place in the metadata directory.
+
+        Returns
+        -------
+        list of str, to prepend to the submission command.
+        """
+        # The command array might be large, so build the bundle on disk.
+        bundle = op.join(self._staging_dir, "submit.tar.gz")
+        with tarfile.open(bundle, mode="w:gz") as tar:
+            for name, text, executable in files:
+                data = text.encode("utf-8")
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o775 if executable else 0o664
+                info.mtime = time.time()
+                tar.addfile(info, io.BytesIO(data))
+            for name, path in paths:
+                tar.add(path, arcname=name)
+        size = op.getsize(bundle)
+        encoded = ""
+        archive = ""
+        # Base64 takes 4 bytes for every 3.
+        if (size + 2) // 3 * 4 > self.BUNDLE_INLINE_MAX:
+            lgr.debug("Uploading submission bundle of %d bytes", size)
+            archive = op.join(self.root_directory,
+                              "submit-{}.tar.gz".format(self.jobid))
+            self.session.put(bundle, archive)
+        else:
+            with open(bundle, "rb") as fh:
+                encoded = base64.b64encode(fh.read()).decode("ascii")
+        return ["sh", "-c", self._SUBMIT_BUNDLE_SCRIPT, "sh",
+                self.meta_directory, encoded, archive]
+
     def submit(self):
         """Submit the job with `submitter`.
+
+        The runscript, submission script, and other files for the job are
+        placed in the metadata directory.  If the "submit_mode" job parameter
+        is "bundle", they are sent as a single archive that is unpacked by
+        the same command that submits the job.
         """
-        njobs = len(self.job_spec["_command_array"])
-        if njobs > 1 and self.submitter.name == "local":
+        submit_mode = self.job_spec.get("submit_mode") or "files"
+        if submit_mode not in SUBMIT_MODES:
+            raise OrchestratorError(
+                "Unknown submit_mode {!r}; expected one of {}"
+                .format(submit_mode, ", ".join(SUBMIT_MODES)))
+        if self._staging_dir is None:
+            # Orchestrators that keep the commands in the spec
+            self._stage_command_array(self.job_spec["_command_array"])
+            self.job_spec["_command_array_file"] = COMMAND_ARRAY_FILE
+        try:
+            self._submit(submit_mode)
+        finally:
+            self._clean_staging_dir()
+
+    def _submit(self, submit_mode):
+        njobs = self.num_subjobs
+        # In bundle mode, don't spend a round-trip on this notice.
+        if njobs > 1 and self.submitter.name == "local" \
+           and submit_mode == "files":
             will_cite = op.join(self.home, ".parallel", "will-cite")
             if not self.session.exists(will_cite):
                 lgr.info(
@@ -240,29 +497,36 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
                    _meta_directory_rel=op.relpath(self.meta_directory,
                                                   self.working_directory)))
         self.template = templ
-        self.session.put_text(
-            templ.render_runscript("{}.template.sh".format(
-                self.template_name or self.name)),
-            op.join(self.meta_directory, "runscript"),
-            executable=True)
-
+        files = [
+            ("runscript",
+             templ.render_runscript("{}.template.sh".format(
+                 self.template_name or self.name)),
+             True),
+            ("submit",
+             templ.render_submission("{}.template".format(
+                 self.submitter.name)),
+             True),
+            ("spec.yaml", yaml.safe_dump(self.as_dict()), False)]
+        paths = [(name, op.join(self._staging_dir, name))
+                 for name in [COMMAND_ARRAY_FILE,
+                              COMMAND_ARRAY_FILE + ".idx"]]
         submission_file = op.join(self.meta_directory, "submit")
-        self.session.put_text(
-            templ.render_submission("{}.template".format(self.submitter.name)),
-            submission_file,
-            executable=True)
-
-        self.session.put_text(
-            "\0".join(self.job_spec["_command_array"]),
-            op.join(self.meta_directory, "command-array"))
-
-        self.session.put_text(
-            yaml.safe_dump(self.as_dict()),
-            op.join(self.meta_directory, "spec.yaml"))
-
-        subm_id = self.submitter.submit(
-            submission_file,
-            submit_command=self.job_spec.get("submit_command"))
+
+        if submit_mode == "bundle":
+            subm_id = self.submitter.submit(
+                submission_file,
+                submit_command=self.job_spec.get("submit_command"),
+                wrapper=self._get_bundle_wrapper(files, paths))
+        else:
+            for name, text, executable in files:
+                self.session.put_text(text,
+                                      op.join(self.meta_directory, name),
+                                      executable=executable)
+            for name, path in paths:
+                self.session.put(path, op.join(self.meta_directory, name))
+            subm_id = self.submitter.submit(
+                submission_file,
+                submit_command=self.job_spec.get("submit_command"))
         if subm_id is None:
             lgr.warning("No submission ID obtained for %s", self.jobid)
         else:
@@ -287,6 +551,22 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
         # FIXME: How to handle subjobs?
         return self.get_status()
 
+    @property
+    def event_log(self):
+        """Log on the resource to which the runscript appends completion
+        events.
+        """
+        return op.join(self.root_directory, "events", self.jobid)
+
+    def remove_event_log(self):
+        """Remove the event log of the job from the resource.
+        """
+        try:
+            self.session.execute_command(["rm", "-f", self.event_log])
+        except CommandError as exc:
+            lgr.debug("Failed to remove %s: %s",
+                      self.event_log, exc_str(exc))
+
     @property
     def has_completed(self):
         """Has the run, including post-command processing, completed?
@@ -307,6 +587,58 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
             return []
         return list(map(int, stdout.strip().split()))
 
+    # Print "status IDX CONTENT" for every status file, "failed IDX" for every
+    # failed marker, and "completed" if post-command processing completed.
+    _STATUS_SCRIPT = r"""
+cd "$1" 2>/dev/null || exit 0
+for f in status.*; do
+    test -f "$f" && printf 'status %s %s\n' "${f#status.}" "$(cat "$f")"
+done
+for f in failed/*; do
+    test -e "$f" && printf 'failed %s\n' "${f#failed/}"
+done
+if test -e "$2"; then echo completed; fi
+exit 0
+"""
+
+    @staticmethod
+    def _parse_status_output(out, num_subjobs):
+        statuses = ["unknown"] * num_subjobs
+        failed = []
+        completed = False
+        for line in out.splitlines():
+            fields = line.split(" ", 2)
+            try:
+                if fields[0] == "status" and len(fields) == 3:
+                    idx = int(fields[1])
+                    if 0 <= idx < num_subjobs:
+                        statuses[idx] = fields[2].strip() or "unknown"
+                elif fields[0] == "failed" and len(fields) == 2:
+                    failed.append(int(fields[1]))
+                elif fields[0] == "completed":
+                    completed = True
+            except ValueError:
+                lgr.debug("Ignoring unexpected status line: %s", line)
+        return JobStatus(statuses, failed=failed, completed=completed)
+
+    def get_status_summary(self):
+        """Query the status of all subjobs with a single command.
+
+        This is equivalent to calling `get_status` for each subjob,
+        `get_failed_subjobs`, and `has_completed`, but doesn't require a
+        round-trip to the resource for each of them.
+
+        Returns
+        -------
+        JobStatus
+        """
+        out, _ = self.session.execute_command(
+            ["sh", "-c", self._STATUS_SCRIPT, "sh",
+             self.meta_directory,
+             op.join(self.root_directory, "completed", self.jobid)])
+        return self._parse_status_output(
+            out, self.num_subjobs)
+
     @staticmethod
     def _log_failed(jobid, metadir, failed):
         failed = list(sorted(failed))
@@ -354,7 +686,7 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
 
     def follow(self):
         """Follow command, exiting when post-command processing completes."""
-        self.submitter.follow()
+        self.submitter.follow(event_log=self.event_log)
         # We're done according to the submitter. This includes the
         # post-processing. Make sure it looks like it passed.
         if not self.has_completed:
@@ -365,10 +697,15 @@ class Orchestrator(object, metaclass=abc.ABCMeta):
 
     def _get_io_set(self, which, subjobs):
         spec = self.job_spec
-        if subjobs is None:
-            subjobs = range(len(spec["_command_array"]))
         key = "_{}_array".format(which)
-        values = spec.get(key)
+        if key not in spec:
+            # Files are not recorded per subjob when the commands are
+            # streamed (see `_prepare_spec`), so `subjobs` cannot narrow
+            # them down.
+            return set(spec.get("_all_{}".format(which)) or [])
+        if subjobs is None:
+            subjobs = range(self.num_subjobs)
+        values = spec[key]
         if not values:
             return set()
         return {fname for i in subjobs for fname in values[i]}
@@ -473,7 +810,7 @@ def _datalad_format_command(ds, spec):
         spec["_command_array"].append(format_command(ds, cmd_str, **fmt_kwds))
 
     exinputs = spec.get("_extra_inputs", [])
-    spec["_extra_inputs_array"] = [exinputs] * len(batch_parameters)
+    spec["_extra_inputs_array"] = [exinputs] * len(spec["_command_array"])
 
 
 def call_check_dl_results(fn, failure_msg, *args, **kwds):
@@ -504,10 +841,11 @@ class DataladOrchestrator(Orchestrator, metaclass=abc.ABCMeta):
     """
 
     def __init__(self, resource, submission_type, job_spec=None,
-                 resurrection=False):
+                 resurrection=False, session=None):
         external_versions.check("datalad", min_version="0.13")
         super(DataladOrchestrator, self).__init__(
-            resource, submission_type, job_spec, resurrection=resurrection)
+            resource, submission_type, job_spec, resurrection=resurrection,
+            session=session)
 
         from datalad.api import Dataset
         self.ds = Dataset(".")
@@ -589,12 +927,135 @@ class DataladOrchestrator(Orchestrator, metaclass=abc.ABCMeta):
 # Orchestrator method mixins
 
 
+INPUT_STORE_MODES = ("hardlink", "symlink")
+
+
 class PrepareRemotePlainMixin(object):
 
+    # Print the keys listed in the manifest $2 that are missing from the input
+    # store $1, creating the store directories they will be uploaded to.
+    _STORE_LOOKUP_SCRIPT = r"""
+store="$1"
+while IFS= read -r line
+do
+    key="${line%% *}"
+    dir="$store/${key%"${key#??}"}"
+    if ! test -e "$dir/$key"
+    then
+        mkdir -p "$dir" && echo "$key" || exit 1
+    fi
+done <"$2"
+"""
+
+    # Move the objects uploaded with suffix $4 into the input store $1, and
+    # link all the objects listed in the manifest $3 into the working
+    # directory $2, as hardlinks (falling back to symlinks) or, if $5 is
+    # "symlink", as symlinks.
+    _STORE_LINK_SCRIPT = r"""
+store="$1"
+wdir="$2"
+while IFS= read -r line
+do
+    key="${line%% *}"
+    obj="$store/${key%"${key#??}"}/$key"
+    if test -e "$obj$4"
+    then
+        if test -e "$obj"
+        then
+            rm -f "$obj$4"
+        else
+            case "$key" in
+                *-x) chmod +x "$obj$4";;
+            esac
+            mv -f "$obj$4" "$obj"
+        fi
+    fi
+    dest="$wdir/${line#* }"
+    mkdir -p "$(dirname "$dest")" && rm -f "$dest" || exit 1
+    if test "$5" = symlink
+    then
+        ln -s "$obj" "$dest"
+    else
+        ln "$obj" "$dest" 2>/dev/null || ln -s "$obj" "$dest"
+    fi || exit 1
+done <"$3"
+"""
+
+    @property
+    def input_store_directory(self):
+        """Content-addressed store of inputs under the root directory.
+        """
+        return op.join(self.root_directory, "input-store")
+
+    @staticmethod
+    def _get_input_files(inputs):
+        """Expand input directories into the files underneath them.
+        """
+        files = []
+        for i in inputs:
+            if op.isdir(i):
+                for root, _, fnames in os.walk(i):
+                    files.extend(op.join(root, f) for f in fnames)
+            else:
+                files.append(i)
+        return sorted(files)
+
+    def _put_inputs_via_store(self, inputs, how):
+        """Upload `inputs` to the input store and link them into place.
+
+        Only inputs whose content is not yet in the store are transferred.
+        The store is keyed by the SHA-256 digest of the content, with "-x"
+        appended for executable files.
+        """
+        session = self.session
+        digester = Digester(["sha256"])
+        manifest = []
+        objects = {}
+        for i in self._get_input_files(inputs):
+            relpath = op.relpath(i, self.local_directory)
+            if "\n" in relpath:
+                # Not representable in the manifest.
+                session.put(i, op.join(self.working_directory, relpath))
+                continue
+            key = digester(i)["sha256"]
+            if os.access(i, os.X_OK):
+                key += "-x"
+            objects.setdefault(key, i)
+            manifest.append("{} {}\n".format(key, relpath))
+        if not manifest:
+            return
+
+        manifest_file = op.join(self.meta_directory, "input-manifest")
+        session.put_text("".join(manifest), manifest_file)
+        store = self.input_store_directory
+        try:
+            out, _ = session.execute_command(
+                ["sh", "-c", self._STORE_LOOKUP_SCRIPT, "sh",
+                 store, manifest_file])
+        except CommandError as exc:
+            raise OrchestratorError(
+                "Failed to look up inputs in {}: {}".format(store, exc_str(exc)))
+        missing = sorted(set(out.split()))
+        lgr.info("Uploading %d of %d distinct inputs to the input store %s",
+                 len(missing), len(objects), store)
+        suffix = ".partial-" + self.jobid
+        session.put_many([(objects[key], op.join(store, key[:2], key + suffix))
+                          for key in missing])
+        try:
+            session.execute_command(
+                ["sh", "-c", self._STORE_LINK_SCRIPT, "sh",
+                 store, self.working_directory, manifest_file, suffix, how])
+        except CommandError as exc:
+            raise OrchestratorError(
+                "Failed to link inputs from {}: {}".format(store, exc_str(exc)))
+
     def prepare_remote(self):
         """Prepare "plain" execution directory on remote.
 
-        Create directory and copy inputs to it.
+        Create directory and copy inputs to it.  If the "input_store" job
+        parameter is set, inputs are instead uploaded to a content-addressed
+        store under the root directory, unless they are already there, and
+        linked into the working directory.
         """
         # TODO: Provide better handling of existing directories. This is
         # unlikely to happen with the default working directory but can easily
@@ -604,9 +1065,19 @@ class PrepareRemotePlainMixin(object):
         if not session.exists(self.root_directory):
             session.mkdir(self.root_directory, parents=True)
 
-        for i in self.get_inputs():
-            session.put(i, op.join(self.working_directory,
-                                   op.relpath(i, self.local_directory)))
+        input_store = self.job_spec.get("input_store")
+        if input_store:
+            if input_store not in INPUT_STORE_MODES:
+                raise OrchestratorError(
+                    "Unknown input_store {!r}; expected one of {}"
+                    .format(input_store, ", ".join(INPUT_STORE_MODES)))
+            self._put_inputs_via_store(self.get_inputs(), input_store)
+            return
+
+        session.put_many(
+            [(i, op.join(self.working_directory,
+                         op.relpath(i, self.local_directory)))
+             for i in sorted(self.get_inputs())])
 
 
 def _format_ssh_url(user, host, port, path):
@@ -673,6 +1144,36 @@ class PrepareRemoteDataladMixin(object):
                 status = status_from_ref.strip() or status
         return status
 
+    def get_status_summary(self):
+        """Like Orchestrator.get_status_summary, but inspect the job's git ref
+        if needed.
+        """
+        summary = super(DataladOrchestrator, self).get_status_summary()
+        if summary.counts["unknown"] < len(summary.statuses):
+            return summary
+        # As in `status`, the local tree might be different because of another
+        # job. Read all the status files from the ref at once.
+        meta_rel = op.relpath(self.meta_directory, self.working_directory)
+        try:
+            out = self._execute_in_wdir(
+                ["git", "grep", "--no-color", "-e", "^",
+                 self.job_refname, "--", meta_rel + "/status.*"])
+        except OrchestratorError as exc:
+            lgr.debug("Failed to get status from %s tree: %s",
+                      self.job_refname, exc_str(exc))
+            return summary
+        # Lines are "REF:META_REL/status.IDX:CONTENT".
+        prefix = "{}:{}/status.".format(self.job_refname, meta_rel)
+        lines = []
+        for line in out.splitlines():
+            if line.startswith(prefix):
+                idx, _, content = line[len(prefix):].partition(":")
+                lines.append("status {} {}".format(idx, content))
+        from_ref = self._parse_status_output(
+            "\n".join(lines), len(summary.statuses))
+        return JobStatus(from_ref.statuses, failed=summary.failed,
+                         completed=summary.completed)
+
     def get_failed_subjobs(self):
         """Like Orchestrator.get_failed_subjobs, but inspect the job's git ref if needed.
         """
@@ -866,8 +1367,202 @@ class PrepareRemoteDataladMixin(object):
             session.mkdir(self.meta_directory, parents=True)
 
 
+FETCH_MODES = ("full", "delta", "checksum")
+# Largest difference (in seconds) between modification times of a local and a
+# remote file that are considered equal.  Allows for precision lost when
+# passing the times around as floats.
+MTIME_TOLERANCE = 1e-3
+
+
+def _fetch_changed(session, src, dest, checksum=False, names=None):
+    """Fetch `src` from `session` to local `dest`, skipping unchanged files.
+
+    A local file is considered unchanged if it has the same size and
+    modification time (within `MTIME_TOLERANCE`) as the remote one.  The
+    modification times of fetched files are set to the remote ones, so they
+    compare equal next time.
+
+    Parameters
+    ----------
+    session : Session
+    src : str
+        File or directory within the session.
+    dest : str
+        Local path to fetch `src` to.
+    checksum : bool, optional
+        Compare files of the same size by their MD5 digests instead of their
+        modification times.
+    names : list of str, optional
+        Consider only these files (relative paths) under `src` directory.
+
+    Returns
+    -------
+    int
+        Number of fetched files.
+    """
+    tree = session.stat_tree(src)
+    if not tree:
+        # Fail the same way as without skipping.  If the session could get
+        # `src` nevertheless, count what it fetched.
+        session.get(src, dest)
+        if op.isdir(dest):
+            return sum(len(fs) for _, _, fs in os.walk(dest))
+        return int(op.lexists(dest))
+    if names is not None:
+        names = set(names)
+        tree = {p: st for p, st in tree.items() if p in names}
+    files = {p: st for p, st in tree.items() if stat.S_ISREG(st.mode)}
+
+    def local_path(p):
+        return op.join(dest, p) if p else dest
+
+    def remote_path(p):
+        return op.join(src, p) if p else src
+
+    if names is None and not op.lexists(dest):
+        session.get(src, dest)
+        changed = files
+    else:
+        changed = {}
+        for p, st in files.items():
+            try:
+                local_st = os.stat(local_path(p))
+            except OSError:
+                changed[p] = st
+                continue
+            if local_st.st_size != st.size:
+                changed[p] = st
+            elif checksum:
+                local_md5 = Digester(["md5"])(local_path(p))["md5"]
+                if local_md5 != session.digest(remote_path(p), ["md5"])["md5"]:
+                    changed[p] = st
+            elif abs(local_st.st_mtime - st.mtime) > MTIME_TOLERANCE:
+                changed[p] = st
+        for p in sorted(changed):
+            parent = op.dirname(local_path(p))
+            if parent and not op.isdir(parent):
+                os.makedirs(parent)
+            session.get(remote_path(p), local_path(p))
+    for p, st in changed.items():
+        os.utime(local_path(p), (st.mtime, st.mtime))
+    lgr.debug("Fetched %d changed files out of %d from %s",
+              len(changed), len(files), src)
+    return len(changed)
+
+
+def _extract_files(tar, path):
+    """Extract regular files at the top of `tar` under `path`.
+
+    Returns
+    -------
+    set
+        Names of the extracted files.
+    """
+    names = set()
+    for member in tar:
+        if member.isfile() and "/" not in member.name:
+            tar.extract(member, path=path)
+            names.add(member.name)
+    return names
+
+
 class FetchPlainMixin(object):
 
+    # Archive status, stdout, and stderr files of the subjobs as $2 under
+    # the metadata directory $1, compressed with zstd if $3 is "zstd" and
+    # zstd is available, or with gzip.  The compression used is printed.
+    # Outputs the compression used, or "none" if there is nothing to archive.
+    _ARCHIVE_METADATA_SCRIPT = """\
+set -e
+cd "$1"
+archive="$2"
+compression="$3"
+set --
+for f in status.* stdout.* stderr.*; do
+    if [ -f "$f" ]; then
+        set -- "$@" "$f"
+    fi
+done
+if [ $# -eq 0 ]; then
+    echo none
+elif [ "$compression" = zstd ] && command -v zstd >/dev/null 2>&1; then
+    tar -cf "$archive.tar" "$@"
+    zstd -q --rm -o "$archive" "$archive.tar"
+    echo zstd
+else
+    tar -czf "$archive" "$@"
+    echo gzip
+fi
+"""
+
+    def _fetch_metadata_archive(self, metadir_local):
+        """Fetch status, stdout, and stderr files of subjobs in one archive.
+
+        Many subjobs would otherwise take as many `get` calls (i.e., round
+        trips to the resource) per kind of file.
+
+        Parameters
+        ----------
+        metadir_local : str
+            Local directory to extract the files into.
+
+        Returns
+        -------
+        set
+            Names of the extracted files.  Empty if the metadata could not be
+            archived, e.g., because tar is not available on the resource.
+        """
+        tfile = "metadata-{}.tar".format(uuid.uuid4().hex[:8])
+        remote_tfile = op.join(self.meta_directory, tfile)
+        local_tfile = op.join(metadir_local, tfile)
+        try:
+            out, _ = self.session.execute_command(
+                ["sh", "-c", self._ARCHIVE_METADATA_SCRIPT, "sh",
+                 self.meta_directory, tfile,
+                 "zstd" if shutil.which("zstd") else "gzip"])
+            compression = out.strip().splitlines()[-1]
+            if compression == "none":
+                return set()
+            if not op.exists(metadir_local):
+                os.makedirs(metadir_local)
+            self.session.get(remote_tfile, local_tfile)
+        except (CommandError, OSError, IndexError) as exc:
+            lgr.debug("Failed to fetch metadata of %s in an archive, "
+                      "falling back to fetching files: %s",
+                      self.jobid, exc_str(exc))
+            return set()
+        finally:
+            try:
+                self.session.execute_command(
+                    ["rm", "-f", remote_tfile, remote_tfile + ".tar"])
+            except CommandError as exc:
+                lgr.debug("Failed to remove %s: %s",
+                          remote_tfile, exc_str(exc))
+
+        try:
+            if compression == "zstd":
+                proc = subprocess.Popen(["zstd", "-dcq", local_tfile],
+                                        stdout=subprocess.PIPE)
+                with proc.stdout, \
+                        tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                    names = _extract_files(tar, metadir_local)
+                if proc.wait():
+                    raise OSError("zstd failed to decompress {}"
+                                  .format(local_tfile))
+            else:
+                with tarfile.open(local_tfile, mode="r:gz") as tar:
+                    names = _extract_files(tar, metadir_local)
+        except (OSError, tarfile.TarError) as exc:
+            lgr.debug("Failed to extract metadata of %s, "
+                      "falling back to fetching files: %s",
+                      self.jobid, exc_str(exc))
+            return set()
+        finally:
+            os.unlink(local_tfile)
+        lgr.debug("Fetched %d metadata files of %s in a %s archive",
+                  len(names), self.jobid, compression)
+        return names
+
     def fetch(self, on_remote_finish=None):
         """Get outputs from remote.
 
@@ -879,26 +1574,46 @@ class FetchPlainMixin(object):
             (list of ints).
         """
         lgr.info("Fetching results for %s", self.jobid)
-        for o in self.get_outputs():
-            self.session.get(
-                o if op.isabs(o) else op.join(self.working_directory, o),
-                # Make sure directory has trailing slash so that get doesn't
-                # treat it as the file.
-                op.join(self.local_directory, ""))
-
-        for idx in range(len(self.job_spec["_command_array"])):
-            for f in ["status", "stdout", "stderr"]:
+        fetch_mode = self.job_spec.get("fetch_mode") or "full"
+        if fetch_mode not in FETCH_MODES:
+            raise OrchestratorError(
+                "Unknown fetch_mode {!r}; expected one of {}"
+                .format(fetch_mode, ", ".join(FETCH_MODES)))
+        metadir_local = op.join(
+            self.local_directory,
+            op.relpath(self.meta_directory, self.working_directory))
+        metafiles = ["{}.{:d}".format(f, idx)
+                     for idx in range(self.num_subjobs)
+                     for f in ["status", "stdout", "stderr"]]
+
+        if fetch_mode == "full":
+            for o in self.get_outputs():
                 self.session.get(
-                    op.join(self.meta_directory,
-                            "{}.{:d}".format(f, idx)),
-                    op.join(self.local_directory,
-                            op.relpath(self.meta_directory,
-                                       self.working_directory),
-                            ""))
+                    o if op.isabs(o) else op.join(self.working_directory, o),
+                    # Make sure directory has trailing slash so that get
+                    # doesn't treat it as the file.
+                    op.join(self.local_directory, ""))
+            fetched = self._fetch_metadata_archive(metadir_local)
+            for f in metafiles:
+                if f not in fetched:
+                    self.session.get(op.join(self.meta_directory, f),
+                                     op.join(metadir_local, ""))
+        else:
+            checksum = fetch_mode == "checksum"
+            for o in self.get_outputs():
+                src = op.normpath(
+                    o if op.isabs(o) else op.join(self.working_directory, o))
+                _fetch_changed(self.session, src,
+                               op.join(self.local_directory,
+                                       op.basename(src)),
+                               checksum=checksum)
+            _fetch_changed(self.session, self.meta_directory, metadir_local,
+                           checksum=checksum, names=metafiles)
 
         failed = self.get_failed_subjobs()
         self.log_failed(failed)
 
+        self.remove_event_log()
         lgr.info("Outputs fetched. Finished with remote resource '%s'",
                  self.resource.name)
         if on_remote_finish:
@@ -1016,6 +1731,7 @@ class FetchDataladPairMixin(object):
         self.log_failed(failed,
                         func=lambda mdir, _: self.ds.get(path=mdir))
 
+        self.remove_event_log()
         lgr.info("Finished with remote resource '%s'", resource_name)
         if on_remote_finish:
             on_remote_finish(self.resource, failed)
@@ -1051,6 +1767,7 @@ class FetchDataladRunMixin(object):
                 # log_failed() now because it might need the remote resource
                 # and we want to finish up with remote operations.
                 self.log_failed(failed)
+                self.remove_event_log()
 
                 lgr.info("Finished with remote resource '%s'", resource_name)
                 if on_remote_finish:
@@ -1186,6 +1903,7 @@ class DataladNoRemoteOrchestrator(DataladOrchestrator):
     def fetch(self, on_remote_finish=None):
         failed = self.get_failed_subjobs()
         self.log_failed(failed)
+        self.remove_event_log()
         if on_remote_finish:
             on_remote_finish(self.resource, failed)
 
@@ -54,7 +54,7 @@ class Submitter(object, metaclass=abc.ABCMeta):
         """A list the defines the command used to submit the job.
         """
 
-    def submit(self, script, submit_command=None):
+    def submit(self, script, submit_command=None, wrapper=None):
         """Submit `script`.
 
         Parameters
@@ -63,6 +63,10 @@ class Submitter(object, metaclass=abc.ABCMeta):
             Submission script.
         submit_command : list or None, optional
             If specified, use this instead of `.submit_command`.
+        wrapper : list or None, optional
+            Command to run the submission command with, passing it as the
+            trailing arguments.  Its output is taken to be the output of the
+            submission command.
 
         Returns
         -------
@@ -70,7 +74,8 @@ class Submitter(object, metaclass=abc.ABCMeta):
         """
         lgr.info("Submitting %s", script)
         out, _ = self.session.execute_command(
-            (submit_command or self.submit_command) + [script])
+            (wrapper or []) + (submit_command or self.submit_command)
+            + [script])
         subm_id = out.rstrip()
         if subm_id:
             self.submission_id = subm_id
@@ -88,15 +93,87 @@ class Submitter(object, metaclass=abc.ABCMeta):
         None if one could not be determined.
         """
 
-    def follow(self):
+    # Wait for at most $2 seconds until "completed" is appended to the event
+    # log $1, and print it if it was.  Without inotifywait, the log is checked
+    # every second, which is still cheaper than querying the batch system.
+    _WAIT_COMPLETED_SCRIPT = r"""
+log="$1"
+end=$(($(date +%s) + $2))
+while test "$(date +%s)" -lt "$end"
+do
+    if grep -qx completed "$log" 2>/dev/null
+    then
+        echo completed
+        exit 0
+    fi
+    if test -e "$log" && command -v inotifywait >/dev/null 2>&1
+    then
+        inotifywait -qq -t 5 -e modify "$log" >/dev/null 2>&1 || :
+    else
+        sleep 1
+    fi
+done
+"""
+
+    # Maximal number of seconds to wait on the event log before checking that
+    # the submission is still alive.
+    EVENT_WAIT = 60
+
+    def _wait_completed(self, event_log, timeout):
+        """Wait for the completion of the job to be appended to `event_log`.
+
+        Returns
+        -------
+        True if the completion was logged, False if it wasn't within `timeout`
+        seconds, and None if the log couldn't be waited on.
+        """
+        try:
+            out, _ = self.session.execute_command(
+                ["sh", "-c", self._WAIT_COMPLETED_SCRIPT, "sh",
+                 event_log, str(int(timeout))])
+        except CommandError as exc:
+            lgr.debug("Failed to wait on event log %s: %s", event_log, exc)
+            return None
+        return out.strip() == "completed"
+
+    def follow(self, event_log=None):
         """Follow submitted command, exiting once it is finished.
+
+        Parameters
+        ----------
+        event_log : str, optional
+            Path on the resource of the log that the runscript appends
+            completion events to.  If given, wait for the completion to be
+            logged and query the batch system only occasionally (at most
+            every `EVENT_WAIT` seconds once the job has been running for a
+            while) to check that the submission is still alive.  If the log
+            cannot be waited on, fall back to polling the batch system.
         """
+        t0 = time.time()
+        while event_log:
+            # Check on the submission more often early on, so that a job
+            # that died without completing is noticed quickly.
+            completed = self._wait_completed(
+                event_log, min(self.EVENT_WAIT, max(5, time.time() - t0)))
+            if completed is None:
+                break
+            elif completed:
+                lgr.info("Job %s completed", self.submission_id)
+                return
+            our_status, their_status = self.status
+            if our_status != "waiting":
+                if their_status:
+                    lgr.info("Final state of job %s: %s",
+                             self.submission_id, their_status)
+                return
+            lgr.info("Waiting on job %s: %s (%d seconds so far)",
+                     self.submission_id, their_status, time.time() - t0)
+
         # Sleeping and announcement to the user would follow different
         # time interval.  We will not re-announce unless at least 10 seconds or
         # 10% of the overall waiting time has passed. At the same time
         # we will keep increasing sleep time according to the log of the past
         # time but no longer than 10 sec
-        t0 = time.time()
         next_announce = t0
         while True:
             our_status, their_status = self.status
@@ -182,10 +259,11 @@ class CondorSubmitter(Submitter):
         return ["condor_submit", "-terse"]
 
     @borrowdoc(Submitter)
-    def submit(self, script, submit_command=None):
+    def submit(self, script, submit_command=None, wrapper=None):
         # Discard return value, which isn't submission ID for the current
         # condor_submit form.
-        out = super(CondorSubmitter, self).submit(script, submit_command)
+        out = super(CondorSubmitter, self).submit(
+            script, submit_command, wrapper)
         # Output example (3 subjobs): 199.0 - 199.2
         job_id = out.strip().split(" - ")[0].split(".")[0]
         self.submission_id = job_id
@@ -284,8 +362,9 @@ class SlurmSubmitter(Submitter):
         return ["sbatch"]
 
     @borrowdoc(Submitter)
-    def submit(self, script, submit_command=None):
-        out = super(SlurmSubmitter, self).submit(script, submit_command)
+    def submit(self, script, submit_command=None, wrapper=None):
+        out = super(SlurmSubmitter, self).submit(
+            script, submit_command, wrapper)
         # Output example (v19.05): Submitted batch job 5
         job_id = out.strip().split()[-1]
         self.submission_id = job_id
@@ -335,8 +414,9 @@ class LocalSubmitter(Submitter):
         return ["sh"]
 
     @borrowdoc(Submitter)
-    def submit(self, script, submit_command=None):
-        out = super(LocalSubmitter, self).submit(script, submit_command)
+    def submit(self, script, submit_command=None, wrapper=None):
+        out = super(LocalSubmitter, self).submit(
+            script, submit_command, wrapper)
         pid = None
         if out:
             pid = out.strip() or None
@@ -377,8 +457,9 @@ class LSFSubmitter(Submitter):
         return ["/bin/bash"]
 
     @borrowdoc(Submitter)
-    def submit(self, script, submit_command=None):
-        out = super(LSFSubmitter, self).submit(script, submit_command)
+    def submit(self, script, submit_command=None, wrapper=None):
+        out = super(LSFSubmitter, self).submit(
+            script, submit_command, wrapper)
         m = re.search(r'Job <(\d+)> is submitted to queue', out)
         self.submission_id = m.group(1)
         # Although LSF may have submitted the job successfully, it might 
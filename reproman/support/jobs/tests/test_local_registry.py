@@ -41,3 +41,24 @@ def test_local_registry(tmpdir):
     files = lreg.find_job_files()
     assert "jobid0" in files
     assert "jobid1" not in files
+
+
+def test_local_registry_register_many(tmpdir):
+    tmpdir = str(tmpdir)
+    lreg = LocalRegistry(directory=op.join(tmpdir, "registry"))
+
+    lreg.register_many([("jobid0", {"value0": "foo"}),
+                        ("jobid1", {"value0": "bar"})])
+    files = lreg.find_job_files()
+    assert list(files) == ["jobid0", "jobid1"]
+    with open(files["jobid1"]) as yfh:
+        assert yaml.safe_load(yfh) == {"value0": "bar"}
+
+    # Nothing is registered if any ID is taken, within the registry or the
+    # batch.
+    with pytest.raises(ValueError) as exc:
+        lreg.register_many([("jobid2", {}), ("jobid0", {})])
+    assert "jobid0" in str(exc.value)
+    with pytest.raises(ValueError):
+        lreg.register_many([("jobid2", {}), ("jobid2", {})])
+    assert list(lreg.find_job_files()) == ["jobid0", "jobid1"]
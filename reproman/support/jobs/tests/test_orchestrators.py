@@ -7,13 +7,18 @@
 #
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 
+import io
 import logging
 import os
 import os.path as op
+import shutil
+import subprocess
+import tarfile
 import yaml
 
 from unittest.mock import MagicMock
 from unittest.mock import patch
+from unittest.mock import PropertyMock
 import pytest
 
 from reproman.consts import TEST_SSH_DOCKER_DIGEST
@@ -28,6 +33,7 @@ from reproman.tests.fixtures import get_docker_fixture
 from reproman.tests.skip import mark
 from reproman.tests.skip import skipif
 from reproman.tests.utils import create_tree
+from reproman.tests.utils import ok_file_has_content
 
 
 try:
@@ -134,6 +140,407 @@ def test_orc_plain_shell(check_orc_plain, shell, job_spec):
     check_orc_plain(shell, job_spec)
 
 
+@pytest.mark.parametrize("how", ["hardlink", "symlink"])
+def test_orc_plain_input_store(tmpdir, job_spec, shell, how):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n", "same": "content\n"},
+                            "run.sh": "echo hi\n"})
+    os.chmod(op.join(local_dir, "run.sh"), 0o755)
+    job_spec["input_store"] = how
+    job_spec["inputs"] = ["d", "run.sh"]
+
+    def check(orc):
+        for path in "d/in", "d/same":
+            ok_file_has_content(op.join(orc.working_directory, path),
+                                "content\n")
+        runsh = op.join(orc.working_directory, "run.sh")
+        assert os.access(runsh, os.X_OK)
+        assert op.islink(runsh) == (how == "symlink")
+
+    with chpwd(local_dir):
+        orc0 = orcs.PlainOrchestrator(shell, submission_type="local",
+                                      job_spec=dict(job_spec))
+        with patch.object(orc0.session, "put",
+                          wraps=orc0.session.put) as put:
+            orc0.prepare_remote()
+        check(orc0)
+        # The manifest and the two distinct contents.
+        assert put.call_count == 3
+        assert sorted(op.basename(c[0][0]) for c in put.call_args_list
+                      if not c[0][1].endswith("input-manifest")) == \
+            ["in", "run.sh"]
+
+        orc1 = orcs.PlainOrchestrator(shell, submission_type="local",
+                                      job_spec=dict(job_spec))
+        assert orc1.working_directory != orc0.working_directory
+        with patch.object(orc1.session, "put",
+                          wraps=orc1.session.put) as put:
+            orc1.prepare_remote()
+        check(orc1)
+        # Only the manifest is transferred.
+        assert put.call_count == 1
+        assert put.call_args[0][1].endswith("input-manifest")
+        if how == "hardlink":
+            # The stored object and its links in both working directories.
+            assert os.stat(
+                op.join(orc1.working_directory, "d", "in")).st_nlink == 5
+
+
+def test_orc_plain_input_store_invalid(tmpdir, job_spec, shell):
+    job_spec["input_store"] = "copy"
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        with pytest.raises(OrchestratorError) as exc:
+            orc.prepare_remote()
+        assert "input_store" in str(exc.value)
+
+
+@pytest.mark.parametrize("inline", [True, False], ids=["inline", "upload"])
+def test_orc_plain_submit_bundle(tmpdir, job_spec, shell, inline):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n"}})
+    job_spec["submit_mode"] = "bundle"
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        orc.prepare_remote()
+        with patch.object(orc.session, "put",
+                          wraps=orc.session.put) as put, \
+                patch.object(orc.session, "execute_command",
+                             wraps=orc.session.execute_command) as ec, \
+                patch.object(orc, "BUNDLE_INLINE_MAX",
+                             orc.BUNDLE_INLINE_MAX if inline else 0):
+            orc.submit()
+            # A single command unpacked the files and submitted the job, and
+            # another one recorded the submission ID ...
+            assert ec.call_count == 2
+            # ... after uploading the bundle if it was too large.
+            assert put.call_count == (0 if inline else 1)
+        for fname in "runscript", "submit", "command-array", "spec.yaml":
+            assert op.exists(op.join(orc.meta_directory, fname))
+        assert os.access(op.join(orc.meta_directory, "runscript"), os.X_OK)
+        with open(op.join(orc.meta_directory, "idmap")) as f:
+            assert f.read().strip() == orc.submitter.submission_id
+        assert not [f for f in os.listdir(orc.root_directory)
+                    if f.startswith("submit-")]
+        orc.follow()
+        orc.fetch()
+        assert open("out").read() == "content\nmore\n"
+
+
+def test_orc_submit_mode_invalid(tmpdir, job_spec, shell):
+    job_spec["submit_mode"] = "whatever"
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        with pytest.raises(OrchestratorError) as exc:
+            orc.submit()
+        assert "submit_mode" in str(exc.value)
+
+
+
+def test_orc_command_array_index(tmpdir, job_spec, shell):
+    local_dir = str(tmpdir)
+    # Multi-byte and multi-line commands must not throw off the offsets.
+    commands = ["echo 'é' >out0", "printf 'a\\nb\\n' >out1\necho c >>out1",
+                "echo two >out2"]
+    array, index = io.BytesIO(), io.BytesIO()
+    assert orcs._write_command_array(iter(commands), array, index) == 3
+    assert array.getvalue().decode("utf-8").split("\0") == commands
+    assert [len(line) for line in index.getvalue().splitlines(True)] == \
+        [26] * 3
+
+    del job_spec["inputs"], job_spec["outputs"]
+    job_spec["_resolved_command_str"] = "{p[cmd]}"
+    # The records are consumed as the command array is written.
+    job_spec["_resolved_batch_parameters"] = ({"cmd": c} for c in commands)
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        assert orc.num_subjobs == 3
+        orc.prepare_remote()
+        with patch.object(orc.submitter, "submit", return_value=None):
+            orc.submit()
+        # Run subjobs other than the last one, which would wait for all of
+        # them to finish.
+        for subjob in 1, 0:
+            orc.session.execute_command(
+                ["sh", op.join(orc.meta_directory, "runscript"),
+                 str(subjob)])
+    wdir = orc.working_directory
+    ok_file_has_content(op.join(wdir, "out0"), "é\n")
+    ok_file_has_content(op.join(wdir, "out1"), "a\nb\nc\n")
+    assert not op.exists(op.join(wdir, "out2"))
+    # Neither the records nor the commands end up in the job file.
+    d = orc.as_dict()
+    assert d["_num_subjobs"] == 3
+    assert "_resolved_batch_parameters" not in d
+    assert "_command_array" not in d
+    # The local copy of the command array is gone.
+    assert orc._staging_dir is None
+
+
+@pytest.mark.parametrize("submit_mode", ["files", "bundle"])
+def test_orc_plain_batch(tmpdir, job_spec, shell, submit_mode):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"a.in": "a\n", "b.in": "b\n"}})
+    job_spec["inputs"] = ["d/{p[name]}.in"]
+    job_spec["outputs"] = ["{p[name]}.out"]
+    job_spec["_resolved_command_str"] = "cp d/{p[name]}.in {p[name]}.out"
+    job_spec["_resolved_batch_parameters"] = iter(
+        [{"name": "a"}, {"name": "b"}])
+    job_spec["submit_mode"] = submit_mode
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        assert orc.get_inputs() == {"d/a.in", "d/b.in"}
+        assert orc.get_outputs() == {"a.out", "b.out"}
+        orc.prepare_remote()
+
+        def submit(script, submit_command=None, wrapper=None):
+            # Only unpack the bundle, if any.
+            if wrapper:
+                orc.session.execute_command(wrapper + ["true"])
+
+        with patch.object(orc.submitter, "submit", side_effect=submit):
+            orc.submit()
+        for subjob in 0, 1:
+            orc.session.execute_command(
+                ["sh", op.join(orc.meta_directory, "runscript"),
+                 str(subjob)])
+    wdir = orc.working_directory
+    ok_file_has_content(op.join(wdir, "a.out"), "a\n")
+    ok_file_has_content(op.join(wdir, "b.out"), "b\n")
+
+
+def test_orc_plain_batch_empty(tmpdir, job_spec, shell):
+    job_spec["_resolved_batch_parameters"] = iter([])
+    with chpwd(str(tmpdir)):
+        with pytest.raises(OrchestratorError):
+            orcs.PlainOrchestrator(shell, submission_type="local",
+                                   job_spec=job_spec)
+
+
+def test_orc_follow_event_log(tmpdir, job_spec, shell):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n"}})
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        orc.prepare_remote()
+        orc.submit()
+        with patch.object(type(orc.submitter), "status",
+                          new_callable=PropertyMock,
+                          return_value=("waiting", "running")) as status:
+            orc.follow()
+            # The completion was picked up from the event log, without
+            # polling the submitter.
+            assert not status.called
+        with open(orc.event_log) as f:
+            assert f.read() == "0 succeeded\ncompleted\n"
+
+
+def test_orc_follow_event_log_fallback(tmpdir, job_spec, shell):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n"}})
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        orc.prepare_remote()
+        orc.submit()
+        with patch.object(orc.submitter, "_WAIT_COMPLETED_SCRIPT",
+                          "exit 1"), \
+                swallow_logs(new_level=logging.DEBUG) as log:
+            orc.follow()
+            assert "Failed to wait on event log" in log.out
+        assert orc.has_completed
+
+
+@pytest.mark.parametrize("fetch_mode", ["delta", "checksum"])
+def test_orc_plain_fetch_changed(tmpdir, job_spec, shell, fetch_mode):
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n"}})
+    job_spec["fetch_mode"] = fetch_mode
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        orc.prepare_remote()
+        orc.submit()
+        orc.follow()
+        orc.fetch()
+        assert open("out").read() == "content\nmore\n"
+        metadir_local = op.relpath(orc.meta_directory, orc.working_directory)
+        for fname in "status", "stderr", "stdout":
+            assert op.exists(op.join(metadir_local, fname + ".0"))
+
+        with patch.object(orc.session, "get",
+                          wraps=orc.session.get) as get:
+            # Nothing changed, so nothing is fetched again ...
+            orc.fetch()
+            assert not get.called
+            # ... but changed outputs are.
+            with open(op.join(orc.working_directory, "out"), "a") as f:
+                f.write("changed\n")
+            orc.fetch()
+            assert get.call_count == 1
+        assert open("out").read() == "content\nmore\nchanged\n"
+
+
+def test_fetch_changed_subsecond_mtime(tmpdir, shell):
+    src = str(tmpdir.join("src"))
+    dest = str(tmpdir.join("dest"))
+    create_tree(src, {"f": "a\n"})
+    os.utime(op.join(src, "f"), (1000.25, 1000.25))
+    session = shell.get_session()
+    assert orcs._fetch_changed(session, src, dest) == 1
+    assert orcs._fetch_changed(session, src, dest) == 0
+    # Same size, modified within the same second
+    create_tree(src, {"f": "b\n"})
+    os.utime(op.join(src, "f"), (1000.75, 1000.75))
+    assert orcs._fetch_changed(session, src, dest) == 1
+    with open(op.join(dest, "f")) as f:
+        assert f.read() == "b\n"
+
+
+def test_fetch_changed_no_stat(tmpdir, shell):
+    src = str(tmpdir.join("src"))
+    dest = str(tmpdir.join("dest"))
+    create_tree(src, {"f": "a\n", "d": {"g": "b\n"}})
+    session = shell.get_session()
+    # The session gets what it cannot stat the same way as without skipping.
+    with patch.object(session, "stat_tree", return_value={}):
+        assert orcs._fetch_changed(session, src, dest) == 2
+    assert op.exists(op.join(dest, "d", "g"))
+
+
+@pytest.mark.parametrize("how", ["zstd", "gzip", "files"])
+def test_orc_plain_fetch_metadata(tmpdir, job_spec, shell, how):
+    if how == "zstd" and not shutil.which("zstd"):
+        pytest.skip("zstd is not available")
+    local_dir = str(tmpdir)
+    create_tree(local_dir, {"d": {"in": "content\n"}})
+    # Plain orchestrators do not expand batch parameters.
+    for key in "_resolved_command_str", "inputs", "outputs":
+        del job_spec[key]
+    job_spec["_command_array"] = ["echo 0 >out", "echo 1", "echo 2"]
+    job_spec["_inputs_array"] = [[], [], []]
+    job_spec["_outputs_array"] = [["out"], [], []]
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        orc.prepare_remote()
+        # Running several subjobs locally needs GNU parallel, so fake their
+        # results.
+        create_tree(orc.working_directory, {"out": "0\n"})
+        create_tree(orc.meta_directory,
+                    {"{}.{}".format(f, i): "{}\n".format(i)
+                     for f in ["status", "stderr", "stdout"]
+                     for i in range(3)})
+        with patch.object(orc.session, "get", wraps=orc.session.get) as get, \
+                patch.object(orcs.shutil, "which",
+                             return_value="zstd" if how == "zstd" else None), \
+                patch.object(orcs.FetchPlainMixin, "_ARCHIVE_METADATA_SCRIPT",
+                             "exit 1" if how == "files"
+                             else orcs.FetchPlainMixin._ARCHIVE_METADATA_SCRIPT), \
+                swallow_logs(new_level=logging.DEBUG) as log:
+            orc.fetch()
+            if how != "files":
+                assert "in a {} archive".format(how) in log.out
+        # The output and either the archive or 9 metadata files.
+        assert get.call_count == (10 if how == "files" else 2)
+        metadir_local = op.relpath(orc.meta_directory, orc.working_directory)
+        assert sorted(f for f in os.listdir(metadir_local)
+                      if not f.startswith("metadata-")) == \
+            ["{}.{}".format(f, i)
+             for f in ["status", "stderr", "stdout"] for i in range(3)]
+        with open(op.join(metadir_local, "stdout.2")) as f:
+            assert f.read() == "2\n"
+        # Archives are cleaned up.
+        assert not [f for f in os.listdir(metadir_local)
+                    if f.startswith("metadata-")]
+        assert not [f for f in os.listdir(orc.meta_directory)
+                    if f.startswith("metadata-")]
+
+
+@pytest.mark.parametrize("compression", ["zstd", "gzip"])
+def test_orc_plain_archive_metadata_partial(tmpdir, shell, compression):
+    if compression == "zstd" and not shutil.which("zstd"):
+        pytest.skip("zstd is not available")
+    metadir = str(tmpdir)
+    script = orcs.FetchPlainMixin._ARCHIVE_METADATA_SCRIPT
+    out, _ = shell.get_session().execute_command(
+        ["sh", "-c", script, "sh", metadir, "archive", compression])
+    assert out.strip() == "none"
+    assert not os.listdir(metadir)
+
+    # No stderr files yet
+    create_tree(metadir, {"status.0": "succeeded\n", "stdout.0": "0\n"})
+    out, _ = shell.get_session().execute_command(
+        ["sh", "-c", script, "sh", metadir, "archive", compression])
+    assert out.strip() == compression
+    assert sorted(os.listdir(metadir)) == ["archive", "status.0", "stdout.0"]
+    tfile = op.join(metadir, "archive")
+    if compression == "zstd":
+        out = subprocess.check_output(["zstd", "-dcq", tfile])
+        with tarfile.open(fileobj=io.BytesIO(out)) as tar:
+            names = tar.getnames()
+    else:
+        with tarfile.open(tfile, mode="r:gz") as tar:
+            names = tar.getnames()
+    assert sorted(names) == ["status.0", "stdout.0"]
+
+
+def test_orc_status_summary(tmpdir, job_spec, shell):
+    local_dir = str(tmpdir)
+    for key in "_resolved_command_str", "inputs", "outputs":
+        del job_spec[key]
+    job_spec["_command_array"] = ["true", "false", "sleep 100", "true"]
+    with chpwd(local_dir):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        orc.prepare_remote()
+        summary = orc.get_status_summary()
+        assert summary.statuses == ["unknown"] * 4
+        assert summary.summary == "unknown"
+        assert not summary.completed
+
+        create_tree(orc.meta_directory,
+                    {"status.0": "succeeded\n",
+                     "status.1": "failed: 1\n",
+                     "status.2": "running\n",
+                     "failed": {"1": ""}})
+        with patch.object(orc.session, "execute_command",
+                          wraps=orc.session.execute_command) as ec:
+            summary = orc.get_status_summary()
+            assert ec.call_count == 1
+        assert summary.statuses == ["succeeded", "failed: 1", "running",
+                                    "unknown"]
+        assert summary.failed == [1]
+        assert dict(summary.counts) == {"submitted": 0, "running": 1,
+                                        "succeeded": 1, "failed": 1,
+                                        "unknown": 1}
+        assert summary.summary == "1 running, 1 succeeded, 1 failed, 1 unknown"
+        assert not summary.completed
+
+        create_tree(orc.meta_directory,
+                    {"status.2": "succeeded\n", "status.3": "succeeded\n"})
+        create_tree(orc.root_directory, {"completed": {orc.jobid: ""}})
+        summary = orc.get_status_summary()
+        assert summary.summary == "3 succeeded, 1 failed"
+        assert summary.completed
+
+
+def test_orc_plain_fetch_mode_invalid(tmpdir, job_spec, shell):
+    job_spec["fetch_mode"] = "whatever"
+    job_spec["_command_array"] = ["true"]
+    with chpwd(str(tmpdir)):
+        orc = orcs.PlainOrchestrator(shell, submission_type="local",
+                                     job_spec=job_spec)
+        with pytest.raises(OrchestratorError):
+            orc.fetch()
+
+
 def test_orc_resurrection_invalid_job_spec(check_orc_plain, shell):
     with pytest.raises(OrchestratorError):
         orcs.PlainOrchestrator(shell, submission_type="local",
@@ -390,6 +797,7 @@ def test_orc_datalad_pair_run_multiple_same_point(job_spec, dataset, ssh):
         assert not op.exists(op.join(orc0.meta_directory, "status.0"))
         # but we can still get it.
         assert orc0.status == "succeeded"
+        assert orc0.get_status_summary().summary == "succeeded"
 
         orc0.fetch()
         orc1.fetch()
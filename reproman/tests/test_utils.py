@@ -52,6 +52,9 @@ from ..utils import parse_semantic_version
 from ..utils import merge_dicts
 from ..utils import write_update
 from ..utils import pycache_source
+from ..utils import ChunksReader
+from ..utils import extract_tar_chunks
+from ..utils import iter_tar_chunks
 
 from .utils import ok_, eq_, assert_false, assert_equal, assert_true
 
@@ -60,6 +63,7 @@ from ..utils import is_binarystring
 from ..utils import CommandError
 from .utils import assert_cwd_unchanged
 from .utils import assert_in
+from .utils import create_tree
 from .utils import ok_file_has_content
 from .utils import with_tree
 from .utils import with_tempfile
@@ -531,6 +535,27 @@ def test_pathroot():
     assert proot("/root/x/child_root") == "/root/x/child_root"
 
 
+def test_pathroot_prime():
+    def pred(path):
+        raise AssertionError("predicate should not be called")
+
+    calls = []
+
+    def pred_many(paths):
+        calls.append(paths)
+        return {p: p.endswith("root") for p in paths}
+
+    proot = PathRoot(pred, pred_many)
+    proot.prime(["/root/a", "/root/x/child_root/b"])
+    assert calls == [["/root", "/root/a", "/root/x", "/root/x/child_root",
+                      "/root/x/child_root/b"]]
+    assert proot("/root/a") == "/root"
+    assert proot("/root/x/child_root/b") == "/root/x/child_root"
+    # Already known paths are not queried again.
+    proot.prime(["/root/a"])
+    assert len(calls) == 1
+
+
 def test_is_subpath(tmpdir):
     tmpdir = str(tmpdir)
 
@@ -628,6 +653,40 @@ def test_write_update(tmpdir):
     ok_file_has_content(foo, "rewrite")
 
 
+def test_chunks_reader():
+    reader = ChunksReader([b"ab", b"", b"cde", b"f"])
+    assert reader.read(1) == b"a"
+    assert reader.read(3) == b"b"
+    assert reader.read() == b"cdef"
+    assert reader.read() == b""
+
+
+def test_tar_chunks_roundtrip(tmpdir):
+    path = str(tmpdir)
+    create_tree(op.join(path, "src"),
+                {"f": "content" * 1000, "d": {"sub": "sub"}, "empty": {}})
+    chunks = iter_tar_chunks(op.join(path, "src"), arcname="dest",
+                             chunk_size=100)
+    extract_tar_chunks(chunks, op.join(path, "out"))
+    ok_file_has_content(op.join(path, "out", "dest", "f"), "content" * 1000)
+    ok_file_has_content(op.join(path, "out", "dest", "d", "sub"), "sub")
+    assert op.isdir(op.join(path, "out", "dest", "empty"))
+
+
+def test_iter_tar_chunks_abandoned(tmpdir):
+    path = str(tmpdir)
+    create_tree(path, {"f": "content" * 100000})
+    chunks = iter_tar_chunks(op.join(path, "f"), chunk_size=10)
+    next(chunks)
+    # The writer thread does not block the consumer going away.
+    chunks.close()
+
+
+def test_iter_tar_chunks_missing(tmpdir):
+    with pytest.raises(OSError):
+        list(iter_tar_chunks(op.join(str(tmpdir), "missing")))
+
+
 @pytest.mark.parametrize(
     "case",
     [{"label": "full-py2",
@@ -28,8 +28,12 @@ import tempfile
 import platform
 import gc
 import glob
+import io
+import tarfile
+import threading
 
 import attr
+from functools import partial
 from functools import wraps
 from time import sleep
 import inspect
@@ -1301,11 +1305,34 @@ class PathRoot(object):
     predicate : callable
         A callable that will be passed a path and should return true
         if that path should be considered a root.
+    predicate_many : callable, optional
+        A callable that will be passed a list of paths and should return a
+        dict mapping each of them to the value `predicate` would return.  It
+        is used by `prime` to evaluate many candidates at once.
     """
-    def __init__(self, predicate):
+    def __init__(self, predicate, predicate_many=None):
         self._pred = predicate
+        self._pred_many = predicate_many
+        self._pred_results = {}  # path -> predicate value, filled by prime()
         self._cache = {}  # path -> root
 
+    def prime(self, paths):
+        """Evaluate the predicate for all candidate roots of `paths` at once.
+
+        This is a no-op unless `predicate_many` was specified.
+
+        Parameters
+        ----------
+        paths : iterable of str
+        """
+        if self._pred_many is None:
+            return
+        candidates = {pth for path in paths for pth in self._walk_up(path)
+                      if pth not in self._cache
+                      and pth not in self._pred_results}
+        if candidates:
+            self._pred_results.update(self._pred_many(sorted(candidates)))
+
     def __call__(self, path):
         """Find root of `path` based on `predicate`.
 
@@ -1327,7 +1354,10 @@ class PathRoot(object):
 
             to_cache.append(pth)
 
-            if self._pred(pth):
+            is_root = self._pred_results.get(pth)
+            if is_root is None:
+                is_root = self._pred(pth)
+            if is_root:
                 root = pth
                 break
 
@@ -1511,4 +1541,84 @@ def pycache_source(path):
     return pyfile
 
 
+class ChunksReader(io.RawIOBase):
+    """Read-only binary stream over an iterable of bytes chunks
+
+    It allows to consume streamed content (e.g., by `tarfile`) without
+    holding more than a chunk of it in memory.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._chunk:
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+
+def iter_tar_chunks(path, arcname=None, chunk_size=1 << 21):
+    """Generate a tar archive of `path` in chunks, with bounded memory
+
+    The archive is written to a pipe by a separate thread while it is
+    consumed.
+
+    Parameters
+    ----------
+    path : str
+        File or directory to archive (recursively).
+    arcname : str, optional
+        Name of `path` within the archive.
+    chunk_size : int, optional
+
+    Yields
+    ------
+    bytes
+    """
+    rfd, wfd = os.pipe()
+    errors = []
+
+    def write():
+        try:
+            with os.fdopen(wfd, "wb") as f, \
+                    tarfile.open(fileobj=f, mode="w|") as tar:
+                tar.add(path, arcname=arcname)
+        except Exception as exc:
+            # e.g., BrokenPipeError if the consumer went away
+            errors.append(exc)
+
+    writer = threading.Thread(target=write, name="tar writer", daemon=True)
+    writer.start()
+    try:
+        with os.fdopen(rfd, "rb") as f:
+            for chunk in iter(partial(f.read, chunk_size), b""):
+                yield chunk
+    finally:
+        # The read end is closed by now, so the writer cannot block.
+        writer.join()
+    if errors:
+        raise errors[0]
+
+
+def extract_tar_chunks(chunks, path):
+    """Extract a tar archive, given as an iterable of chunks, under `path`
+
+    The archive is extracted as the chunks arrive, so it does not need to
+    fit in memory.
+    """
+    with tarfile.open(fileobj=io.BufferedReader(ChunksReader(chunks)),
+                      mode="r|*") as tar:
+        tar.extractall(path=path)
+
+
 lgr.log(5, "Done importing reproman.utils")